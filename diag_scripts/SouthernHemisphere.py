@@ -125,12 +125,12 @@ import os
 import pdb
 import sys
 import numpy as np
-from scipy.interpolate import griddata
 from scipy.interpolate import interp1d
 
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+import regrid
 from auxiliary import info
 
 # Force matplotlib to not use any Xwindows backend.
@@ -409,38 +409,8 @@ def get_contour_config(modelconfig, config_file, area_key, datakey):
 
 def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
     """Interpolates the data values to a specific lat/lon grid.
-    This function should only be used for 2D arrays (no time indeces etc.)"""
-
-    # First check if the coordinates are the same, otherwise interpolate
-    if (np.array_equal(lats, target_lats) and np.array_equal(lons, target_lons)):
-        return data
-
-    else:
-        grid_lats, grid_lons = np.meshgrid(target_lats, target_lons)
-        datapoints = np.zeros((len(lats) * len(lons), 2))
-        datavalues = data.reshape(-1)
-        i = 0
-        for lat in lats:
-            datapoints[i:i + len(lons), 0] = lat
-            datapoints[i:i + len(lons), 1] = lons
-            i += len(lons)
-
-        # Calculate the values on the new grid
-        gridvalues = griddata(datapoints,
-                              datavalues,
-                              (grid_lats, grid_lons),
-                              method='cubic')
-        nearest = griddata(datapoints,
-                           datavalues,
-                           (grid_lats, grid_lons),
-                           method='nearest')
-
-        # In some cases griddata cannot export values on the border of the grid
-        for i in xrange(gridvalues.shape[0]):
-            for j in xrange(gridvalues.shape[1]):
-                if (np.isnan(gridvalues[i, j])):
-                    gridvalues[i, j] = nearest[i, j]
-        return gridvalues.T
+    The interpolation weights are cached per pair of grids, see regrid.py."""
+    return regrid.regrid(data, lats, lons, target_lats, target_lons)
 
 
 def process_mean_plots(E, modelconfig, datakey, orientation, mean_name):
@@ -122,12 +122,13 @@ import ConfigParser
 import sys
 import os
 import numpy as np
-from scipy.interpolate import griddata
 from scipy.interpolate import interp1d
 
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+import regrid
+import binning
 from auxiliary import info
 
 # Force matplotlib to not use any Xwindows backend.
@@ -186,7 +187,15 @@ def calculate_scatterplot_values(modelconfig,
                                  cloud,
                                  radiation,
                                  bins=''):
-    """Calculate cloud vs radiation scatterplot values from input."""
+    """Calculate cloud vs radiation scatterplot values from input.
+
+    cloud and radiation are either single arrays or lists of arrays (e.g.,
+    observations and models for all seasons), which are binned at once
+    with the same bins. The values are then arrays (member, bin)."""
+    stacked = isinstance(cloud, list)
+    if not stacked:
+        cloud = [cloud]
+        radiation = [radiation]
     # Check if limits are already defined
     if (len(bins) > 0):
         nbins = len(bins) - 1
@@ -197,81 +206,34 @@ def calculate_scatterplot_values(modelconfig,
             cl_min = 0
             cl_max = 100
         else:
-            cl_min = cloud.min()
-            cl_max = cloud.max()
+            cl_min = cloud[0].min()
+            cl_max = cloud[0].max()
         if not (cl_min > cl_max):
             cl_min = 0
             cl_max = 100
         nbins = 20
         bins = np.linspace(cl_min, cl_max, nbins + 1)
-    # Mask unwanted values (open ended at end limits)
-    cl_fraction = np.zeros(nbins)
-    cl_values = np.zeros(nbins)
-    rd_values = np.zeros(nbins)
-    for i in xrange(nbins):
-        # Open ended for end points
-        if (i == 0):
-            cl_masked = np.ma.masked_greater(cloud, bins[i + 1])
-        elif (i == nbins - 1):
-            cl_masked = np.ma.masked_less(cloud, bins[i])
-        else:
-            cl_masked = np.ma.masked_outside(cloud, bins[i], bins[i + 1])
-        rd_masked = np.ma.masked_array(radiation, cl_masked.mask)
-        cl_values[i] = cl_masked.mean()
-        rd_values[i] = rd_masked.mean()
-        cl_fraction[i] = np.ma.count(cl_masked)
-    cl_sum = cl_fraction.sum()
-    cl_fraction[:] = cl_fraction[:] / cl_sum
+    # Bins are open ended at end limits
+    cl_fraction, cl_values, rd_values = binning.binned_means(cloud,
+                                                             radiation,
+                                                             bins)
+    cl_sum = cl_fraction.sum(axis=1)[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cl_fraction = cl_fraction / cl_sum
+    if not stacked:
+        return bins, cl_fraction[0], cl_values[0], rd_values[0]
     return bins, cl_fraction, cl_values, rd_values
 
 
 def interpolate_3d(data, lats, lons, target_lats, target_lons):
     """Interpolate time/lat/lon grid to specific lat/lon coordinates."""
-    new_data = np.zeros((data.shape[0], len(target_lats), len(target_lons)))
-    for time in xrange(data.shape[0]):
-        new_data[time] = interpolate_data_grid(data[time, :, :],
-                                               lats,
-                                               lons,
-                                               target_lats,
-                                               target_lons)
-    return new_data
+    return regrid.regrid(data, lats, lons, target_lats, target_lons)
 
 
 def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
     """Interpolates the data values to a specific lat/lon grid.
-    This function should only be used for 2D arrays (no time indeces etc.)"""
-
-    # First check if the coordinates are the same, otherwise interpolate
-    if (np.array_equal(lats, target_lats)
-        and np.array_equal(lons, target_lons)):
-        return data
-
-    else:
-        grid_lats, grid_lons = np.meshgrid(target_lats, target_lons)
-        datapoints = np.zeros((len(lats) * len(lons), 2))
-        datavalues = data.reshape(-1)
-        i = 0
-        for lat in lats:
-            datapoints[i:i + len(lons), 0] = lat
-            datapoints[i:i + len(lons), 1] = lons
-            i += len(lons)
-
-        # Calculate the values on the new grid
-        gridvalues = griddata(datapoints,
-                              datavalues,
-                              (grid_lats, grid_lons),
-                              method='cubic')
-        nearest = griddata(datapoints,
-                           datavalues,
-                           (grid_lats, grid_lons),
-                           method='nearest')
-
-        # In some cases griddata cannot export values on the border of the grid
-        for i in xrange(gridvalues.shape[0]):
-            for j in xrange(gridvalues.shape[1]):
-                if (np.isnan(gridvalues[i, j])):
-                    gridvalues[i, j] = nearest[i, j]
-        return gridvalues.T
+    The interpolation weights are cached per pair of grids, see regrid.py."""
+    return regrid.regrid(data, lats, lons, target_lats, target_lons)
 
 
 def process_scatter(E, modelconfig):
@@ -336,6 +298,21 @@ def process_scatter(E, modelconfig):
                                      rd_lons,
                                      cl_lats,
                                      cl_lons)
+            # Seasonal values of the observations and of all models
+            cl_stack = []
+            rd_stack = []
+            for season in seasons:
+                # Mask unwanted seasonal values
+                cl_stack.append(E.extract_seasonal_mean_values(modelconfig,
+                                                               cl_data,
+                                                               experiment,
+                                                               season,
+                                                               monthly=True))
+                rd_stack.append(E.extract_seasonal_mean_values(modelconfig,
+                                                               rd_data,
+                                                               experiment,
+                                                               season,
+                                                               monthly=True))
             for model in rd_models:
                 # Get model and area specific values
                 cl_datafile = nc.Dataset(cl_models[model], 'r')
@@ -365,7 +342,28 @@ def process_scatter(E, modelconfig):
                                           mrd_lons,
                                           mcl_lats,
                                           mcl_lons)
-
+                for season in seasons:
+                    cl_stack.append(E.extract_seasonal_mean_values(modelconfig,
+                                                                   mcl_data,
+                                                                   experiment,
+                                                                   season,
+                                                                   monthly=True))
+                    rd_stack.append(E.extract_seasonal_mean_values(modelconfig,
+                                                                   mrd_data,
+                                                                   experiment,
+                                                                   season,
+                                                                   monthly=True))
+
+            # Calculate scatterplot values of all seasons and models at once
+            bins, cl_fraction, cl_values, rd_values = \
+                calculate_scatterplot_values(modelconfig,
+                                             area,
+                                             cl_key,
+                                             cl_stack,
+                                             rd_stack)
+            centers = (bins[1:] + bins[:-1]) / 2.
+
+            for index, model in enumerate(rd_models):
                 # One plot for all seasons
                 plt.clf()
                 fig, axs = plt.subplots(2, (len(seasons)),
@@ -377,42 +375,15 @@ def process_scatter(E, modelconfig):
                 fig.subplots_adjust(wspace=0.4)
                 for season in seasons:
                     col = seasons.index(season)
-                    # Mask unwanted seasonal values
-                    obs_cl = E.extract_seasonal_mean_values(modelconfig,
-                                                            cl_data,
-                                                            experiment,
-                                                            season,
-                                                            monthly=True)
-                    obs_rd = E.extract_seasonal_mean_values(modelconfig,
-                                                            rd_data,
-                                                            experiment,
-                                                            season,
-                                                            monthly=True)
-                    data_cl = E.extract_seasonal_mean_values(modelconfig,
-                                                             mcl_data,
-                                                             experiment,
-                                                             season,
-                                                             monthly=True)
-                    data_rd = E.extract_seasonal_mean_values(modelconfig,
-                                                             mrd_data,
-                                                             experiment,
-                                                             season,
-                                                             monthly=True)
-                    # Calculate scatterplot values
-                    obs_out = calculate_scatterplot_values(modelconfig,
-                                                           area,
-                                                           cl_key,
-                                                           obs_cl,
-                                                           obs_rd)
-                    model_out = calculate_scatterplot_values(modelconfig,
-                                                             area,
-                                                             cl_key,
-                                                             data_cl,
-                                                             data_rd,
-                                                             bins=obs_out[0])
-                    centers = np.zeros(len(obs_out[0]) - 1)
-                    for i in xrange(len(centers)):
-                        centers[i] = (obs_out[0][i + 1] + obs_out[0][i]) / 2.
+                    member = (index + 1) * len(seasons) + col
+                    obs_out = (bins,
+                               cl_fraction[col],
+                               cl_values[col],
+                               rd_values[col])
+                    model_out = (bins,
+                                 cl_fraction[member],
+                                 cl_values[member],
+                                 rd_values[member])
 
                     # Plot and make it pretty
                     modelcolor, dashes, width = E.get_model_plot_style(model)
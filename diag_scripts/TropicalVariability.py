@@ -162,6 +162,8 @@ import pdb
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+import intermediate_store
+import region_reader
 from auxiliary import info
 
 # Force matplotlib to not use any Xwindows backend.
@@ -174,6 +176,14 @@ import matplotlib.pyplot as plt
 # Python extensions and netcdf handler
 import netCDF4 as nc
 
+# The experiments (config sections) with areas and their plot switches
+EXPERIMENTS = {'scatter': 'plot_scatter',
+               'zonal_means': 'plot_zonal_means',
+               'equatorial': 'plot_equatorial'}
+
+# Reduced fields computed so far, keyed by the file and the variable
+_reduced_fields = {}
+
 def main(project_info):
     """Diagnostics and plotting script for Tropical Variability.
     We use ts as a proxy for Sea Surface Temperature. """
@@ -223,6 +233,90 @@ def main(project_info):
 # All callable functions below are in alphabetical order
 # E. style functions are in the general python file esmval_lib.py
 
+def get_reduced_fields(E, modelconfig, datakey, filename):
+    """Returns the reduced fields of a variable for all configured areas.
+
+    The band of the file covering all areas is read once, in blocks of time
+    steps, and the (masked) values of each area of the enabled experiments
+    are reduced to sums and counts over the area for each time step and to
+    the means over the time steps and longitudes (zonal means) and over the
+    time steps and latitudes (equatorial means). The result is cached per file and variable.
+
+    The reduced fields are a dictionary with the units of the variable
+    ('units') and for each (experiment, area) a dictionary with the
+    coordinates of the area ('lats', 'lons') and the arrays 'area_sums',
+    'area_counts' (time), 'zonal_means' (lat) and 'equatorial_means' (lon).
+    """
+    key = (filename, datakey)
+    if key in _reduced_fields:
+        return _reduced_fields[key]
+
+    datafile = nc.Dataset(filename, 'r')
+    variable = datafile.variables[datakey]
+    reduced = {'units': variable.units}
+    regions = {}
+    sums = {}
+    for experiment in EXPERIMENTS:
+        if not modelconfig.getboolean('general', EXPERIMENTS[experiment]):
+            continue
+        for area in modelconfig.get(experiment, 'areas').split():
+            lats, lons, lat_pieces, lon_pieces = \
+                E.get_model_region(modelconfig, experiment, area, datafile)
+            regions[experiment, area] = (lat_pieces, lon_pieces)
+            reduced[experiment, area] = {'lats': lats,
+                                         'lons': lons,
+                                         'area_sums': [],
+                                         'area_counts': []}
+            sums[experiment, area] = [np.zeros(len(lats)), np.zeros(len(lats)),
+                                      np.zeros(len(lons)), np.zeros(len(lons))]
+
+    if (len(regions) == 0):
+        datafile.close()
+        _reduced_fields[key] = reduced
+        return reduced
+
+    # Only the band of latitudes/longitudes covering all areas is read
+    region_keys = regions.keys()
+    lat_band, lat_pieces = region_reader.bounding_piece(
+        [regions[region][0] for region in region_keys], variable.shape[1])
+    lon_band, lon_pieces = region_reader.bounding_piece(
+        [regions[region][1] for region in region_keys], variable.shape[2])
+    for region, region_lat_pieces, region_lon_pieces in \
+            zip(region_keys, lat_pieces, lon_pieces):
+        regions[region] = (region_lat_pieces, region_lon_pieces)
+
+    for time_slice, data in region_reader.iter_region(variable,
+                                                      [lat_band],
+                                                      [lon_band],
+                                                      120):
+        data = E.mask_configured_values(modelconfig, data)
+        for region in regions:
+            values = region_reader.take_region(data, *regions[region])
+            valid = ~np.ma.getmaskarray(values)
+            values = np.where(valid, np.ma.getdata(values), 0.)
+            values = values.astype(np.float64)
+            fields = reduced[region]
+            fields['area_sums'].append(values.sum(axis=(1, 2)))
+            fields['area_counts'].append(valid.sum(axis=(1, 2)))
+            sums[region][0] += values.sum(axis=(0, 2))
+            sums[region][1] += valid.sum(axis=(0, 2))
+            sums[region][2] += values.sum(axis=(0, 1))
+            sums[region][3] += valid.sum(axis=(0, 1))
+    datafile.close()
+
+    for region in regions:
+        fields = reduced[region]
+        fields['area_sums'] = np.concatenate(fields['area_sums'])
+        fields['area_counts'] = np.concatenate(fields['area_counts'])
+        lat_sums, lat_counts, lon_sums, lon_counts = sums[region]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fields['zonal_means'] = lat_sums / lat_counts
+            fields['equatorial_means'] = lon_sums / lon_counts
+
+    _reduced_fields[key] = reduced
+    return reduced
+
+
 def get_scatterplot_limits(modelconfig, config_file, area, season):
     """Returns area specific seasonal limits for scatterplotting. """
     area_key = 'scatter_' + area
@@ -254,67 +348,68 @@ def get_scatterplot_limits(modelconfig, config_file, area, season):
     return limits
 
 
-def get_scatterplot_values(modelconfig, season, data):
-    """Extracts the values to plot from all model specific values. """
+def get_scatterplot_values(modelconfig, season, fields):
+    """Extracts the values to plot from the area sums of the reduced fields
+    of a model (see get_reduced_fields). """
     season_key = 'scatter_season_' + season
 
     # We transform monthly values to yearly means or just take the monthly ones
+    years = len(fields['area_sums']) / 12
+    sums = fields['area_sums'][:12 * years].reshape(years, 12)
+    counts = fields['area_counts'][:12 * years].reshape(years, 12)
     if (season == 'annual'):
-        values = np.zeros(len(data) / 12)
-        for year in xrange(len(values)):
-            values[year] = np.mean(data[12 * year: 12 * (year + 1), :, :])
+        sums = sums.sum(axis=1)
+        counts = counts.sum(axis=1)
     else:
         season_months = modelconfig.get(season_key, 'season_months').split()
-        months = len(season_months)
-        values = np.zeros(months * len(data) / 12)
-        for year in xrange(len(data) / 12):
-            cm = 0
-            for month in season_months:
-                month_loc = int(month) - 1
-                values[year * months + cm]\
-                    = np.mean(data[year * 12 + month_loc, :, :])
-                cm += 1
-    return values
+        months = [int(month) - 1 for month in season_months]
+        sums = sums[:, months].ravel()
+        counts = counts[:, months].ravel()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts.astype(np.float64)
 
 
 def process_equatorial_means(E, modelconfig):
     """This script preprocessess equatorial means for precipitation and
-    temperature - the data is extracted and saved to a temporary npy-file.
-    Plotting and the wind processing are in TropicalVariability_EQ.py. """
+    temperature - the data is extracted and saved to the intermediate store
+    (see intermediate_store.py). Entries computed from the same inputs in a
+    previous run are reused. Plotting and the wind processing are in
+    TropicalVariability_EQ.py. """
     experiment = 'equatorial'
     datakeys = E.get_currVars()
-    work_dir = E.get_work_dir()
+    store_dir = E.get_intermediate_dir()
     areas = modelconfig.get(experiment, 'areas').split()
 
     # This should be redundant (no more than one equatorial area) but we'll do
     # the looping similarly to other parts of the code
     for area in areas:
         area_key = experiment + '_' + area
+        settings = {'area': dict(modelconfig.items(area_key)),
+                    'general': dict(modelconfig.items('general'))}
         for datakey in datakeys:
-            # create a python array file for each area, model  and datakey
+            # create an entry for each area, model and datakey
             # overwrite if exists
-            base_name = work_dir\
-                        + 'TropicalVariability_'\
+            base_name = 'TropicalVariability_'\
                         + area_key + '_'\
                         + datakey\
                         + '_model_'
             models = E.get_clim_model_filenames(variable=datakey)
             for model in models:
-                out_file = base_name + model + '.npy'
-                datafile = nc.Dataset(models[model], 'r')
                 # A-laue_ax+
                 E.add_to_filelist(models[model])
                 # A-laue_ax-
-                lats, lons, model_data = E.get_model_data(modelconfig,
-                                                          experiment,
-                                                          area,
-                                                          datakey,
-                                                          datafile)
-                datafile.close()
-                model_data = E.average_data(model_data, 2)
+                inputs = intermediate_store.signature([models[model]],
+                                                      settings)
+                if intermediate_store.reuse(store_dir, base_name + model,
+                                            inputs):
+                    continue
+                fields = get_reduced_fields(E, modelconfig, datakey,
+                                            models[model])[experiment, area]
                 # Now we have everything so only output neede
-                outdata = lons, model_data
-                np.save(out_file, outdata)
+                outdata = {'lons': fields['lons'],
+                           'data': fields['equatorial_means']}
+                intermediate_store.save(store_dir, base_name + model,
+                                        outdata, inputs)
 
 
 def process_scatterplot(E, modelconfig):
@@ -348,9 +443,9 @@ def process_scatterplot(E, modelconfig):
     ts_model, ts_obs_loc, ts_models = E.get_clim_model_and_obs_filenames(ts_key)
     E.check_model_instances(pr_models, ts_models)
 
-    # Initialize observations
-    pr_obs_file = nc.Dataset(pr_obs_loc, 'r')
-    ts_obs_file = nc.Dataset(ts_obs_loc, 'r')
+    # Reduced fields of the observations
+    pr_obs_fields = get_reduced_fields(E, modelconfig, pr_key, pr_obs_loc)
+    ts_obs_fields = get_reduced_fields(E, modelconfig, ts_key, ts_obs_loc)
     # A-laue_ax+
     E.add_to_filelist(pr_obs_loc)
     E.add_to_filelist(ts_obs_loc)
@@ -360,17 +455,17 @@ def process_scatterplot(E, modelconfig):
     # So some looping to do. Remember that keys in pr_models and ts_models
     # are the same (we checked this) - the paths differ.
     for model in pr_models:
-        # Initializing model specific files
-        pr_file = nc.Dataset(pr_models[model], 'r')
-        ts_file = nc.Dataset(ts_models[model], 'r')
+        # Model specific reduced fields
+        pr_fields = get_reduced_fields(E, modelconfig, pr_key, pr_models[model])
+        ts_fields = get_reduced_fields(E, modelconfig, ts_key, ts_models[model])
 
         # A-laue_ax+
         E.add_to_filelist(pr_models[model])
         E.add_to_filelist(ts_models[model])
         # A-laue_ax-
 
-        pr_units = pr_file.variables[pr_key].units
-        ts_units = ts_file.variables[ts_key].units
+        pr_units = pr_fields['units']
+        ts_units = ts_fields['units']
 
         # Extract model specific plotting style (we only need the colour)
         modelcolor, dashes, width = E.get_model_plot_style(model)
@@ -385,29 +480,10 @@ def process_scatterplot(E, modelconfig):
 
         # Next we extract the required values for each area
         for area in areas:
-            pr_data = E.get_model_data(modelconfig,
-                                       experiment,
-                                       area,
-                                       pr_key,
-                                       pr_file)
-
-            ts_data = E.get_model_data(modelconfig,
-                                       experiment,
-                                       area,
-                                       ts_key,
-                                       ts_file)
-
-            pr_obs = E.get_model_data(modelconfig,
-                                      experiment,
-                                      area,
-                                      pr_key,
-                                      pr_obs_file)
-
-            ts_obs = E.get_model_data(modelconfig,
-                                      experiment,
-                                      area,
-                                      ts_key,
-                                      ts_obs_file)
+            pr_data = pr_fields[experiment, area]
+            ts_data = ts_fields[experiment, area]
+            pr_obs = pr_obs_fields[experiment, area]
+            ts_obs = ts_obs_fields[experiment, area]
 
             row = areas.index(area)
             area_key = experiment + '_' + area
@@ -489,10 +565,6 @@ def process_scatterplot(E, modelconfig):
                                         rotation=0, horizontalalignment='left')
                 axs[row, col].grid(plot_grid)
 
-        # Closing the model datafiles
-        pr_file.close()
-        ts_file.close()
-
         axs[-1, 0].set_ylabel("Precipitation [" + pr_units + "]")
         axs[-1, 0].set_xlabel("SST [" + ts_units + "]")
         plt.suptitle("Seasonal (annual/monthly) mean values of "
@@ -519,10 +591,6 @@ def process_scatterplot(E, modelconfig):
         info("Created image: ", verbosity, 1)
         info(output_file, verbosity, 1)
 
-    # After all the loops remember to close the observation files aswell
-    pr_obs_file.close()
-    ts_obs_file.close()
-
 
 def process_zonal_means(E, modelconfig):
     """Main script for plotting zonal means. Outputs variable specific plots
@@ -562,18 +630,14 @@ def process_zonal_means(E, modelconfig):
             mindex = 0
             for model in model_filenames:
                 # read in specified data and concatenate
-                datafile = nc.Dataset(model_filenames[model], 'r')
                 # A-laue_ax+
                 E.add_to_filelist(model_filenames[model])
                 # A-laue_ax-
-                data_units = datafile.variables[datakey].units
-                lats, data = E.get_model_data(modelconfig,
-                                              experiment,
-                                              area,
-                                              datakey,
-                                              datafile)
-                data = E.average_data(data, 1)
-                datafile.close()
+                reduced = get_reduced_fields(E, modelconfig, datakey,
+                                             model_filenames[model])
+                data_units = reduced['units']
+                lats = reduced[experiment, area]['lats']
+                data = reduced[experiment, area]['zonal_means']
                 norm = data.mean()
 
                 # get y min and max iteratively
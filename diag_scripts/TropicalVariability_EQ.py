@@ -178,7 +178,6 @@ import os
 import pdb
 import sys
 import numpy as np
-from glob import glob
 
 # Force matplotlib to not use any Xwindows backend.
 import matplotlib
@@ -193,6 +192,7 @@ import netCDF4 as nc
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+import intermediate_store
 from auxiliary import info
 
 
@@ -241,23 +241,24 @@ def check_data_existance(E, modelconfig):
     """Checks that all needed datafiles exist for temp / precip. """
     experiment = 'equatorial'
     areas = modelconfig.get(experiment, 'areas').split()
-    work_dir = E.get_work_dir()
+    store_dir = E.get_intermediate_dir()
     base_name = 'TropicalVariability_' + experiment + '_' + areas[0] + '_'
 
     additional_keys = []
     # First test temperature
-    ts_test = glob(work_dir + base_name + 'ts*')
+    ts_test = intermediate_store.names(store_dir, base_name + 'ts')
     if (len(ts_test) > 0):
         additional_keys.append('ts')
     # Next precipitation
-    pr_test = glob(work_dir + base_name + 'pr*')
+    pr_test = intermediate_store.names(store_dir, base_name + 'pr')
     if (len(pr_test) > 0):
         if ('pr-mmday' in pr_test[0]):
             additional_keys.append('pr-mmday')
         else:
             additional_keys.append('pr')
     # Finally divergence
-    divergence_test = glob(work_dir + base_name + 'divergence*')
+    divergence_test = intermediate_store.names(store_dir,
+                                               base_name + 'divergence')
     if (len(divergence_test) > 0):
         additional_keys.append('divergence')
 
@@ -273,12 +274,10 @@ def check_data_existance(E, modelconfig):
 
 def post_process(E):
     """This script is for post processing of equatorial means.
-    We erase temporary npy files from memory."""
-    base_names = E.get_work_dir()
-    base_names += 'TropicalVariability_equatorial_*'
-    erase_files = glob(base_names)
-    for erase in erase_files:
-        os.remove(erase)
+    We release the intermediate entries of this run - the arrays are kept
+    for the next run with the same inputs."""
+    intermediate_store.release(E.get_intermediate_dir(),
+                               'TropicalVariability_equatorial_')
 
 
 def process_equatorial_means(E, modelconfig):
@@ -291,7 +290,7 @@ def process_equatorial_means(E, modelconfig):
     datakeys = E.get_currVars()
     plot_dir = E.get_plot_dir()
     verbosity = E.get_verbosity()
-    work_dir = E.get_work_dir()
+    store_dir = E.get_intermediate_dir()
     areas = modelconfig.get(experiment, 'areas').split()
     plot_grid = modelconfig.getboolean('general', 'plot_grid')
     ua_key = datakeys[0]
@@ -370,20 +369,18 @@ def process_equatorial_means(E, modelconfig):
             # These will be read from external files previously written by
             # TropicalVariability.py
             elif (datakey == 'pr' or datakey == 'pr-mmday' or datakey == 'ts'):
-                base_name = work_dir + 'TropicalVariability_'\
+                base_name = 'TropicalVariability_'\
                             + area_key + '_' + datakey + '_model_'
-                datafiles = glob(base_name + '*')
-                key_models = []
-                for dfile in datafiles:
-                    start = dfile.find('_model_') + 7
-                    key_models.append(str(dfile)[start:-4])
+                key_models = [name[len(base_name):] for name in
+                              intermediate_store.names(store_dir, base_name)]
 
                 # now we can do the loop over the models
                 for model in key_models:
-                    # extract model specific data
-                    alldata = np.load(base_name + model + '.npy')
-                    lons = alldata[0]
-                    data = alldata[1]
+                    # extract model specific data (memory-mapped)
+                    alldata = intermediate_store.load(store_dir,
+                                                      base_name + model)
+                    lons = np.array(alldata['lons'])
+                    data = alldata['data']
                     color, dashes, width = E.get_model_plot_style(model)
                     lons = E.ensure_looping(lons)
 
@@ -414,20 +411,18 @@ def process_equatorial_means(E, modelconfig):
             # Next the wind divergence that is also read from external files
             # previously written by TropicalVariability_wind.py
             elif (datakey == 'divergence'):
-                base_name = work_dir + 'TropicalVariability_'\
+                base_name = 'TropicalVariability_'\
                             + area_key + '_' + datakey + '_model_'
-                datafiles = glob(base_name + '*')
-                key_models = []
-                for dfile in datafiles:
-                    start = dfile.find('_model_') + 7
-                    key_models.append(str(dfile)[start:-4])
+                key_models = [name[len(base_name):] for name in
+                              intermediate_store.names(store_dir, base_name)]
 
                 # now we can do the loop over the models
                 for model in key_models:
-                    # extract model specific data
-                    alldata = np.load(base_name + model + '.npy')
-                    lons = alldata[0]
-                    data = 1E6 * alldata[1]
+                    # extract model specific data (memory-mapped)
+                    alldata = intermediate_store.load(store_dir,
+                                                      base_name + model)
+                    lons = np.array(alldata['lons'])
+                    data = 1E6 * alldata['data']
                     color, dashes, width = E.get_model_plot_style(model)
                     lons = E.ensure_looping(lons)
 
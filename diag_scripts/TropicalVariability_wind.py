@@ -169,11 +169,13 @@ matplotlib.use('Agg')
 # Common Python packages
 import matplotlib.pyplot as plt
 
-from scipy.interpolate import griddata
 
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+import regrid
+import derivatives
+import intermediate_store
 from auxiliary import info
 
 from mpl_toolkits.basemap import Basemap
@@ -223,84 +225,35 @@ def main(project_info):
 # E. style functions are in the general python file esmval_lib.py
 
 def calculate_derivatives(E, lats, lons, data, key):
-    """Calculates pointwise derivatives."""
+    """Calculates pointwise derivatives.
+    The grid distances are cached per grid, see derivatives.py."""
     # First we average over time
-    means = np.zeros((data.shape[1], data.shape[2]))
-    for lat in xrange(data.shape[1]):
-        for lon in xrange(data.shape[2]):
-            means[lat, lon] = np.mean(data[:, lat, lon])
+    means = np.ma.filled(np.mean(data, axis=0, dtype=np.float64), 0.)
     # For ua the derivate is longitudinal
     if (key == 'ua'):
-        output = np.zeros((data.shape[1], data.shape[2] - 2))
-        for lat in xrange(len(lats)):
-            for lon in xrange(len(lons) - 2):
-                # Delta is lat/lon specific (we don't assume regular grid)
-                delta = convert_latlon_meters(lats[lat], lats[lat],
-                                              lons[lon], lons[lon + 2])
-                output[lat, lon] = (means[lat, lon + 2] - means[lat, lon]) / delta
         # return mean values and the derivatives
-        return means[:, 1:-1], output
+        return means[:, 1:-1], derivatives.d_dlon(means, lats, lons)
     # For va the derivate is latitudinal
     elif (key == 'va'):
-        output = np.zeros((data.shape[1] - 2, data.shape[2]))
-        for lat in xrange(len(lats) - 2):
-            for lon in xrange(len(lons)):
-                # Delta is lat/lon specific (we don't assume regular grid)
-                delta = convert_latlon_meters(lats[lat], lats[lat + 2],
-                                              lons[lon], lons[lon])
-                output[lat, lon] = (means[lat + 2, lon] - means[lat, lon]) / delta
         # return mean values and the derivatives
-        return means[1:-1, :], output
-
-
-def convert_latlon_meters(lat1, lat2, lon1, lon2):
-    """Converts the distance between two coordinates to meters"""
-    return np.arccos(np.sin(lat1 * np.pi / 180) * np.sin(lat2 * np.pi / 180)
-                     + np.cos(lat1 * np.pi / 180) * np.cos(lat2 * np.pi / 180)
-                     * np.cos(lon2 * np.pi / 180 - lon1 * np.pi / 180)) * 6371000
+        return means[1:-1, :], derivatives.d_dlat(means, lats, lons)
 
 
 def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
     """Interpolates the data values to a specific lat/lon grid.
-    This function should only be used for 2D arrays (no time indeces etc.)"""
-
-    # First check if the coordinates are the same, otherwise interpolate
-    if (np.array_equal(lats, target_lats) and np.array_equal(lons, target_lons)):
-        return data
-
-    else:
-        grid_lats, grid_lons = np.meshgrid(target_lats, target_lons)
-        datapoints = np.zeros((len(lats) * len(lons), 2))
-        datavalues = data.reshape(-1)
-        i = 0
-        for lat in lats:
-            datapoints[i:i + len(lons), 0] = lat
-            datapoints[i:i + len(lons), 1] = lons
-            i += len(lons)
-
-        # Calculate the values on the new grid
-        gridvalues = griddata(datapoints, datavalues, (grid_lats, grid_lons),
-                              method='cubic')
-        nearest = griddata(datapoints, datavalues, (grid_lats, grid_lons),
-                           method='nearest')
-
-        # In some cases griddata cannot export values on the border of the grid
-        for i in xrange(gridvalues.shape[0]):
-            for j in xrange(gridvalues.shape[1]):
-                if (np.isnan(gridvalues[i, j])):
-                    gridvalues[i, j] = nearest[i, j]
-        return gridvalues.T
+    The interpolation weights are cached per pair of grids, see regrid.py."""
+    return regrid.regrid(data, lats, lons, target_lats, target_lons)
 
 
 def process_divergence(E, modelconfig):
     """This script preprocessess equatorial divergence values.
-    The data is extracted and saved to a npy-file. Plotting is done in
-    TropicalVariability_EQ.py. """
+    The data is saved to the intermediate store (see intermediate_store.py).
+    Plotting is done in TropicalVariability_EQ.py. """
     experiment = 'equatorial'
     datakeys = E.get_currVars()
     verbosity = E.get_verbosity()
     plot_dir = E.get_plot_dir()
-    work_dir = E.get_work_dir()
+    store_dir = E.get_intermediate_dir()
     areas = modelconfig.get(experiment, 'areas').split()
 
     if ('ua' in datakeys[0]):
@@ -324,10 +277,12 @@ def process_divergence(E, modelconfig):
         lon_min = modelconfig.getint(area_key, 'lon_min')
         lon_max = modelconfig.getint(area_key, 'lon_max')
 
-        # create a python array file for each area, model  and datakey
+        settings = {'area': dict(modelconfig.items(area_key)),
+                    'general': dict(modelconfig.items('general'))}
+
+        # create an entry for each area, model and datakey
         # overwrite if exists
-        base_name = work_dir\
-                    + 'TropicalVariability_'\
+        base_name = 'TropicalVariability_'\
                     + area_key\
                     + '_divergence_model_'
         ua_models = E.get_clim_model_filenames(variable=ua_key)
@@ -338,7 +293,6 @@ def process_divergence(E, modelconfig):
         for model in ua_models:
             if (E.get_model_id(model) == 'obs'):
                 obs = model
-                out_file = base_name + model + '.npy'
                 ua_datafile = nc.Dataset(ua_models[model], 'r')
                 va_datafile = nc.Dataset(va_models[model], 'r')
                 # A-laue_ax+
@@ -359,19 +313,20 @@ def process_divergence(E, modelconfig):
                 va_datafile.close()
                 ua_obs, ua_derv = calculate_derivatives(E, ulats, ulons, ua_data, 'ua')
                 va_obs, va_derv = calculate_derivatives(E, vlats, vlons, va_data, 'va')
-                diverg = np.zeros(len(vlons))
-                for lon in xrange(diverg.shape[0]):
-                    diverg[lon] = np.mean(ua_derv[:, lon] + va_derv[:, lon])
+                diverg = np.mean(ua_derv + va_derv, axis=0)
                 # Now we have everything so only output needed
-                outdata = vlons, diverg
-                np.save(out_file, outdata)
+                outdata = {'lons': vlons, 'data': diverg}
+                inputs = intermediate_store.signature([ua_models[model],
+                                                       va_models[model]],
+                                                      settings)
+                intermediate_store.save(store_dir, base_name + model,
+                                        outdata, inputs)
                 obscolor, obsdashes, obswidth = E.get_model_plot_style(model)
                 obslats, obslons = ulats, vlons
         del ua_models[obs]
 
         # Now we do the same for all models and plot the wind vector field
         for model in ua_models:
-            out_file = base_name + model + '.npy'
             ua_datafile = nc.Dataset(ua_models[model], 'r')
             va_datafile = nc.Dataset(va_models[model], 'r')
             # A-laue_ax+
@@ -392,12 +347,14 @@ def process_divergence(E, modelconfig):
             va_datafile.close()
             ua_mean, ua_derv = calculate_derivatives(E, ulats, ulons, ua_data, 'ua')
             va_mean, va_derv = calculate_derivatives(E, vlats, vlons, va_data, 'va')
-            diverg = np.zeros(len(vlons))
-            for lon in xrange(diverg.shape[0]):
-                diverg[lon] = np.mean(ua_derv[:, lon] + va_derv[:, lon])
+            diverg = np.mean(ua_derv + va_derv, axis=0)
             # Now we have everything so only output needed
-            outdata = vlons, diverg
-            np.save(out_file, outdata)
+            outdata = {'lons': vlons, 'data': diverg}
+            inputs = intermediate_store.signature([ua_models[model],
+                                                   va_models[model]],
+                                                  settings)
+            intermediate_store.save(store_dir, base_name + model,
+                                    outdata, inputs)
 
             # Interpolate model data to obs grid
             ua_mean = interpolate_data_grid(ua_mean, ulats, vlons, obslats, obslons)
@@ -18,6 +18,7 @@ from geoval.core.data import GeoData
 from geoval.core.mapping import *
 import extended_data
 from esmval_lib import ESMValProject
+import trend_statistics
 #from GeoData_mapping import *
 
 #import ConfigParser
@@ -190,6 +191,11 @@ class Diagnostic(object):
                 self._stop_time=self._stop_time.replace(year=self.cfg.stop_year,month=12,day=31)
                 self._changed=True     
         
+        # number of worker processes of the trend and tau maps (optional)
+        self._processes=1
+        if 'processes' in self.cfg.__dict__.keys():
+            self._processes=self.cfg.processes
+        
         if self._changed and not (self.var in ["baresoilFrac","grassNcropFrac","shrubNtreeFrac"]):
             #reorganize data
             self._mod_data.apply_temporal_subsetting(self._start_time, self._stop_time)
@@ -534,7 +540,7 @@ class BasicDiagnostics(Diagnostic):
         
         if self.cfg.regionalization and self._regions==None:
             self._write_regionalization_header()   
-            self._regions=self._ref_data.get_regions(self._reg_shape,self.cfg.shapeNames-1)
+            self._regions=self._ref_data.get_regions(self._reg_shape,self.cfg.shapeNames-1,cache_dir=self._work_dir + os.sep + "regions")
             print("     Region names: " + ", ".join(self._regions.keys()))
         
         
@@ -1102,8 +1108,8 @@ class BasicDiagnostics(Diagnostic):
         self._KT_corr,self._KT_pval=self._mapping_tau(d_mod,d_ref)
         
         #temporal trend
-        UU_Rr,self._Sr,UU_Ir,self._Pr=self._ref_data.temporal_trend(return_object=True, pthres=1.01)  
-        UU_Rm,self._Sm,UU_Im,self._Pm=self._mod_data.temporal_trend(return_object=True, pthres=1.01)
+        self._Sr,self._Pr=self._mapping_trend(self._ref_data)
+        self._Sm,self._Pm=self._mapping_trend(self._mod_data)
         self._Sr.data=self._Sr.data*365.25
         self._Sr.unit=self._ref_data.unit + " / year"
         self._Sm.data=self._Sm.data*365.25
@@ -1112,38 +1118,56 @@ class BasicDiagnostics(Diagnostic):
 
     def _mapping_tau(self,dataX,dataY):
         """
-        Kendall's Tau correlation mapping        
+        Kendall's Tau correlation mapping (all pixels at once, masked
+        values are left out, see trend_statistics)
         """
         
-        KT_corr=dataX.get_percentile(0)
-        KT_pval=KT_corr.copy()
-
         shapeX=dataX.shape
         shapeY=dataY.shape
         
         if not shapeX == shapeY:
             assert False, 'The data is misformed!'
             
-        dataX=dataX.data.reshape(shapeX[0],shapeX[1]*shapeX[2])    
-        dataY=dataY.data.reshape(shapeX[0],shapeX[1]*shapeX[2]) 
-        dataXY=np.append(dataX,dataY,axis=0)        
-        
-        def __my_tau__(v):
-            """
-            wrapper for kendall's tau along 2 halfs of a vector
-            """
-            vs=v.shape
-            half=vs[0]/2
-            return stats.stats.kendalltau(v[np.arange(half)],v[np.arange(half)+half])
+        X=dataX.data.reshape(shapeX[0],shapeX[1]*shapeX[2])    
+        Y=dataY.data.reshape(shapeX[0],shapeX[1]*shapeX[2]) 
         
-        Kendall=np.apply_along_axis(__my_tau__,0,dataXY)  
-        Kendall.shape=(Kendall.shape[0],shapeX[1],shapeX[2])     
+        tau,pval=trend_statistics.kendall_tau(X,Y,processes=self._processes)
         
-        KT_corr.data.data[:]=Kendall[0]
-        KT_pval.data.data[:]=Kendall[1]
+        template=dataX.get_percentile(0)
+        KT_corr=self._mapping_values(template,tau)
+        KT_pval=self._mapping_values(template,pval)
         
         return KT_corr,KT_pval
 
+    def _mapping_trend(self,data):
+        """
+        linear trend mapping (slope per day and p-value, masked values
+        are left out, see trend_statistics)
+        """
+        
+        shape=data.shape
+        days=np.asarray([(date-data.date[0]).total_seconds()/86400.
+                         for date in data.date])
+        
+        slope,UU_I,UU_R,pval=trend_statistics.linear_trend(
+            days,data.data.reshape(shape[0],shape[1]*shape[2]),
+            processes=self._processes)
+        
+        template=data.get_percentile(0)
+        return self._mapping_values(template,slope), \
+            self._mapping_values(template,pval)
+
+    def _mapping_values(self,template,values):
+        """
+        copy of a 2D data object holding the per pixel values, masked
+        where they are not defined (NaN)
+        """
+        
+        result=template.copy()
+        result.data=np.ma.masked_invalid(values.reshape(template.shape))
+        
+        return result
+
          
     def _plot_trend_corr_maps(self, corr, pval):
         """
@@ -9,10 +9,19 @@ from geoval.core.netcdf import NetCDFHandler
 from geoval.core.data import GeoData
 import matplotlib.pyplot as plt
 import collections
+import region_labels
 
 # TODO correct _set_cell_area
 # TODO discuss: get_shape_statistics, get_regions
 
+class Regions(collections.OrderedDict):
+    """
+    masks of the regions of a shapefile by name (True outside the region)
+    with the label grids they are made of (see region_labels)
+    """
+    labels=None
+
+
 class GeoData(GeoData):
 
     def C_set_cell_area(self): #Overwritten due to error
@@ -149,158 +158,68 @@ class GeoData(GeoData):
     def get_shape_statistics(self,regions): #written before geoval was implemented
         """
         get statistical information for different polygons in shapefile
+        (min, area weighted mean, max, area weighted standard deviation
+        and count of the valid values of all regions in one pass)
         Parameters
         ----------
-        regions : masks for masked array
+        regions : masks for masked array (see get_regions)
         """
         
         self.regionalized=dict()
         regname=regions.keys()
+        if not len(regname):
+            return
         
-#        for s in np.arange(len(regions)):
-#            loc_content=self.data.copy()
-#            loc_content.mask=regions[regname[s]]
-#            
-#            try:
-#                a=np.nanmin(loc_content)
-#            except:
-#                a=np.nan
-#            try:
-#                b=np.nanmean(loc_content)
-#            except:
-#                b=np.nan
-#            try:
-#                c=np.nanmax(loc_content) 
-#            except:
-#                c=np.nan
-#            try:
-#                d=np.nanstd(loc_content)
-#            except:
-#                d=np.nan
-#            try:
-#                e=loc_content.count()
-#            except:
-#                e=np.nan
-                
-        for s in np.arange(len(regions)):
-            loc_content=self.copy()
-            #loc_content.data.mask=regions[regname[s]]
-            loc_content.data.mask=np.logical_or(loc_content.data.mask,regions[regname[s]])
-
-# A_laue_ax+
-            #print("==========================================================")
-            #print(regname[s])
-            #print(np.shape(loc_content.data.mask))
-            #print(np.shape(regions[regname[s]]))
-            #ncfile = NetCDFHandler()
-            #ncfile.open_file('debug.nc', 'w')
-            #dims = np.shape(loc_content.data.mask)
-            #nx = dims[1]
-            #ny = dims[0]
-            #ncfile.create_dimension('x',size=nx)
-            #ncfile.create_dimension('y',size=ny)
-            #data = ncfile.create_variable('data','i4',('y','x'))
-            #ncfile.assign_value('data', self.data.mask.astype(int))
-            #ncfile.close()
-            #print("==========================================================")
-            #if (s == 1):
-            #    exit()
-# A_laue_ax-
-            
-            try:
-                a=np.nanmin(loc_content.data)
-            except:
-                a=np.nan
-            try:
-                b=loc_content.fldmean()
-            except:
-                b=np.nan
-            try:
-                c=np.nanmax(loc_content.data) 
-            except:
-                c=np.nan
-            try:
-                lc2=loc_content.copy()
-                lc2.data=lc2.data**2
-                d=np.sqrt((lc2.fldmean()-b**2))
-            except:
-                d=np.nan
-            try:
-                e=loc_content.data.count()
-            except:
-                e=np.nan
-            
-            self.regionalized[regname[s]]=[a,b,c,d,e]
+        labels=getattr(regions,'labels',None)
+        if labels is None:
+            labels=region_labels.from_masks([regions[name] for name in regname])
+        
+        weights=getattr(self,'cell_area',None)
+        if weights is None or np.shape(weights) != self.data.shape:
+            weights=np.ones(self.data.shape)
+        total_weight=None
+        if getattr(self,'weighting_type','valid') == 'all':
+            total_weight=np.sum(weights)
+        
+        stats=region_labels.statistics(self.data,labels,len(regname),
+                                       weights=weights,total_weight=total_weight)
+        
+        for s in np.arange(len(regname)):
+            a,b,c,d,e=[values[s] for values in stats]
+            self.regionalized[regname[s]]=[a,b,c,d,int(e)]
                                             
-    def get_regions(self,shape,column=0): #written before geoval was implemented
+    def get_regions(self,shape,column=0,cache_dir=None): #written before geoval was implemented
         """
         get setup for statistical information for different polygons in shapefile
         Parameters
         ----------
         shape : shp.Reader (shapefile.Reader)
             information on areas from a classic ESRI shapefile
+        column : int
+            column of the records holding the region names
+        cache_dir : str
+            directory of the cached label grids of the regions (see
+            region_labels), not cached if not given
         """
         assert isinstance(shape,shp.Reader)
         
-    
-            
-        def point_in_poly(point,poly):
-
-            testy=point[1]
-            testx=point[0] if point[0]<180 else point[0]-360
-            
-            vertx=[item[0] for item in poly]
-            verty=[item[1] for item in poly]
-            
-            nvert=len(poly)
-            c=False
-          
-            j=nvert-1
-            for i in range(0, nvert):
-                if ( not((verty[i]>testy) == (verty[j]>testy)) and (testx < (vertx[j]-vertx[i]) * (testy-verty[i]) / (verty[j]-verty[i]) + vertx[i]) ):
-                    c = not c
-                j=i
-          
-            return c
-            
-                    
-        regions=dict()
         regname=np.array(shape.records())[:,column] 
         
-        for s in range(len(shape.shapes())):
-            breaks=shape.shapes()[s].parts
-            breaks.append(0)
-            loc_polys=[]
-            loc_masks=[]
-            for e in range(len(breaks)-1):
-                
-                loc_polys.append(shape.shapes()[s].points[breaks[e]:(breaks[e+1]-1)])
-            
-                if len(self.shape) == 3:
-                    loc_mask=np.any(self.data,axis=0).mask.copy()
-                elif len(self.shape) == 2:
-                    loc_mask=self.data.mask.copy()
-                else :
-                    assert False, "wrong data dimensions"
-                for i in np.arange(self.shape[0] if len(self.shape) == 2 else self.shape[1]):
-                    for j in np.arange(self.shape[1] if len(self.shape) == 2 else self.shape[2]):
-                        ll=[(self.lon[i,j]),self.lat[i,j]]
-    
-                        loc_mask[i,j]=point_in_poly(ll,loc_polys[-1])
-                        
-                loc_masks.append(loc_mask)     
-            
-#            if len(self.shape) == 3:
-#                loc_mask=self.data.mask.copy()
-#            elif len(self.shape) == 2:
-#                loc_mask=self.data.mask.copy()
-#            else :
-#                assert False, "wrong data dimensions"
-                
-#            regions[regname[s]]=np.logical_or(loc_mask,np.logical_not(sum(loc_masks) % 2))
-            regions[regname[s]]=np.logical_not(sum(loc_masks) % 2)
+        # the last shape of a name defines the region
+        polygons=dict()
+        for s, loc_shape in enumerate(shape.shapes()):
+            polygons[regname[s]]=region_labels.shape_rings(loc_shape)
+        names=sorted(polygons.keys())
+        
+        labels=region_labels.labels([polygons[name] for name in names],
+                                    self.lon,self.lat,cache_dir=cache_dir)
+        
+        regions=Regions()
+        for r, name in enumerate(names):
+            regions[name]=np.logical_not(np.any(labels == r,axis=0))
+        regions.labels=labels
             
-        return collections.OrderedDict(sorted(regions.items()))
+        return regions
         
     
         
@@ -1,4 +1,5 @@
-subroutine global_rain_sm(nx,ny,nt,nyr,monthlypr,prbef,praft,monthlysm,smbef,smaft,sm_clim,topo,lon,mn,filedir,daysperyear)
+subroutine global_rain_sm(nx,ny,nt,nyr,monthlypr,prbef,praft,monthlysm,smbef,smaft,sm_clim,topo,lon,mn,daysperyear,&
+                          event,event_opD,bevent_opD)
 implicit none
 
 ! Vars that need inputting (single month, all years)
@@ -7,7 +8,6 @@ integer,intent(in)::nx,ny,nt,nyr,mn,daysperyear !nyr = 1 later, but needed for t
 real,intent(in),dimension(nyr,nt,ny,nx)::monthlypr
 real,intent(in),dimension(nyr,nt,ny,nx)::monthlysm
 real,dimension(ny,nx)::sm_clim,topo
-character*100::filedir
 
 ! rainfall and sm on last day of previous month (bef) and first day of following
 ! month (aft)
@@ -16,7 +16,7 @@ real,intent(in),dimension(nx)::lon
 integer:: ic,ic_old,ndom   
 
 
-integer::k,i,j,ii,jj,n,d1,d2,yr,l
+integer::k,i,j,ii,jj,n,d1,d2,yr
 
 integer,parameter::box_del2=1       !3x3 box (code searches over a box this size
                         !centred on maximum rainfall
@@ -33,7 +33,7 @@ real,dimension(npd,ny,nx)::rain_lt!this array holds 1 diurnal cycles of rain bas
 
 integer,dimension(ny,nx)::irain_max,irain_min
 real::smwet,smdry,smdry_clim,nsmdry,box_mean_sm,nbox
-integer,dimension(ny,nx)::event
+integer,intent(out),dimension(ny,nx)::event
 logical,dimension(ny,nx)::nearby_event
 !
 !max(min) rain per pixel between am1 and am2 (pm1 and pm2)
@@ -48,13 +48,8 @@ integer::am1,am2,pm1,pm2
 !
 integer,parameter::nvar=9,nbvar=8 ! eqn gives an error on f2py: (2*box_del2+1)**2-1 !5x5 box
 !
-integer,dimension(ny,nx,max_events,nvar)::event_opD
-integer,dimension(ny,nx,max_events,nbvar)::bevent_opD
-!
-! characters for filenames
-character*4::cx
-character*3::cy
-character*2::cmon
+integer,intent(out),dimension(ny,nx,max_events,nvar)::event_opD
+integer,intent(out),dimension(ny,nx,max_events,nbvar)::bevent_opD
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 ! CODE STARTS HERE
@@ -268,51 +263,12 @@ enddo
 
 
 !!!!!!!!!!!!
-! WRITE STUFF OUT
+! RETURN EVENTS
 !!!!!!!!!!!!
-
-
-write(cmon,'(i2.2)')mn 
-!
-! this monthly file contains details about the number of events per grid cell
-! which is used sample_events.f90, as well as additional diagnostics
-! for checking the code at an interim point
-!
-open(4,file=trim(filedir)//'event_output/global_rain_sm_'//cmon//'.gra',&
-             status='replace',access='direct', form='unformatted', recl=4*nx*ny)
-
-write(4,rec=1)dsm
-write(4,rec=2)ndel
-write(4,rec=3)nwetter
-write(4,rec=4)ndrier
-write(4,rec=5)dsm_clim
-close(4)
-dsm=0. ; ndel=0. ; nwetter=0. ; ndrier=0. ; dsm_clim=0.
-!
-! output event ascii files
 !
-! for every grid point that contains at least one event, create an ascii
-! file with the key characteristics of that event. These are read by sample_events.f90
-!
-do j=1,ny
-    do i=1,nx
-        if(event(j,i).gt.0) then
-            ii=i
-            jj = j
-            write(cx,'(i4.4)') ii 
-            write(cy,'(i3.3)') jj 
-            open(20,file=trim(filedir)//&
-                    'event_output/mon'//cmon//'/x'//cx//'_y'//cy//'_mon'//cmon//'.txt')
-
-            do k=1,event(j,i)
-                l=event_opD(j,i,k,nvar)
-                write(20,*) event_opD(j,i,k,:),bevent_opD(j,i,k,1:l)
-            enddo
-
-            close(20) 
-        endif
-    enddo
-enddo
+! event holds the number of events per grid cell, event_opD and bevent_opD
+! the key characteristics of each event (bevent_opD(:,:,k,1:event_opD(:,:,k,9))
+! are the dry pixels). They are passed on to sample_events.f90 in memory.
 !
 return
 end
@@ -2,7 +2,11 @@ info_output <- function(output_string,
                         verbosity,
                         required_verbosity) {
 
-    main_wd = Sys.getenv(c("ESMValTool_cwd"))
+    if (exists("run_manifest_entry")) {
+        main_wd = run_manifest_entry("ESMValTool_cwd")
+    } else {
+        main_wd = Sys.getenv(c("ESMValTool_cwd"))
+    }
     if (nchar(main_wd) == 0) {
         print(paste("info: ", output_string, sep = ""))
     }
@@ -0,0 +1,89 @@
+"""
+Single-pass binning of (masked) values
+
+The bin of each value is found once with np.digitize. The counts, sums
+and means per bin are then accumulated with np.bincount for a whole
+stack of fields at once (e.g., observations and models, several
+seasons), which need not have the same shape.
+
+The first and the last bin are open ended, and a value on an inner bin
+edge belongs to both adjacent bins (the bins are closed intervals).
+Masked and non-finite values are left out.
+"""
+
+import numpy as np
+
+
+def bin_values(values, bins):
+    """Returns the bins of values.
+
+    Parameters
+    ----------
+    values : array
+    bins : array (nbins + 1)
+        bin edges, increasing
+
+    Returns
+    -------
+    (index, edge) int arrays of the shape of values with the bin of each
+    value and the lower adjacent bin of values on an inner edge (-1 for
+    the other values)
+    """
+    inner = np.asarray(bins)[1:-1]
+    index = np.digitize(values, inner)
+    lower = np.digitize(values, inner, right=True)
+    return index, np.where(lower != index, lower, -1)
+
+
+def _flatten(stack):
+    """ Values (float64) and valid values of a stack, member by member """
+    values = [np.asarray(np.ma.getdata(member), dtype=np.float64).ravel()
+              for member in stack]
+    valid = [~np.ma.getmaskarray(member).ravel() for member in stack]
+    values = np.concatenate(values)
+    return values, np.concatenate(valid) & np.isfinite(values)
+
+
+def binned_means(x, y, bins):
+    """Returns the number of values and the means of x and y per bin of x.
+
+    Parameters
+    ----------
+    x : list of arrays
+        the values to bin of each member of the stack
+    y : list of arrays
+        the values to average per bin of x, of the same shapes as x (a
+        masked y value is only left out of the means of y)
+    bins : array (nbins + 1)
+        bin edges, see bin_values
+
+    Returns
+    -------
+    (counts, x_means, y_means) arrays (member, nbins), the means of empty
+    bins are NaN
+    """
+    nbins = len(bins) - 1
+    n_stack = len(x)
+    sizes = [np.size(member) for member in x]
+
+    x_values, x_valid = _flatten(x)
+    y_values, y_valid = _flatten(y)
+    y_valid &= x_valid
+
+    index, edge = bin_values(x_values, bins)
+    offsets = np.repeat(np.arange(n_stack) * nbins, sizes)
+
+    def accumulate(valid, weights=None):
+        sums = np.zeros(n_stack * nbins)
+        for bin_index in [index, edge]:
+            use = valid & (bin_index >= 0)
+            sums += np.bincount((bin_index + offsets)[use],
+                                None if weights is None else weights[use],
+                                minlength=n_stack * nbins)
+        return sums.reshape(n_stack, nbins)
+
+    counts = accumulate(x_valid)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_means = accumulate(x_valid, x_values) / counts
+        y_means = accumulate(y_valid, y_values) / accumulate(y_valid)
+    return counts, x_means, y_means
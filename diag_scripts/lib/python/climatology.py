@@ -0,0 +1,196 @@
+"""
+Vectorized climatology kernels for monthly (time, lat, lon) fields
+
+The time axis is assumed to be monthly and to start in January, i.e.,
+time step t belongs to calendar month t % 12. All means are mask-aware:
+masked values (np.ma.MaskedArray) are left out, means over only masked
+values are NaN. The accumulation (and result) type can be chosen with
+the dtype argument, e.g., np.float32 to halve the memory of big fields.
+monthly_climatology_of_days works on daily fields of full years instead.
+"""
+
+import numpy as np
+
+# Season masks built so far, keyed by (number of time steps, months)
+_season_masks = {}
+
+
+def _mean(data, axis, dtype):
+    """ Mean of (masked) data over axis, masked results set to NaN """
+    means = data.mean(axis=axis, dtype=dtype)
+    if np.ma.isMaskedArray(means):
+        means = np.ma.filled(np.ma.asarray(means).astype(dtype), np.nan)
+    return np.asarray(means, dtype=dtype)
+
+
+def _by_month(data):
+    """ View of data with the time axis split into (years, 12)
+
+    Returns None if the time axis does not cover full years.
+    """
+    if data.shape[0] % 12 != 0:
+        return None
+    return data.reshape((data.shape[0] // 12, 12) + data.shape[1:])
+
+
+def monthly_climatology(data, dtype=np.float64):
+    """Returns the mean annual cycle of data.
+
+    Parameters
+    ----------
+    data : array (time, ...)
+        monthly data starting in January
+    dtype : numpy type
+        type used for the accumulation and the result
+
+    Returns
+    -------
+    array (12, ...) with the mean over all years for each calendar month
+    """
+    by_month = _by_month(data)
+    if by_month is not None:
+        return _mean(by_month, 0, dtype)
+    # Incomplete last year, the months have different numbers of years
+    return np.array([_mean(data[month::12], 0, dtype)
+                     for month in xrange(12)], dtype=dtype)
+
+
+def monthly_means(data, dtype=np.float64):
+    """Returns the mean over all time steps and points for each calendar month.
+
+    Parameters
+    ----------
+    data : array (time, ...)
+        monthly data starting in January
+    dtype : numpy type
+        type used for the accumulation and the result
+
+    Returns
+    -------
+    array (12)
+    """
+    by_month = _by_month(data)
+    if by_month is not None:
+        by_month = by_month.reshape(by_month.shape[:2] + (-1,))
+        return _mean(np.swapaxes(by_month, 0, 1).reshape(12, -1), 1, dtype)
+    return np.array([_mean(data[month::12].ravel(), 0, dtype)
+                     for month in xrange(12)], dtype=dtype)
+
+
+def dimension_means(data, axis, dtype=np.float64):
+    """Returns the means over all dimensions but one.
+
+    Parameters
+    ----------
+    data : array
+    axis : int
+        the dimension to keep
+    dtype : numpy type
+        type used for the accumulation and the result
+
+    Returns
+    -------
+    array of length data.shape[axis]
+    """
+    other_axes = tuple([i for i in xrange(data.ndim) if i != axis])
+    return _mean(data, other_axes, dtype)
+
+
+def season_mask(n_times, months):
+    """Returns the time steps belonging to a season.
+
+    The masks are built once per season and number of time steps.
+
+    Parameters
+    ----------
+    n_times : int
+        length of the (monthly, January first) time axis
+    months : list of int
+        the months of the season (1 = January)
+
+    Returns
+    -------
+    boolean array (n_times), True for the time steps of the season
+    """
+    key = (n_times, tuple(sorted(set(months))))
+    if key not in _season_masks:
+        in_season = np.zeros(12, dtype=bool)
+        in_season[[month - 1 for month in key[1]]] = True
+        mask = np.resize(in_season, n_times)
+        mask.flags.writeable = False
+        _season_masks[key] = mask
+    return _season_masks[key]
+
+
+def mask_season(data, months):
+    """Returns data with the time steps outside of a season masked.
+
+    Parameters
+    ----------
+    data : array (time, ...)
+        monthly data starting in January
+    months : list of int
+        the months of the season (1 = January)
+
+    Returns
+    -------
+    masked array of the shape of data
+    """
+    outside = ~season_mask(data.shape[0], months)
+    mask = np.empty(data.shape, dtype=bool)
+    mask[...] = outside.reshape((-1,) + (1,) * (data.ndim - 1))
+    return np.ma.masked_array(data, mask | np.ma.getmaskarray(data))
+
+
+def seasonal_mean(data, months=None, dtype=np.float64):
+    """Returns the mean over the time steps of a season.
+
+    Parameters
+    ----------
+    data : array (time, ...)
+        monthly data starting in January
+    months : list of int
+        the months of the season (1 = January), None for all time steps
+    dtype : numpy type
+        type used for the accumulation and the result
+
+    Returns
+    -------
+    array of the shape of data without the time axis
+    """
+    if months is not None:
+        data = data[season_mask(data.shape[0], months)]
+    return _mean(data, 0, dtype)
+
+
+def monthly_climatology_of_days(data, days_permonth, dtype=np.float64):
+    """Returns the monthly means of the mean annual cycle of daily data.
+
+    Parameters
+    ----------
+    data : array (time, ...)
+        daily data of full years, starting on January 1
+    days_permonth : list of int
+        the number of days of each month of the (fixed) calendar
+    dtype : numpy type
+        type used for the accumulation and the result
+
+    Returns
+    -------
+    array (12, ...) with the mean over the days of each calendar month
+    of the means over all years of each day
+    """
+    days_peryear = sum(days_permonth)
+    daily = np.ma.mean(data.reshape((-1, days_peryear) + data.shape[1:]),
+                       axis=0, dtype=dtype)
+
+    # Days in a (month, max_days) layout, the padding of shorter months
+    # is masked
+    max_days = max(days_permonth)
+    slots = np.concatenate([month * max_days + np.arange(days)
+                            for month, days in enumerate(days_permonth)])
+    by_month = np.ma.masked_all((len(days_permonth) * max_days,)
+                                + data.shape[1:], dtype=dtype)
+    by_month[slots] = daily
+    return _mean(by_month.reshape((len(days_permonth), max_days)
+                                  + data.shape[1:]), 1, dtype)
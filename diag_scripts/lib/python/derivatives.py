@@ -0,0 +1,126 @@
+"""
+Centered finite differences on (..., lat, lon) grids
+
+The derivative at a grid point is the difference between its two
+neighbours divided by their (great-circle) distance in meters. The
+distances are computed once per grid and cached. The differences of
+whole (..., lat, lon) stacks, e.g., all time steps, are then taken with
+array operations.
+
+Longitudes can be treated as periodic (global grids). Otherwise, and
+always for latitudes, derivatives are given for the inner points only,
+i.e., the result is one point shorter at each end of the axis (e.g.,
+the data has ghost layers).
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+
+# Neighbour distances computed so far, keyed by the coordinates
+_metrics = {}
+
+
+def distance(lat1, lat2, lon1, lon2):
+    """Returns the great-circle distance in meters between coordinates
+    in degrees (haversine formula, arrays are broadcast)."""
+    lat1, lat2, lon1, lon2 = [np.radians(np.asarray(coords, dtype=np.float64))
+                              for coords in [lat1, lat2, lon1, lon2]]
+    hav = (np.sin((lat2 - lat1) / 2) ** 2
+           + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(hav, 1.0)))
+
+
+def grid_metrics(lats, lons, periodic=False):
+    """Returns the distances between the neighbours of the grid points.
+
+    Parameters
+    ----------
+    lats, lons : array
+        coordinates of the grid (need not be regular)
+    periodic : bool
+        whether the first and the last longitude are neighbours
+
+    Returns
+    -------
+    (dx, dy) with dx (lat, lon) the distances between the longitude
+    neighbours, lon - 2 inner points if not periodic, and dy (lat - 2, 1)
+    the distances between the latitude neighbours
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    key = (lats.tostring(), lons.tostring(), periodic)
+    if key in _metrics:
+        return _metrics[key]
+
+    if periodic:
+        west, east = np.roll(lons, 1), np.roll(lons, -1)
+    else:
+        west, east = lons[:-2], lons[2:]
+    dx = distance(lats[:, None], lats[:, None], west[None, :], east[None, :])
+    dy = distance(lats[:-2], lats[2:], 0., 0.)[:, None]
+
+    _metrics[key] = (dx, dy)
+    return _metrics[key]
+
+
+def d_dlon(data, lats, lons, periodic=False):
+    """Returns the derivative along the longitudes (per meter).
+
+    Parameters
+    ----------
+    data : array (..., lat, lon)
+    lats, lons : array
+        coordinates of data
+    periodic : bool
+        whether the first and the last longitude are neighbours
+
+    Returns
+    -------
+    array (..., lat, lon), lon - 2 inner longitudes if not periodic
+    """
+    dx = grid_metrics(lats, lons, periodic)[0]
+    if periodic:
+        return (np.roll(data, -1, axis=-1) - np.roll(data, 1, axis=-1)) / dx
+    return (data[..., 2:] - data[..., :-2]) / dx
+
+
+def d_dlat(data, lats, lons):
+    """Returns the derivative along the latitudes (per meter).
+
+    Parameters
+    ----------
+    data : array (..., lat, lon)
+    lats, lons : array
+        coordinates of data
+
+    Returns
+    -------
+    array (..., lat - 2, lon) for the inner latitudes
+    """
+    dy = grid_metrics(lats, lons)[1]
+    return (data[..., 2:, :] - data[..., :-2, :]) / dy
+
+
+def divergence(u, v, lats, lons, periodic=False):
+    """Returns the horizontal divergence du/dx + dv/dy (per second for
+    winds in m/s) at the inner points.
+
+    Parameters
+    ----------
+    u, v : array (..., lat, lon)
+        eastward and northward components
+    lats, lons : array
+        coordinates of u and v
+    periodic : bool
+        whether the first and the last longitude are neighbours
+
+    Returns
+    -------
+    array (..., lat - 2, lon), lon - 2 inner longitudes if not periodic
+    """
+    du = d_dlon(u, lats, lons, periodic)[..., 1:-1, :]
+    dv = d_dlat(v, lats, lons)
+    if not periodic:
+        dv = dv[..., 1:-1]
+    return du + dv
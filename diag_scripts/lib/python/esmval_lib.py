@@ -6,7 +6,9 @@ import ConfigParser
 import os
 import pdb
 import sys
+import climatology
 import projects
+import region_reader
 import numpy as np
 
 from netCDF4 import Dataset
@@ -36,40 +38,20 @@ class ESMValProject(object):
         else:
             return p + os.sep
 
-    def average_data(self, data, dim_index):
-        """Returns the mean values over certain dimensions. """
+    def average_data(self, data, dim_index, dtype=np.float64):
+        """Returns the mean values over certain dimensions.
+
+        dim_index is the dimension to keep (int), 'monthly' for the mean
+        of each calendar month or 'annual' for the mean annual cycle of
+        each grid point, see climatology.py. dtype is the type used for
+        the accumulation (e.g., np.float32 for big fields)."""
         # Usually the input array is three dimensional (time, lats, lons)
         if   (type(dim_index) == int):
-            means = np.zeros(data.shape[dim_index])
-            for mean in xrange(len(means)):
-                if (dim_index == 0):
-                    means[mean] = np.mean(data[mean, :, :])
-                if (dim_index == 1):
-                    means[mean] = np.mean(data[:, mean, :])
-                if (dim_index == 2):
-                    means[mean] = np.mean(data[:, :, mean])
+            means = climatology.dimension_means(data, dim_index, dtype)
         elif (dim_index == 'monthly'):
-            means = np.zeros(12)
-            for month in xrange(12):
-                means[month] = np.mean(data[month::12, :, :])
-        elif (dim_index == 'annual'):
-            new_shape = data.shape
-            new_shape = list(new_shape)
-            new_shape[0] = 12
-            means = np.zeros((new_shape))
-            for month in xrange(12):
-                for lat in xrange(means.shape[1]):
-                    for lon in xrange(means.shape[2]):
-                        means[month, lat, lon] = np.mean(data[month::12, lat, lon])
+            means = climatology.monthly_means(data, dtype)
         elif (dim_index == 'annual'):
-            new_shape = data.shape
-            new_shape = list(new_shape)
-            new_shape[0] = 12
-            means = np.zeros((new_shape))
-            for month in xrange(12):
-                for lat in xrange(means.shape[1]):
-                    for lon in xrange(means.shape[2]):
-                        means[month, lat, lon] = np.mean(data[month::12, lat, lon])
+            means = climatology.monthly_climatology(data, dtype)
         return means
 
     def check_model_instances(self, first_set, second_set):
@@ -118,33 +100,27 @@ class ESMValProject(object):
                                      data,
                                      experiment,
                                      season,
-                                     monthly=False):
+                                     monthly=False,
+                                     dtype=np.float64):
         """Returns the season specific mean values for each lat, lon from data.
         We assume the usual indexing of time, lat, lon"""
         season_key = experiment + '_season_' + season
-        data_shape = data.shape
 
         if (season == 'annual'):
             # For annual season we merely copy the data
-            masked_values = data
+            season_months = None
         else:
             # For a specific season we mask the undesired values
-            season_months = modelconfig.get(season_key, 'season_months').split()
-            mask = np.ones((data_shape))
-            for month in season_months:
-                month_loc = int(month) - 1
-                mask[month_loc::12, :, :] = 0
-            masked_values = np.ma.masked_array(data, mask)
+            season_months = [int(month) for month in
+                             modelconfig.get(season_key, 'season_months').split()]
 
         if (monthly):
-            return masked_values
+            if season_months is None:
+                return data
+            return climatology.mask_season(data, season_months)
 
-        mean_values = np.zeros((data_shape[1], data_shape[2]))
         # Seasonal mean values
-        for lat in xrange(data_shape[1]):
-            for lon in xrange(data_shape[2]):
-                mean_values[lat, lon] = masked_values[:, lat, lon].mean()
-        return mean_values
+        return climatology.seasonal_mean(data, season_months, dtype)
 
     def find_nearest_value(self, array, value):
         """ Finds the nearest value in an array. """
@@ -203,7 +179,6 @@ class ESMValProject(object):
             returned values are monthly (e.g. monthly=True)
             returns 12 fields of data
         """
-        import projects
         if variable is None:
             raise ValueError('You need to specify a variable!')
 
@@ -215,7 +190,7 @@ class ESMValProject(object):
             exp = currDiag.get_var_attr_exp()
             for idx in range(len(variables)):
                 for model in self.project_info['MODELS']:
-                    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+                    currProject = model.get_project()
                     fullpath = currProject.get_cf_fullpath(self.project_info,
                                                            model,
                                                            field_types[idx],
@@ -303,11 +278,44 @@ class ESMValProject(object):
         """
         return self.project_info['GLOBAL']['output_file_type']
 
+    def get_intermediate_dir(self):
+        """ returns the directory of the intermediate arrays handed from one
+        diagnostic to another (see intermediate_store.py) """
+        return self.get_work_dir() + 'intermediate' + os.sep
+
     def get_model_data(self, modelconfig, experiment, area,
                        datakey, datafile, extend=''):
         """Extracts desired data for a specific area for a model from all
         model data. Also extends lat/lon coordinates (and therefore required
-        values) if specified (these area "ghostlayers" for interpolation)."""
+        values) if specified (these area "ghostlayers" for interpolation).
+        Only the area is read from the file (see region_reader.py)."""
+        lats_req, lons_req, lat_pieces, lon_pieces = \
+            self.get_model_region(modelconfig, experiment, area,
+                                  datafile, extend)
+
+        data = region_reader.read_region(datafile.variables[datakey],
+                                         lat_pieces, lon_pieces)
+        data = self.mask_configured_values(modelconfig, data)
+
+        # Specify what to return based on the experiment
+        # Zonal means want latitudes as well
+        if   (experiment == 'zonal_means'):
+            return lats_req, data
+
+        # Equatorial and Southern Hemisphere need all
+        elif (experiment == 'equatorial'
+                or experiment == 'SouthernHemisphere'):
+            return lats_req, lons_req, data
+
+        # The scatterplots are fine with just the data
+        else:
+            return data
+
+    def get_model_region(self, modelconfig, experiment, area,
+                         datafile, extend=''):
+        """Returns the lats and lons of an area and the index pieces to read
+        it (see region_reader.py), including the ghost layers given by extend
+        ('lats', 'lons' or 'both')."""
         lats = datafile.variables['lat'][:]
         lons = datafile.variables['lon'][:]
 
@@ -335,87 +343,29 @@ class ESMValProject(object):
                 ilist[3] += 1
                 indices = tuple(ilist)
 
-        # Next extract required lats and lons, the breaks are needed for
-        # special cases when we have to loop over lats and/or lons without
-        # taking all the values
-        lat_break = len(lats) - indices[0]
-        lon_break = len(lons) - indices[2]
-
-        if   (indices[0] > indices[1] and indices[2] > indices[3]):
-            # Both are looped
-            lats_req = np.zeros(len(lats) - indices[0] + indices[1] + 1)
-            lats_req[:lat_break] = lats[indices[0]:]
-            lats_req[lat_break:] = lats[:indices[1] + 1]
-
-            lons_req = np.zeros(len(lons) - indices[2] + indices[3] + 1)
-            lons_req[:lon_break] = lons[indices[2]:]
-            lons_req[lon_break:] = lons[:indices[3] + 1]
+        # Ranges looping over the end of the lats and/or lons are read
+        # in two pieces
+        lat_pieces = region_reader.index_pieces(indices[0], indices[1])
+        lon_pieces = region_reader.index_pieces(indices[2], indices[3])
+        lats_req = region_reader.take_pieces(lats, lat_pieces)
+        lons_req = region_reader.take_pieces(lons, lon_pieces)
 
-        elif (indices[0] > indices[1] and indices[2] <= indices[3]):
-            # Only lats are looped
-            lats_req = np.zeros(len(lats) - indices[0] + indices[1] + 1)
-            lats_req[:lat_break] = lats[indices[0]:]
-            lats_req[lat_break:] = lats[:indices[1] + 1]
-
-            lons_req = lons[indices[2]:indices[3] + 1]
-
-        elif (indices[0] <= indices[1] and indices[2] > indices[3]):
-            # Only lons are looped
-            lats_req = lats[indices[0]:indices[1] + 1]
-
-            lons_req = np.zeros(len(lons) - indices[2] + indices[3] + 1)
-            lons_req[:lon_break] = lons[indices[2]:]
-            lons_req[lon_break:] = lons[:indices[3] + 1]
+        # Ghost layers for global longtitude values, the last/first column
+        # is read once more on either side
+        if (lon_global is True):
+            lon_pieces = [slice(indices[3], indices[3] + 1)] + lon_pieces \
+                + [slice(indices[2], indices[2] + 1)]
+            newlons = np.zeros(len(lons_req) + 2)
+            newlons[0] = lons_req[-1] - 360
+            newlons[1:-1] = lons_req
+            newlons[-1] = lons_req[0] + 360
+            lons_req = newlons
 
-        else:
-            # Neither are looped
-            lats_req = lats[indices[0]:indices[1] + 1]
-            lons_req = lons[indices[2]:indices[3] + 1]
-
-        # Read in the required data for a specific model.
-        # We have to define some special cases when there's looping over
-        # latitudes or longtitudes.
-        data = np.zeros((datafile.variables[datakey].shape[0],
-                         lats_req.shape[0], lons_req.shape[0]))
-
-        if (indices[0] > indices[1] and indices[2] > indices[3]):
-            # Extract the four corners from the nc file
-            data[:, :lat_break, :lon_break] = \
-                datafile.variables[datakey][:, indices[0]:, indices[2]:]
-
-            data[:, :lat_break, lon_break:] = \
-                datafile.variables[datakey][:, indices[0]:, :indices[3] + 1]
-
-            data[:, lat_break:, :lon_break] = \
-                datafile.variables[datakey][:, :indices[1] + 1, indices[2]:]
-
-            data[:, lat_break:, lon_break:] = \
-                datafile.variables[datakey][:, :indices[1] + 1, :indices[3] + 1]
-
-        elif (indices[0] > indices[1] and indices[2] <= indices[3]):
-            # Looping only over lats
-            data[:, :lat_break, :] = \
-                datafile.variables[datakey][:, indices[0]:,
-                                            indices[2]:indices[3] + 1]
-
-            data[:, lat_break:, :] = \
-                datafile.variables[datakey][:, :indices[1] + 1,
-                                            indices[2]:indices[3] + 1]
-
-        elif (indices[0] <= indices[1] and indices[2] > indices[3]):
-            # Looping only over lons
-            data[:, :, :lon_break] = \
-                datafile.variables[datakey][:, indices[0]:indices[1] + 1,
-                                            indices[2]:]
-
-            data[:, :, lon_break:] = \
-                datafile.variables[datakey][:, indices[0]:indices[1] + 1,
-                                            :indices[3] + 1]
-        else:
-            data = datafile.variables[datakey][:, indices[0]:indices[1] + 1,
-                                               indices[2]:indices[3] + 1]
+        return lats_req, lons_req, lat_pieces, lon_pieces
 
-        # Now we mask unwanted values if specified
+    def mask_configured_values(self, modelconfig, data):
+        """Masks the values outside of the limits given in the general
+        section of the config file (if mask_unwanted_values is set)."""
         mask = modelconfig.getboolean('general', 'mask_unwanted_values')
         if (mask is True):
             # enquire what to do
@@ -433,33 +383,7 @@ class ESMValProject(object):
                 data = self.mask_unwanted_values(data, high=high)
             elif (llow):
                 data = self.mask_unwanted_values(data, low=low)
-
-        # Ghost layers for global longtitude values
-        if (lon_global is True):
-            newlons = np.zeros(len(lons_req) + 2)
-            newdata = np.zeros((data.shape[0], data.shape[1], data.shape[2] + 2))
-            newlons[0] = lons_req[-1] - 360
-            newlons[1:-1] = lons_req
-            newlons[-1] = lons_req[0] + 360
-            newdata[:, :, 0] = data[:, :, -1]
-            newdata[:, :, 1:-1] = data[:, :, :]
-            newdata[:, :, -1] = data[:, :, 0]
-            lons_req = newlons
-            data = newdata
-
-        # Specify what to return based on the experiment
-        # Zonal means want latitudes as well
-        if   (experiment == 'zonal_means'):
-            return lats_req, data
-
-        # Equatorial and Southern Hemisphere need all
-        elif (experiment == 'equatorial'
-                or experiment == 'SouthernHemisphere'):
-            return lats_req, lons_req, data
-
-        # The scatterplots are fine with just the data
-        else:
-            return data
+        return data
 
     def get_model_id(self, inmodel):
         """ Returns the id tag of the model if defined and empty string if not.
@@ -740,7 +664,6 @@ class ESMValProject(object):
         This is usefull if entire processing (including preprocessing)
         shall be done in the diag script itself
         """
-        import projects
 
 
         res={}
@@ -756,7 +679,7 @@ class ESMValProject(object):
                 for model in self.project_info['MODELS']:
                         #~ print model.split_entries()[0] # gives 'JSBACH'
                         #~ print vars()
-                        currProject = getattr(vars()['projects'], model.split_entries()[0])()
+                        currProject = model.get_project()
                         variable_defs_base_vars = currDiag.add_base_vars_fields(requested_vars, model)
 
                         base_vars = currDiag.select_base_vars(variable_defs_base_vars, model,
@@ -0,0 +1,159 @@
+"""
+Typed store for the intermediate arrays handed from one diagnostic to another
+
+Each entry of the store is a set of named arrays, saved as one plain .npy
+file per array (no pickled objects), such that the reading diagnostic can
+memory-map just the arrays it needs. A small index (index.json) in the
+store directory lists the entries with their arrays and a signature of
+the inputs they were computed from (see signature).
+
+The entries written (or reused) since the reading diagnostic last released
+them are active, names lists only those. Released entries are kept on disk:
+a later run with the same inputs (same signature) can reuse them instead
+of computing the arrays again.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+
+INDEX_NAME = 'index.json'
+INDEX_VERSION = 1
+
+
+def signature(paths, settings=None):
+    """Returns the signature of the inputs of an entry.
+
+    Parameters
+    ----------
+    paths : list of str
+        the input files, taken as (path, size, mtime)
+    settings : dict
+        any other (JSON serializable) settings, e.g., config options
+
+    Returns
+    -------
+    str, SHA-1 over the current state of the inputs
+    """
+    state = {'paths': [], 'settings': settings}
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            state['paths'].append([path, stat.st_size, stat.st_mtime])
+        else:
+            state['paths'].append([path, None, None])
+    return hashlib.sha1(json.dumps(state, sort_keys=True)).hexdigest()
+
+
+@contextlib.contextmanager
+def _index(directory):
+    """ Locked read-modify-write access to the index of a store """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, INDEX_NAME + '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index_file = os.path.join(directory, INDEX_NAME)
+        entries = {}
+        if os.path.isfile(index_file):
+            with open(index_file) as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION:
+                entries = index['entries']
+        before = json.dumps(entries, sort_keys=True)
+        yield entries
+        if json.dumps(entries, sort_keys=True) != before:
+            tmp_file = index_file + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'entries': entries},
+                          f, indent=1, sort_keys=True)
+            os.rename(tmp_file, index_file)
+
+
+def save(directory, name, arrays, inputs=None):
+    """Saves the arrays of an entry (replacing it) and activates it.
+
+    Parameters
+    ----------
+    directory : str
+        the store directory
+    name : str
+        name of the entry
+    arrays : dict
+        the arrays by name, masked values are saved as NaN
+    inputs : str
+        signature of the inputs, see signature
+    """
+    with _index(directory) as entries:
+        files = {}
+        for key, array in arrays.items():
+            if np.ma.isMaskedArray(array):
+                array = np.ma.filled(array.astype(np.float64), np.nan)
+            files[key] = name + '.' + key + '.npy'
+            np.save(os.path.join(directory, files[key]), np.asarray(array))
+        entries[name] = {'arrays': files, 'inputs': inputs, 'active': True}
+
+
+def reuse(directory, name, inputs):
+    """Activates an entry if it was computed from the same inputs.
+
+    Returns
+    -------
+    bool, whether the entry can be reused (otherwise it is to be saved)
+    """
+    with _index(directory) as entries:
+        entry = entries.get(name)
+        if (entry is None or inputs is None or entry['inputs'] != inputs):
+            return False
+        for filename in entry['arrays'].values():
+            if not os.path.isfile(os.path.join(directory, filename)):
+                return False
+        entry['active'] = True
+        return True
+
+
+def names(directory, prefix=''):
+    """Returns the names of the active entries starting with prefix."""
+    with _index(directory) as entries:
+        return sorted([str(name) for name in entries
+                       if name.startswith(prefix) and entries[name]['active']])
+
+
+def load(directory, name, keys=None, mmap_mode='r'):
+    """Returns the arrays of an entry.
+
+    Parameters
+    ----------
+    directory : str
+        the store directory
+    name : str
+        name of the entry
+    keys : list of str
+        the arrays to load, all if not given
+    mmap_mode : str
+        see np.load, by default the arrays are memory-mapped read-only
+
+    Returns
+    -------
+    dict of arrays
+    """
+    with _index(directory) as entries:
+        files = entries[name]['arrays']
+    if keys is None:
+        keys = files.keys()
+    return dict([(key, np.load(os.path.join(directory, files[key]),
+                               mmap_mode=mmap_mode))
+                 for key in keys])
+
+
+def release(directory, prefix=''):
+    """Deactivates the entries starting with prefix, the arrays are kept
+    for reuse."""
+    with _index(directory) as entries:
+        for name in entries:
+            if name.startswith(prefix):
+                entries[name]['active'] = False
@@ -0,0 +1,82 @@
+"""
+Sampling of 3-hourly (time, lat, lon) fields at a local solar time
+
+For each longitude the time step closest to (not after) the local time
+is looked up once, counted within a window of three UTC days (the day
+before, the day itself and the day after). The daily values of all
+points are then gathered with strided slices of the time axis, one per
+distinct step, instead of weighting all steps of each window.
+"""
+
+import numpy as np
+
+# 3-hourly data
+STEPS_PERDAY = 8
+
+
+def local_time_steps(lon, local_time, start_time):
+    """Returns the time step of a local time within a 3 day window.
+
+    Parameters
+    ----------
+    lon : array
+        longitudes in degrees east, [0, 360] or [-180, 180]
+    local_time : float
+        local solar time in hours, e.g., 6.
+    start_time : float
+        hour (UTC) of the first time step of the data
+
+    Returns
+    -------
+    array of int (lon), step of the local time in the window of three
+    days starting with the day before
+    """
+    hours_perday = 24.0
+    time_loc_sol = local_time + 3 - start_time
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lon = np.where(lon >= 180.0, lon - 360.0, lon)
+
+    utc_time = time_loc_sol - (lon * hours_perday / 360.0)
+    steps = np.modf(utc_time * STEPS_PERDAY / hours_perday
+                    + STEPS_PERDAY)[1].astype(int)
+
+    # Convert local day to UTC day east of the longitude at which the
+    # local day changes, and take the step before at the longitudes on
+    # a step boundary (multiples of 45 degrees)
+    lon_day_change = (time_loc_sol / 3.0) * 45
+    steps[(lon >= lon_day_change) & (lon <= lon_day_change + 90)] += STEPS_PERDAY
+    steps[np.in1d(lon, np.arange(-180, 180, 45))] -= 1
+
+    return steps % (3 * STEPS_PERDAY)
+
+
+def sample_local_time(data, steps, lat_index, lon_index):
+    """Returns the daily values of points at the local time.
+
+    Parameters
+    ----------
+    data : array (time, lat, lon)
+        3-hourly data, masked values are taken as 0
+    steps : array of int (lon)
+        see local_time_steps
+    lat_index, lon_index : array of int
+        the points to sample
+
+    Returns
+    -------
+    array (day, point) of float64 for the days with a full window, i.e.,
+    all days but the first and the last one
+    """
+    n_days = len(xrange(0, data.shape[0] - 2 * STEPS_PERDAY, STEPS_PERDAY))
+    lat_index = np.asarray(lat_index)
+    lon_index = np.asarray(lon_index)
+    point_steps = steps[lon_index]
+
+    values = np.empty((n_days, len(lon_index)), dtype=np.float64)
+    for step in np.unique(point_steps):
+        points = np.flatnonzero(point_steps == step)
+        days = slice(step, step + STEPS_PERDAY * n_days, STEPS_PERDAY)
+        values[:, points] = np.ma.filled(
+            data[days][:, lat_index[points], lon_index[points]], 0.)
+    return values
@@ -0,0 +1,173 @@
+"""
+Permutation test of the difference between the means of two samples
+
+The permutations of a test are drawn all at once: only the (random)
+subset of the values taking the place of the first sample is drawn for
+each permutation, the second sample is the rest. Each test (e.g., each
+grid-box) has its own random generator, such that the results do not
+depend on the order or the number of processes the tests are run in.
+
+sm_pr_diag_nml.py computes the p_values of the "preference for afternoon
+precipitation over soil moisture anomalies" (Fig. 3 of Taylor et al.
+2012, doi:10.1038/nature11377) per 5x5 deg grid-box with get_p_val.
+"""
+
+import multiprocessing
+
+import numpy as np
+
+
+def random_subsets(n, k, size, rs):
+    """Returns random subsets of k out of n values.
+
+    Parameters
+    ----------
+    n : int
+        number of values to choose from
+    k : int
+        number of values per subset
+    size : int
+        number of subsets
+    rs : np.random.RandomState
+        (seeded) random generator
+
+    Returns
+    -------
+    int array (size, k) with the indices of the values of each subset
+
+    Notes
+    -----
+    Floyd's algorithm is run for all subsets at once, it draws [size]
+    indices min(k, n - k) times, and for k > n / 2 the subsets are the
+    complements of the drawn ones. Its cost grows with the square of the
+    number of draws, so for many draws the subsets are taken from an
+    argsort of random keys instead.
+    """
+    draws = min(k, n - k)
+    if draws * draws > 8 * n:
+        return np.argsort(rs.rand(size, n), axis=1)[:, :k]
+
+    drawn = np.empty((size, draws), dtype=np.intp)
+    for i, j in enumerate(xrange(n - draws, n)):
+        t = rs.randint(0, j + 1, size)
+        taken = (drawn[:, :i] == t[:, None]).any(axis=1)
+        drawn[:, i] = np.where(taken, j, t)
+    if draws == k:
+        return drawn
+
+    rest = np.ones((size, n), dtype=bool)
+    rest[np.arange(size)[:, None], drawn] = False
+    return np.nonzero(rest)[1].reshape(size, k)
+
+
+def permutation_p_val(events, non_events, shuffle_times, rs):
+    """Returns the rank of the difference between the means of two samples
+    among the differences of their permutations.
+
+    Parameters
+    ----------
+    events, non_events : array
+        the two samples
+    shuffle_times : int
+        number of permutations
+    rs : np.random.RandomState
+        (seeded) random generator
+
+    Returns
+    -------
+    float, the position of the permuted delta closest to delta =
+    mean(events) - mean(non_events) among the sorted permuted deltas (the
+    first position of its value, the lower one on ties), divided by
+    shuffle_times
+    """
+    n_ev = len(events)
+    all_ev_nev = np.concatenate((events, non_events))
+    total = np.sum(all_ev_nev)
+
+    delta = np.mean(events) - np.mean(non_events)
+
+    shuffled = random_subsets(len(all_ev_nev), n_ev, shuffle_times, rs)
+    sev_sums = np.sum(all_ev_nev[shuffled], axis=1)
+    sdeltas = np.sort(sev_sums / n_ev
+                      - (total - sev_sums) / (len(all_ev_nev) - n_ev))
+
+    # Closest shuffled delta (the lower one on ties), and the first
+    # position of its value
+    k = np.searchsorted(sdeltas, delta)
+    candidates = [i for i in (k - 1, k) if i >= 0 and i < len(sdeltas)]
+    closest = min(candidates, key=lambda i: abs(sdeltas[i] - delta))
+    rank = np.searchsorted(sdeltas, sdeltas[closest], side='left')
+
+    return rank / float(shuffle_times)
+
+
+def get_box_p_val(args):
+    """Returns the p-value of one grid-box.
+
+    Parameters
+    ----------
+    args : tuple
+        (events, non events, shuffle_times, seed) of the grid-box
+
+    Returns
+    -------
+    float, -999. if the grid-box has less than 25 events or no non events
+    """
+    events, non_events, shuffle_times, seed = args
+
+    # Minumun number of event to consider the gridbox = 25
+    if len(events) <= 24 or len(non_events) == 0:
+        return -999.
+
+    return permutation_p_val(events, non_events, shuffle_times,
+                             np.random.RandomState(seed))
+
+
+def get_p_val(boxes, shuffle_times=500, seed=0, processes=1):
+    """Returns the p-values of the grid-boxes.
+
+    Parameters
+    ----------
+    boxes : dict
+        list of (non events, events) arrays, e.g., one per month, of each
+        grid-box (x, y)
+    shuffle_times : int
+        number of permutations per grid-box
+    seed : int
+        seed of the permutations
+    processes : int
+        number of worker processes, 1 for a serial run
+
+    Returns
+    -------
+    (xs, ys, p_vals) with the x and y indices of the grid-boxes and the
+    list of their p-values (x outer, y inner)
+
+    Notes
+    -----
+    Each grid-box has its own random generator, seeded with (seed, x, y),
+    hence the results do not depend on the number of processes.
+    """
+    xs = np.unique([x for x, y in boxes])
+    ys = np.unique([y for x, y in boxes])
+
+    # Events and non events of all months per gridbox
+    tasks = []
+    for x in xs:
+        for y in ys:
+            months = boxes.get((x, y), [])
+            non_events = np.concatenate([nev for nev, ev in months] + [[]])
+            events = np.concatenate([ev for nev, ev in months] + [[]])
+            tasks.append((events, non_events, shuffle_times, [seed, x, y]))
+
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            p_vals = pool.map(get_box_p_val, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        p_vals = map(get_box_p_val, tasks)
+
+    return xs, ys, p_vals
@@ -0,0 +1,238 @@
+"""
+Rasterized region masks of shapefile polygons
+
+The regions of a shapefile are rasterized on a (lat, lon) grid into label
+grids: label r marks the grid points inside region r (-1: no region). A
+point covered by several (overlapping) regions gets a label in as many
+layers, labels are therefore arrays (layer, lat, lon) with usually a
+single layer.
+
+A point is inside a region if it is inside an odd number of its rings
+(ray casting along the latitude of the point, longitudes in [-180, 180)).
+All points of a latitude are tested at once: the crossings of the ring
+edges with the latitude are sorted together with the points. The label
+grids are cached on disk, keyed by the hash of the polygons and of the
+grid.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def shape_rings(shape):
+    """Returns the rings of a shapefile shape as arrays (point, [x, y]).
+
+    The closing point of each ring is left out, the rings are closed
+    implicitly.
+    """
+    breaks = list(shape.parts) + [0]
+    return [np.array([point[:2] for point in
+                      shape.points[breaks[e]:(breaks[e + 1] - 1)]],
+                     dtype=np.float64).reshape(-1, 2)
+            for e in range(len(breaks) - 1)]
+
+
+def _grid_points(lon, lat):
+    """Returns the longitudes in [-180, 180) and the latitude lines
+    (sorted unique latitudes) with the line index of each grid point."""
+    lon = np.asarray(lon).ravel()
+    lon = np.where(lon < 180, lon, lon - 360).astype(np.float64)
+    lines, line_index = np.unique(np.asarray(lat, dtype=np.float64).ravel(),
+                                  return_inverse=True)
+    return lon, lines, line_index
+
+
+def _crossings(rings, lines):
+    """Returns the line indices and longitudes of the crossings of the ring
+    edges with the latitude lines (an even number per line)."""
+    x_i = np.concatenate([ring[:, 0] for ring in rings])
+    y_i = np.concatenate([ring[:, 1] for ring in rings])
+    # Each vertex i with its previous vertex j of the ring
+    x_j = np.concatenate([np.roll(ring[:, 0], 1) for ring in rings])
+    y_j = np.concatenate([np.roll(ring[:, 1], 1) for ring in rings])
+
+    # Lines with (y_i > y) != (y_j > y)
+    first = np.searchsorted(lines, np.minimum(y_i, y_j), 'left')
+    stop = np.searchsorted(lines, np.maximum(y_i, y_j), 'left')
+    n_lines = stop - first
+    edges = np.repeat(np.arange(len(x_i)), n_lines)
+    line = first[edges] + np.arange(len(edges)) - \
+        np.repeat(np.cumsum(n_lines) - n_lines, n_lines)
+    y = lines[line]
+    x = (x_j[edges] - x_i[edges]) * (y - y_i[edges]) / \
+        (y_j[edges] - y_i[edges]) + x_i[edges]
+    return line, x
+
+
+def _inside(rings, lon, lines, line_index):
+    """Returns the indices of the grid points inside an odd number of the
+    rings."""
+    rings = [ring for ring in rings if len(ring)]
+    if not rings:
+        return np.array([], dtype=np.intp)
+    line, x = _crossings(rings, lines)
+    if not len(x):
+        return np.array([], dtype=np.intp)
+
+    # Points left of the first (right of the last) crossing are outside
+    points = np.flatnonzero((line_index >= line.min()) &
+                            (line_index <= line.max()) &
+                            (lon >= x.min()) & (lon < x.max()))
+    # The points of a line are inside if an odd number of crossings of
+    # the line are (strictly) right of them. All lines have an even
+    # number of crossings, this is the parity of the crossings before the
+    # point in the order of line, longitude (crossings first).
+    keys_line = np.concatenate([line, line_index[points]])
+    keys_x = np.concatenate([x, lon[points]])
+    is_point = np.concatenate([np.zeros(len(x), dtype=bool),
+                               np.ones(len(points), dtype=bool)])
+    order = np.lexsort((is_point, keys_x, keys_line))
+    before = np.cumsum(~is_point[order])
+    sorted_points = is_point[order]
+    odd = before[sorted_points] % 2 == 1
+    return points[order[sorted_points] - len(x)][odd]
+
+
+def _stack(members, n_points):
+    """Returns the label layers (layer, point) of the regions given by the
+    indices of their member points."""
+    depth = np.bincount(np.concatenate([np.asarray(points, dtype=np.intp)
+                                        for points in members] +
+                                       [np.array([], dtype=np.intp)]),
+                        minlength=n_points)
+    labels = np.empty((max(1, depth.max()), n_points), dtype=np.int32)
+    labels[:] = -1
+    depth[:] = 0
+    for region, points in enumerate(members):
+        labels[depth[points], points] = region
+        depth[points] += 1
+    return labels
+
+
+def rasterize(polygons, lon, lat):
+    """Returns the label grids of regions.
+
+    Parameters
+    ----------
+    polygons : list
+        the rings (see shape_rings) of each region
+    lon, lat : array (lat, lon)
+        coordinates of the grid points
+
+    Returns
+    -------
+    array (layer, lat, lon) of int32 labels, the index of the region in
+    polygons or -1
+    """
+    lon, lines, line_index = _grid_points(lon, lat)
+    members = [_inside(rings, lon, lines, line_index) for rings in polygons]
+    return _stack(members, lon.size).reshape((-1,) + np.shape(lat))
+
+
+def signature(polygons, lon, lat):
+    """Returns the cache key (SHA-1) of the polygons and the grid."""
+    key = hashlib.sha1(str(CACHE_VERSION))
+    for rings in polygons:
+        key.update('region %d' % len(rings))
+        for ring in rings:
+            key.update(np.ascontiguousarray(ring, dtype=np.float64).tostring())
+            key.update('ring')
+    for coordinates in (lon, lat):
+        coordinates = np.asarray(coordinates)
+        key.update(str(coordinates.shape) + str(coordinates.dtype))
+        key.update(np.ascontiguousarray(coordinates).tostring())
+    return key.hexdigest()
+
+
+def labels(polygons, lon, lat, cache_dir=None):
+    """Returns the label grids of regions (see rasterize), read from or
+    written to the cache directory if given."""
+    if cache_dir is None:
+        return rasterize(polygons, lon, lat)
+
+    cache_file = os.path.join(cache_dir, 'regions_' +
+                              signature(polygons, lon, lat) + '.npy')
+    if os.path.isfile(cache_file):
+        return np.load(cache_file)
+
+    result = rasterize(polygons, lon, lat)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.save(f, result)
+    os.rename(tmp_file, cache_file)
+    return result
+
+
+def from_masks(masks):
+    """Returns the label grids of regions given by masks (lat, lon), True
+    outside the region (at least one region)."""
+    shape = np.shape(masks[0])
+    members = [np.flatnonzero(~np.asarray(mask, dtype=bool).ravel())
+               for mask in masks]
+    return _stack(members, int(np.prod(shape))).reshape((-1,) + shape)
+
+
+def statistics(data, labels, n_regions, weights=None, total_weight=None):
+    """Returns statistics of the values of all regions (one pass per layer).
+
+    Parameters
+    ----------
+    data : (masked) array (lat, lon)
+        masked and non-finite values are left out
+    labels : array (layer, lat, lon)
+        label grids of the regions
+    n_regions : int
+    weights : array (lat, lon)
+        weights of the mean and standard deviation, e.g., cell areas
+        (default: equal weights)
+    total_weight : float
+        divisor of the weighted sums instead of the weights of the valid
+        values of each region
+
+    Returns
+    -------
+    (minimum, mean, maximum, std, count) arrays (region), NaN for
+    regions without valid values
+    """
+    values = np.ma.getdata(data).ravel().astype(np.float64)
+    valid = ~np.ma.getmaskarray(data).ravel() & np.isfinite(values)
+    if weights is None:
+        weights = np.ones(values.shape)
+    weights = np.asarray(weights, dtype=np.float64).ravel()
+
+    count = np.zeros(n_regions, dtype=np.int64)
+    sums = np.zeros((3, n_regions))
+    minimum = np.empty(n_regions)
+    minimum[:] = np.nan
+    maximum = minimum.copy()
+    for layer in np.reshape(labels, (len(labels), -1)):
+        selected = (layer >= 0) & valid
+        region = layer[selected]
+        if not region.size:
+            continue
+        x = values[selected]
+        w = weights[selected]
+        count += np.bincount(region, minlength=n_regions)
+        for i, term in enumerate([w, w * x, w * x * x]):
+            sums[i] += np.bincount(region, term, minlength=n_regions)
+        order = np.argsort(region, kind='mergesort')
+        region = region[order]
+        x = x[order]
+        starts = np.flatnonzero(np.r_[True, region[1:] != region[:-1]])
+        minimum[region[starts]] = np.fmin(minimum[region[starts]],
+                                          np.minimum.reduceat(x, starts))
+        maximum[region[starts]] = np.fmax(maximum[region[starts]],
+                                          np.maximum.reduceat(x, starts))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        divisor = sums[0] if total_weight is None else total_weight
+        mean = np.where(count > 0, sums[1] / divisor, np.nan)
+        std = np.where(count > 0,
+                       np.sqrt(sums[2] / divisor - mean ** 2), np.nan)
+    return minimum, mean, maximum, std, count
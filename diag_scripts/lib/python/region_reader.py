@@ -0,0 +1,157 @@
+"""
+Windowed reads of (time, lat, lon) regions from NetCDF variables
+
+A region is given per horizontal dimension as a list of index pieces
+(slices), e.g., a longitude range crossing the end of the axis is read
+as [slice(start, None), slice(None, end + 1)] and a global longitude
+axis with ghost layers as [slice(-1, None), slice(None), slice(0, 1)].
+The pieces are read hyperslab by hyperslab (time outermost, in storage
+order) directly into the result, which keeps the type of the variable.
+iter_region reads the time axis in blocks.
+"""
+
+import numpy as np
+
+
+def index_pieces(start, end):
+    """Returns the pieces of an index range, end included.
+
+    Parameters
+    ----------
+    start, end : int
+        first and last index, start > end for a range wrapping around
+        the end of the axis
+
+    Returns
+    -------
+    list of slices
+    """
+    if (start > end):
+        return [slice(start, None), slice(None, end + 1)]
+    return [slice(start, end + 1)]
+
+
+def piece_length(piece, size):
+    """Returns the number of indices of a piece on an axis of length size."""
+    return len(xrange(*piece.indices(size)))
+
+
+def take_pieces(values, pieces):
+    """Returns the values (e.g., coordinates) of the pieces of an axis."""
+    if (len(pieces) == 1):
+        return values[pieces[0]]
+    return np.concatenate([values[piece] for piece in pieces])
+
+
+def bounding_piece(pieces_list, size):
+    """Returns the slice covering the pieces of several regions on an axis
+    of length size and the pieces of each region relative to that slice.
+
+    E.g., several areas can be read as one band and cut out of it with
+    take_region.
+    """
+    ranges = [[piece.indices(size)[:2] for piece in pieces]
+              for pieces in pieces_list]
+    start = min([first for region in ranges for first, last in region])
+    stop = max([last for region in ranges for first, last in region])
+    return slice(start, stop), [[slice(first - start, last - start)
+                                 for first, last in region]
+                                for region in ranges]
+
+
+def take_region(data, lat_pieces, lon_pieces):
+    """Returns the region of (..., lat, lon) data that is already in memory
+    (e.g., a block of the whole field), masked if data is masked."""
+    concatenate = np.ma.concatenate if np.ma.isMaskedArray(data) \
+        else np.concatenate
+    if (len(lat_pieces) > 1):
+        data = concatenate([data[..., piece, :] for piece in lat_pieces],
+                           axis=-2)
+    else:
+        data = data[..., lat_pieces[0], :]
+    if (len(lon_pieces) > 1):
+        return concatenate([data[..., piece] for piece in lon_pieces], axis=-1)
+    return data[..., lon_pieces[0]]
+
+
+def time_blocks(n_times, time_block=None):
+    """Yields slices of the time axis of at most time_block steps."""
+    if time_block is None or time_block >= n_times:
+        yield slice(None)
+        return
+    for start in xrange(0, n_times, time_block):
+        yield slice(start, min(start + time_block, n_times))
+
+
+def region_shape(variable, time_slice, lat_pieces, lon_pieces):
+    """Returns the shape of the region of one time block."""
+    return (piece_length(time_slice, variable.shape[0]),
+            sum([piece_length(piece, variable.shape[1])
+                 for piece in lat_pieces]),
+            sum([piece_length(piece, variable.shape[2])
+                 for piece in lon_pieces]))
+
+
+def _read_into(variable, time_slice, lat_pieces, lon_pieces, data):
+    """Reads the pieces of one time block into data.
+
+    Returns the mask of data, None if no value is masked.
+    """
+    mask = None
+    lat_start = 0
+    for lat_piece in lat_pieces:
+        lat_length = piece_length(lat_piece, variable.shape[1])
+        lon_start = 0
+        for lon_piece in lon_pieces:
+            lon_length = piece_length(lon_piece, variable.shape[2])
+            window = (slice(None),
+                      slice(lat_start, lat_start + lat_length),
+                      slice(lon_start, lon_start + lon_length))
+            piece = variable[time_slice, lat_piece, lon_piece]
+            data[window] = np.ma.getdata(piece)
+            if np.ma.is_masked(piece):
+                if mask is None:
+                    mask = np.zeros(data.shape, dtype=bool)
+                mask[window] = np.ma.getmaskarray(piece)
+            lon_start += lon_length
+        lat_start += lat_length
+    return mask
+
+
+def read_block(variable, time_slice, lat_pieces, lon_pieces):
+    """Reads the region of one time block.
+
+    Parameters
+    ----------
+    variable : netCDF4.Variable (time, lat, lon)
+    time_slice : slice
+    lat_pieces, lon_pieces : list of slices
+
+    Returns
+    -------
+    array (or masked array if any value is masked) of the variable type
+    """
+    if (len(lat_pieces) == 1 and len(lon_pieces) == 1):
+        return variable[time_slice, lat_pieces[0], lon_pieces[0]]
+
+    data = np.empty(region_shape(variable, time_slice, lat_pieces, lon_pieces),
+                    dtype=variable.dtype)
+    mask = _read_into(variable, time_slice, lat_pieces, lon_pieces, data)
+    if mask is not None:
+        return np.ma.masked_array(data, mask)
+    return data
+
+
+def iter_region(variable, lat_pieces, lon_pieces, time_block):
+    """Yields (time slice, data) of the region block by block.
+
+    Only one block of time_block time steps is held in memory at a time.
+    """
+    for time_slice in time_blocks(variable.shape[0], time_block):
+        yield time_slice, read_block(variable, time_slice,
+                                     lat_pieces, lon_pieces)
+
+
+def read_region(variable, lat_pieces, lon_pieces):
+    """Reads the region over the whole time axis."""
+    return read_block(variable, slice(None), lat_pieces, lon_pieces)
@@ -0,0 +1,132 @@
+"""
+Regridding between regular (rectilinear) lat/lon grids
+
+The interpolation from a source to a target grid is a sparse matrix of
+bilinear weights (four source points per target point), computed once
+per (source grid, target grid) pair and cached. It is applied to whole
+(..., lat, lon) stacks, e.g., all time steps, in a single sparse matrix
+multiplication.
+
+Target points outside of the source grid take the values of the border
+of the source grid. Masked or NaN source values are left out and the
+weights of the remaining points renormalized; target points without any
+valid source point take the value of the nearest source point (if
+valid, NaN/masked otherwise).
+"""
+
+import numpy as np
+from scipy import sparse
+
+# Weights computed so far, keyed by the source and target coordinates
+_weights = {}
+
+
+def _axis_weights(source, target):
+    """Returns the neighbouring source indices of the target values and
+    the weights of the upper neighbour (linear interpolation)."""
+    order = np.argsort(source)
+    values = np.asarray(source, dtype=np.float64)[order]
+    target = np.clip(np.asarray(target, dtype=np.float64),
+                     values[0], values[-1])
+    if (len(values) == 1):
+        zeros = np.zeros(len(target), dtype=int)
+        return order[zeros], order[zeros], np.zeros(len(target))
+    upper = np.clip(np.searchsorted(values, target), 1, len(values) - 1)
+    lower = upper - 1
+    fraction = (target - values[lower]) / (values[upper] - values[lower])
+    return order[lower], order[upper], fraction
+
+
+def get_weights(lats, lons, target_lats, target_lons):
+    """Returns the interpolation weights between two grids (cached).
+
+    Parameters
+    ----------
+    lats, lons : array
+        coordinates of the source grid
+    target_lats, target_lons : array
+        coordinates of the target grid
+
+    Returns
+    -------
+    (weights, nearest) with the sparse weight matrix (target points x
+    source points) and the index of the nearest source point of each
+    target point, both in (lat, lon) C order
+    """
+    key = tuple([(np.asarray(coords, dtype=np.float64).tostring())
+                 for coords in [lats, lons, target_lats, target_lons]])
+    if key in _weights:
+        return _weights[key]
+
+    lat_lower, lat_upper, lat_fraction = _axis_weights(lats, target_lats)
+    lon_lower, lon_upper, lon_fraction = _axis_weights(lons, target_lons)
+    n_lons = len(lons)
+    n_target = len(target_lats) * len(target_lons)
+
+    rows = []
+    cols = []
+    values = []
+    for lat_index, lat_weight in [(lat_lower, 1 - lat_fraction),
+                                  (lat_upper, lat_fraction)]:
+        for lon_index, lon_weight in [(lon_lower, 1 - lon_fraction),
+                                      (lon_upper, lon_fraction)]:
+            rows.append(np.arange(n_target))
+            cols.append((lat_index[:, None] * n_lons
+                         + lon_index[None, :]).ravel())
+            values.append((lat_weight[:, None] * lon_weight[None, :]).ravel())
+    weights = sparse.csr_matrix((np.concatenate(values),
+                                 (np.concatenate(rows), np.concatenate(cols))),
+                                shape=(n_target, len(lats) * n_lons))
+
+    nearest_lat = np.where(lat_fraction < 0.5, lat_lower, lat_upper)
+    nearest_lon = np.where(lon_fraction < 0.5, lon_lower, lon_upper)
+    nearest = (nearest_lat[:, None] * n_lons + nearest_lon[None, :]).ravel()
+
+    _weights[key] = (weights, nearest)
+    return _weights[key]
+
+
+def regrid(data, lats, lons, target_lats, target_lons):
+    """Interpolates data to a target lat/lon grid.
+
+    Parameters
+    ----------
+    data : array (..., lat, lon)
+        e.g., a single field or all time steps (time, lat, lon)
+    lats, lons : array
+        coordinates of data
+    target_lats, target_lons : array
+        coordinates of the target grid
+
+    Returns
+    -------
+    array (..., target_lat, target_lon), masked where no value could be
+    interpolated if data is masked, NaN there otherwise. data itself if
+    the grids are the same.
+    """
+    if (np.array_equal(lats, target_lats) and np.array_equal(lons, target_lons)):
+        return data
+
+    weights, nearest = get_weights(lats, lons, target_lats, target_lons)
+    stack_shape = data.shape[:-2]
+    values = np.asarray(np.ma.getdata(data), dtype=np.float64)
+    values = values.reshape(-1, data.shape[-2] * data.shape[-1]).T
+    valid = np.isfinite(values) & \
+        ~np.ma.getmaskarray(data).reshape(values.shape[::-1]).T
+
+    if valid.all():
+        result = weights.dot(values)
+    else:
+        numerator = weights.dot(np.where(valid, values, 0.))
+        denominator = weights.dot(valid.astype(np.float64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = numerator / denominator
+        missing = ~(denominator > 1e-12)
+        result[missing] = np.where(valid[nearest], values[nearest],
+                                   np.nan)[missing]
+
+    result = result.T.reshape(stack_shape + (len(target_lats),
+                                             len(target_lons)))
+    if np.ma.isMaskedArray(data):
+        return np.ma.masked_invalid(result)
+    return result
@@ -0,0 +1,301 @@
+"""
+Per-pixel trend statistics of (time, pixel) series
+
+Kendall's tau (tau-b) between two series and the linear trend of a series
+are computed for whole blocks of pixels with array operations. The blocks
+are processed one after the other, or distributed over a pool of worker
+processes if more than one is requested.
+
+Kendall's tau is computed as in scipy.stats.kendalltau (scipy 1.2, method
+'auto'): the discordant pairs are counted from the ranks of the series,
+all pixels of a block at once (see _discordant_pairs), and the p-value
+is exact for series without ties of up to 33 values and from the tie
+corrected normal approximation otherwise. The linear trend is the
+least squares fit of scipy.stats.linregress.
+
+Masked (and non-finite) values are left out of the series of a pixel.
+Pixels with too few values left (2 for tau, 3 for the trend) are skipped
+entirely, their results are NaN.
+"""
+
+import math
+import multiprocessing
+
+import numpy as np
+from scipy import special
+from scipy import stats
+
+# Number of pixels per block (and task of the worker processes)
+BLOCK_SIZE = 2048
+
+# Cumulative numbers of permutations by number of inversions computed so
+# far, keyed by the length of the series (exact p-values of tau)
+_permutation_counts = {}
+
+
+def _valid_values(data):
+    """ Values (float64) of a (time, pixel) array, NaN where masked """
+    values = np.array(np.ma.getdata(data), dtype=np.float64)
+    values[np.ma.getmaskarray(data) | ~np.isfinite(values)] = np.nan
+    return values
+
+
+def _runs(starts, valid):
+    """Returns the lengths of the runs of valid values and their pixels.
+
+    starts (pixel, time) is True for the first value of each run of equal
+    values, the valid values come first in each row.
+    """
+    n_times = starts.shape[1]
+    starts = starts.copy()
+    starts[:, 0] = True
+    first = np.flatnonzero(starts)
+    lengths = np.diff(np.append(first, starts.size))
+    keep = valid.ravel()[first]
+    return lengths[keep], (first // n_times)[keep]
+
+
+def _tie_sums(starts, valid):
+    """Returns the tie statistics of scipy's kendalltau per pixel: the
+    number of tied pairs and the sums of cnt * (cnt - 1.) * (cnt - 2) and
+    cnt * (cnt - 1.) * (2 * cnt + 5) over the groups of cnt equal values."""
+    n_pixels = starts.shape[0]
+    cnt, pixels = _runs(starts, valid)
+    ties = np.bincount(pixels, cnt * (cnt - 1) // 2, minlength=n_pixels)
+    sum0 = np.bincount(pixels, cnt * (cnt - 1.) * (cnt - 2), minlength=n_pixels)
+    sum1 = np.bincount(pixels, cnt * (cnt - 1.) * (2 * cnt + 5),
+                       minlength=n_pixels)
+    return ties.astype(np.int64), sum0, sum1
+
+
+def _starts(ordered):
+    """ First values of the runs of equal values of the (sorted) rows """
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    return starts
+
+
+def _dense_ranks(values):
+    """Returns the dense ranks (from 1) of the rows of values and the
+    tie statistics (see _tie_sums), NaN values are sorted last."""
+    order = np.argsort(values, axis=1)
+    ordered = np.take_along_axis(values, order, axis=1)
+    starts = _starts(ordered)
+    ranks = np.empty(values.shape, dtype=np.intp)
+    np.put_along_axis(ranks, order, np.cumsum(starts, axis=1), axis=1)
+    return ranks, _tie_sums(starts, ~np.isnan(ordered))
+
+
+def _discordant_pairs(ranks, valid):
+    """Returns the number of strictly decreasing pairs of the rank
+    sequences (rows, the valid values first), all pixels at once.
+
+    The sequences are processed in chunks of about sqrt(2 * time) values:
+    the pairs with the values of the previous chunks are counted from the
+    cumulative histogram of their ranks, the pairs within a chunk by
+    direct comparison.
+    """
+    n_pixels, n_times = ranks.shape
+    chunk = max(1, int(np.sqrt(2 * n_times)))
+    n_ranks = n_times + 1
+    histogram = np.zeros((n_pixels, n_ranks), dtype=np.int32)
+    offsets = np.arange(n_pixels)[:, None] * n_ranks
+    ranks = np.where(valid, ranks, 0)
+    discordant = np.zeros(n_pixels, dtype=np.int64)
+    for start in xrange(0, n_times, chunk):
+        block = ranks[:, start:start + chunk]
+        active = valid[:, start:start + chunk]
+        # Previous values (all valid) with a higher rank
+        below = np.cumsum(histogram, axis=1).ravel()[offsets + block]
+        higher = start - below
+        # Earlier values of the chunk with a higher rank
+        pairs = block[:, :, None] > block[:, None, :]
+        higher += (np.triu(np.ones(pairs.shape[1:], dtype=bool), 1)[None]
+                   & pairs).sum(axis=1)
+        discordant += np.where(active, higher, 0).sum(axis=1)
+        histogram += np.bincount((offsets + block)[active],
+                                 minlength=histogram.size) \
+            .reshape(histogram.shape).astype(np.int32)
+    return discordant
+
+
+def _permutation_cdf(size):
+    """Returns the cumulative numbers of the permutations of size values
+    by their number of inversions (scipy's recursion, exact p-values)."""
+    if size in _permutation_counts:
+        return _permutation_counts[size]
+    half = size * (size - 1) // 4
+    new = [0.0] * (half + 1)
+    new[0] = 1.0
+    new[1] = 1.0
+    for j in range(3, size + 1):
+        old = new[:]
+        for k in range(1, min(j, half + 1)):
+            new[k] += new[k - 1]
+        for k in range(j, half + 1):
+            new[k] += new[k - 1] - old[k - j]
+    _permutation_counts[size] = np.cumsum(new)
+    return _permutation_counts[size]
+
+
+def _exact_p_value(size, c):
+    """ Exact p-value of tau without ties as in scipy (c > 1 needs size < 171) """
+    if size <= 2:
+        return 1.0
+    elif c == 0:
+        return 2.0 / math.factorial(size) if size < 171 else 0.0
+    elif c == 1:
+        return 2.0 / math.factorial(size - 1) if (size - 1) < 171 else 0.0
+    return 2.0 * _permutation_cdf(size)[c] / math.factorial(size)
+
+
+def _kendall_block(args):
+    """ Kendall's tau and p-values of a block of (time, pixel) series """
+    x, y = [np.ascontiguousarray(values.T) for values in args]
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x[~valid] = np.nan
+    y[~valid] = np.nan
+    size = valid.sum(axis=1).astype(np.int64)
+
+    x_ranks, (xtie, x0, x1) = _dense_ranks(x)
+    y_ranks, (ytie, y0, y1) = _dense_ranks(y)
+    # Sort on x, then on y (the invalid values have the highest ranks)
+    keys = x_ranks * (x.shape[1] + 1) + y_ranks
+    order = np.argsort(keys, axis=1)
+    keys = np.take_along_axis(keys, order, axis=1)
+    y_sorted = np.take_along_axis(y_ranks, order, axis=1)
+    valid_sorted = np.take_along_axis(valid, order, axis=1)
+    ntie = _tie_sums(_starts(keys), valid_sorted)[0]
+
+    dis = _discordant_pairs(y_sorted, valid_sorted)
+    tot = (size * (size - 1)) // 2
+    con_minus_dis = tot - xtie - ytie + ntie - 2 * dis
+    undefined = (xtie == tot) | (ytie == tot)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tau = con_minus_dis / np.sqrt(tot - xtie) / np.sqrt(tot - ytie)
+        tau = np.clip(tau, -1., 1.)
+        var = (size * (size - 1) * (2. * size + 5) - x1 - y1) / 18. + (
+            2. * xtie * ytie) / (size * (size - 1)) + x0 * y0 / (9. *
+            size * (size - 1) * (size - 2))
+        p_value = special.erfc(np.abs(con_minus_dis) / np.sqrt(var)
+                               / np.sqrt(2))
+
+    c = np.minimum(dis, tot - dis)
+    exact = (xtie == 0) & (ytie == 0) & ((size <= 33) | (c <= 1))
+    for pixel in np.flatnonzero(exact & ~undefined):
+        p_value[pixel] = _exact_p_value(size[pixel], c[pixel])
+    tau[undefined] = np.nan
+    p_value[undefined] = np.nan
+    return tau, p_value
+
+
+def _trend_block(args):
+    """ Linear trend (slope, intercept, r, p-value) of a block of series """
+    t, y = args
+    valid = ~np.isnan(y)
+    n = valid.sum(axis=0)
+    t = np.where(valid, t[:, None], 0.)
+    y = np.where(valid, y, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = t.sum(axis=0) / n
+        y_mean = y.sum(axis=0) / n
+        t_anomaly = np.where(valid, t - t_mean, 0.)
+        y_anomaly = np.where(valid, y - y_mean, 0.)
+        ssxm = (t_anomaly ** 2).sum(axis=0) / n
+        ssym = (y_anomaly ** 2).sum(axis=0) / n
+        ssxym = (t_anomaly * y_anomaly).sum(axis=0) / n
+        r_den = np.sqrt(ssxm * ssym)
+        r = np.where(r_den == 0., 0., np.clip(ssxym / r_den, -1., 1.))
+        slope = ssxym / ssxm
+        intercept = y_mean - slope * t_mean
+        df = n - 2
+        t_value = r * np.sqrt(df / ((1.0 - r + 1.0e-20) * (1.0 + r + 1.0e-20)))
+        p_value = 2 * stats.t.sf(np.abs(t_value), df)
+    return slope, intercept, r, p_value
+
+
+def _map_blocks(function, arrays, pixels, processes, block_size):
+    """Applies function to blocks of the columns pixels of arrays (in a
+    pool of processes if processes > 1) and returns the concatenated
+    results."""
+    tasks = [tuple([array if array.ndim == 1 else array[:, pixels[start:start + block_size]]
+                    for array in arrays])
+             for start in xrange(0, len(pixels), block_size)]
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            results = pool.map(function, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(function, tasks)
+    return [np.concatenate([result[i] for result in results])
+            for i in xrange(len(results[0]))] if results else []
+
+
+def _scatter(values, pixels, n_pixels):
+    """ Results of the computed pixels in a NaN array of all pixels """
+    full = np.empty(n_pixels)
+    full[:] = np.nan
+    full[pixels] = values
+    return full
+
+
+def kendall_tau(x, y, processes=1, block_size=BLOCK_SIZE):
+    """Returns Kendall's tau and its p-value between the series of pixels.
+
+    Parameters
+    ----------
+    x, y : array (time, pixel)
+        the two series of each pixel, masked values are left out
+    processes : int
+        number of worker processes, 1 for a serial run
+    block_size : int
+        number of pixels per block
+
+    Returns
+    -------
+    (tau, p_value) arrays (pixel), NaN for skipped pixels and series with
+    only equal values
+    """
+    x = _valid_values(x)
+    y = _valid_values(y)
+    n_pixels = x.shape[1]
+    pixels = np.flatnonzero((~(np.isnan(x) | np.isnan(y))).sum(axis=0) >= 2)
+    results = _map_blocks(_kendall_block, [x, y], pixels, processes,
+                          block_size)
+    if not results:
+        results = [[], []]
+    return tuple([_scatter(values, pixels, n_pixels) for values in results])
+
+
+def linear_trend(t, data, processes=1, block_size=BLOCK_SIZE):
+    """Returns the least squares linear trend of the series of pixels.
+
+    Parameters
+    ----------
+    t : array (time)
+        the time axis, e.g., in days
+    data : array (time, pixel)
+        the series of each pixel, masked values are left out
+    processes : int
+        number of worker processes, 1 for a serial run
+    block_size : int
+        number of pixels per block
+
+    Returns
+    -------
+    (slope, intercept, r, p_value) arrays (pixel) as in
+    scipy.stats.linregress, NaN for skipped pixels
+    """
+    t = np.asarray(t, dtype=np.float64)
+    data = _valid_values(data)
+    n_pixels = data.shape[1]
+    pixels = np.flatnonzero((~np.isnan(data)).sum(axis=0) >= 3)
+    results = _map_blocks(_trend_block, [t, data], pixels, processes,
+                          block_size)
+    if not results:
+        results = [[], [], [], []]
+    return tuple([_scatter(values, pixels, n_pixels) for values in results])
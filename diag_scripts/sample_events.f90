@@ -1,20 +1,23 @@
-subroutine sample_events(nx,ny,nt,nyr,monthlysm,smbef,smaft,lon,lat,mn,filedir,daysperyear,sfiledir)
+subroutine sample_events(nx,ny,nt,nyr,max_events,nvar,nbvar,monthlysm,smbef,smaft,nsm,event_op,bevent_op,&
+                         lon,lat,mn,daysperyear,samplefile)
 implicit none
 
 
 !----------------------------------------
-! reads in text files containing details of all events defined by global_rain_sm_lgc.f90
-! and outputs ascii files containing large control sample of soil moisture anomaly differences from each event configuration
-! each filename defines x,y location and month and contains info on event at that pixel 
-! (w=wet pixel, d=dry pixels)
+! takes the details of all events defined by global_rain_sm.f90 (nsm, event_op, bevent_op)
+! and outputs a single binary file containing large control sample of soil moisture anomaly differences from each event configuration
+! for each output box: iout, jout, number of samples, number of events (4 byte integers),
+! followed by the samples and the events (4 byte reals)
+! event_op holds for each event at a pixel (w=wet pixel, d=dry pixels)
 ! 1: number of days since 31/12/02, 2: rain_w, 3: rain_d, 4: sm_w, 5: ave sm_d, 6: sm_clim_w, 7:sm_clim_d
-! 8: box-mean sm, 9:n_d, 10 onwards :pixel numbers for n dry pixels
+! 8: box-mean sm, 9:n_d, bevent_op: pixel numbers for n dry pixels
 !------------------------------------------
 
 
 ! Vars that need inputting (single month, all years)
 integer,parameter::npd=8
 integer,intent(in)::nx,ny,nt,nyr,mn,daysperyear !nyr = 1 later, but needed for testing now
+integer,intent(in)::max_events,nvar,nbvar
 !
 real,intent(in),dimension(nyr,nt,ny,nx)::monthlysm
 ! sm on last day of previous month (bef) and first day of following
@@ -22,7 +25,11 @@ real,intent(in),dimension(nyr,nt,ny,nx)::monthlysm
 real,intent(in),dimension(nyr,npd,ny,nx)::smbef,smaft
 real,intent(in),dimension(nx)::lon
 real,intent(in),dimension(ny)::lat
-character*150::filedir,sfiledir
+! events per grid cell and their details, from global_rain_sm.f90
+integer,intent(in),dimension(ny,nx)::nsm
+integer,intent(in),dimension(ny,nx,max_events,nvar)::event_op
+integer,intent(in),dimension(ny,nx,max_events,nbvar)::bevent_op
+character*256::samplefile
 
 integer,parameter::box_del2=1
 
@@ -30,12 +37,10 @@ integer,parameter::box_del2=1
 real,parameter::dlon_out=5.,dlat_out=dlon_out,lon1_out=-180.+dlon_out/2.,lat1_out=-60.+dlat_out/2.
 integer,parameter::nxout=360/dlon_out,dyout=120/dlat_out
 real::dlat
-integer::i,j,l,iop,ii,jj,s,iout,jout,jjout,jjout_old=0,ndom
+integer::i,j,l,ii,jj,s,iout,jout,jjout,jjout_old=0,ndom
 
 real::a,b, find_max_contrast,dsm,dsm_max=10.*2*1000.
 !
-character*150::event_fname
-character*2::cmon,ich,jch
 integer::ic,rw,rd,smw,smd,smw_clim,smd_clim,n,box_mean_sm,day
 integer,dimension((box_del2*2+1)**2)::k
 real,dimension(nyr,nt/npd,1-box_del2:ny+box_del2,1-box_del2:nx+box_del2)::sm
@@ -51,7 +56,6 @@ real,dimension(big,1,nxout)::event,sample
 integer,dimension(1,nxout)::nevent,nsample
 
 logical::absolute_sm, all_n=.true.,l_exclude_year=.true.
-real,dimension(ny,nx)::nsm!=0.!,smclim=0.,nclim=0.
 
 ! new vars
 real,dimension(npd*3,ny,nx)::soilmoisture !3 diurnal cycles of sm
@@ -71,19 +75,8 @@ dlat = lat(2)-lat(1)
 
 
 ! This code runs for a single month (unlike original version)
-write(cmon,'(i2.2)')mn 
 
-
-!----------------------------
-! READ number of events per grid cell per month (nsm)
-! written out by global_rain_sm_lgc.f90
-!----------------------------
-
-open(2,file=trim(filedir)//'event_output/global_rain_sm_'//cmon//'.gra',&
-             status='old', form='unformatted', access='direct', recl=4*nx*ny)
-
-read(2,rec=2) nsm(:,:)
-close(2)
+open(3,file=trim(samplefile),status='replace',access='stream',form='unformatted')
 
 
 ! set up some stuff
@@ -174,27 +167,16 @@ do j=1, ny
     do i=1, nx
 
 !
-        if(abs(nsm(j,i)).lt.epsilon(nsm(j,i))) cycle ! nsm=0: no event at this point
-
-        !-------------
-        ! OPEN EVENT FILE
-        !-------------
-
-        open(1,file=trim(event_fname(i,j,mn,filedir)),status='old',iostat=iop)
-
-        if(iop.ne.0) then
-            close(1)
-            print*,'problem with code!!! missing event file',&
-                    trim(event_fname(i,j,mn,filedir))
-            stop
-        endif
+        if(nsm(j,i).eq.0) cycle ! nsm=0: no event at this point
 !
         ! loop over all events at single location
-        do l=1,nint(nsm(j,i))
+        do l=1,nsm(j,i)
 !
-            read(1,*)ic,rw,rd,smw,smd,smw_clim,smd_clim,box_mean_sm,n
-            backspace(1)
-            read(1,*)ic,rw,rd,smw,smd,smw_clim,smd_clim,box_mean_sm,n,k(1:n)
+            ic=event_op(j,i,l,1) ; rw=event_op(j,i,l,2) ; rd=event_op(j,i,l,3)
+            smw=event_op(j,i,l,4) ; smd=event_op(j,i,l,5)
+            smw_clim=event_op(j,i,l,6) ; smd_clim=event_op(j,i,l,7)
+            box_mean_sm=event_op(j,i,l,8) ; n=event_op(j,i,l,9)
+            k(1:n)=bevent_op(j,i,l,1:n)
 
             ! calculate day/year from ic
 !
@@ -272,7 +254,7 @@ do j=1, ny
                             nint(a*100),' with ndry=',n
                         
                     if(abs(smd/100.-a).gt.1.0) then
-                        print*,n,k(1:n),nsm(i,j)
+                        print*,n,k(1:n),nsm(j,i)
                         print*,'stopping...',smd,nint(smd/100.),a ; stop
                     endif
                 endif
@@ -347,8 +329,7 @@ do j=1, ny
             enddo ! end yr loop
 !
 
-        enddo ! end 'l' loop across event files
-        close(1) ! close events file
+        enddo ! end 'l' loop across events
     enddo   ! end of x loop
 
 
@@ -363,23 +344,14 @@ do j=1, ny
 !
         if(nevent(jout,iout).eq.0) cycle
 !
-        write(ich,'(i2)') iout ; if(iout.lt.10)ich(1:1)='0'
-        write(jch,'(i2)') jjout ; if(jjout.lt.10)jch(1:1)='0'
-
-        open(3,file=trim(sfiledir)//'5x5G_mon'//cmon//'/i'//ich//'j'//jch//'_fort.3')
-        open(4,file=trim(sfiledir)//'5x5G_mon'//cmon//'/i'//ich//'j'//jch//'_fort.4')
-        do i=1,nsample(jout,iout)
-            write(3,*) sample(i,jout,iout)
-        enddo
-
-        do i=1,nevent(jout,iout)
-            write(4,*) event(i,jout,iout)
-        enddo
-        close(3) ; close(4)
+        write(3) iout,jjout,nsample(jout,iout),nevent(jout,iout),&
+                 sample(1:nsample(jout,iout),jout,iout),event(1:nevent(jout,iout),jout,iout)
     enddo
 
 enddo   !end of y loop
 !
+close(3)
+!
 
 end
 !
@@ -453,36 +425,6 @@ enddo
 !
 end
 
-!========================================================
-function event_fname(i,j,imon,filedir)
-implicit none
-
-! filename for the events output by global_rain_sm_lgc.f90
-
-integer::i,j,imon
-character*150::event_fname
-character*150::filedir
-character*4::cx
-character*3::cy
-character*2::cmon
-
-write(cx,'(i4)') i
-if(i.lt.1000) cx(1:1)='0' 
-if(i.lt.100) cx(2:2)='0'
-if(i.lt.10) cx(3:3)='0'
-
-write(cy,'(i3)') j
-if(j.lt.100) cy(1:1)='0'
-if(j.lt.10) cy(2:2)='0'
-
-write(cmon,'(i2)') imon ; if(imon.lt.10) cmon(1:1)='0'
-
-event_fname=trim(filedir)//'event_output/mon'//cmon//'/x'//cx//'_y'//cy//'_mon'//cmon//'.txt'
-
-return 
-
-end
-
 !================================================================
 subroutine sm_local_lgc(ny,nx,npd,soilmoisture,smlocal,lon,box_del2)
 implicit none
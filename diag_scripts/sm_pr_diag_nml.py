@@ -55,14 +55,11 @@
 import os
 import re
 import glob
-import errno
+import calendar as cal
 import numpy as np
-import random as rd
 import ConfigParser
 import pdb
-import stat
 import sys
-import shutil
 
 
 # Common Python packages
@@ -84,6 +81,9 @@ from mpl_toolkits.basemap import Basemap
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
 from auxiliary import info
+import climatology
+import local_time as lt
+import permutation_test
 from auxiliary import error
 
 
@@ -105,6 +105,13 @@ def main(project_info):
     work_dir = E.get_work_dir()
     verbosity = E.get_verbosity()
     fileout = work_dir
+
+    # Number of worker processes for the p_values (optional, default 1)
+    modelconfig = ConfigParser.ConfigParser()
+    modelconfig.read(E.get_configfile())
+    processes = 1
+    if modelconfig.has_option('general', 'processes'):
+        processes = modelconfig.getint('general', 'processes')
     
     if not os.path.exists(plot_dir):
         os.makedirs(plot_dir)
@@ -112,11 +119,8 @@ def main(project_info):
     for model in project_info['MODELS']:
         info(model, verbosity, required_verbosity=1) 
 
-        if not os.path.exists(work_dir+'/sample_events'):
-            os.makedirs(work_dir+'/sample_events')
-
-        if not os.path.exists(work_dir+'/event_output'):
-            os.makedirs(work_dir+'/event_output')
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
 
 
         # --------------------------------------
@@ -133,11 +137,17 @@ def main(project_info):
 
         smclim = get_smclim(sm, lon, time)
 
+        # Time steps of each day (year, month, day)
+
+        pr_index = get_time_index(pr)
+        sm_index = get_time_index(sm)
+
         # -------------------------------
         # Compute diagnostic per month
         # -------------------------------
 
-        samplefileout = fileout + 'sample_events/'
+        # Events and non events (samples) per 5x5 deg grid-box and month
+        boxes = {}
 
         for mn in np.arange(1, 13):
 
@@ -147,8 +157,8 @@ def main(project_info):
 
             prbef, smbef, praft, smaft, \
                 monthlypr, monthlysm, days_per_year = get_monthly_input(project_info, mn, time, 
-                                                         lon, lat, time_bnds_1, pr, sm, fileout,
-                                                         samplefileout, model,
+                                                         lon, lat, time_bnds_1, pr, sm,
+                                                         pr_index, sm_index, model,
                                                          verbosity)
 
             # -----------------------
@@ -157,34 +167,44 @@ def main(project_info):
 
             info('Executing global_rain_sm for month ' + str(mn), verbosity, required_verbosity=1)
 
-            grs.global_rain_sm(np.asfortranarray(monthlypr),
-                               np.asfortranarray(prbef),
-                               np.asfortranarray(praft),
-                               np.asfortranarray(monthlysm),
-                               np.asfortranarray(smbef),
-                               np.asfortranarray(smaft),
-                               np.asfortranarray(smclim[mn - 1, :, :]),
-                               np.asfortranarray(topo),
-                               np.asfortranarray(lon),
-                               np.asfortranarray(mn),
-                               fileout, days_per_year)
+            nsm, event_op, bevent_op = \
+                grs.global_rain_sm(np.asfortranarray(monthlypr),
+                                   np.asfortranarray(prbef),
+                                   np.asfortranarray(praft),
+                                   np.asfortranarray(monthlysm),
+                                   np.asfortranarray(smbef),
+                                   np.asfortranarray(smaft),
+                                   np.asfortranarray(smclim[mn - 1, :, :]),
+                                   np.asfortranarray(topo),
+                                   np.asfortranarray(lon),
+                                   np.asfortranarray(mn),
+                                   days_per_year)
 
             info('Executing sample_events for month ' + str(mn), verbosity, required_verbosity=1)
 
+            samplefile = os.path.join(fileout, 'sample_events_mon'
+                                      + str(mn).zfill(2) + '.bin')
+
             se.sample_events(np.asfortranarray(monthlysm),
                              np.asfortranarray(smbef),
                              np.asfortranarray(smaft),
+                             nsm, event_op, bevent_op,
                              np.asfortranarray(lon),
                              np.asfortranarray(lat),
                              np.asfortranarray(mn),
-                             fileout, days_per_year, samplefileout)
+                             days_per_year, samplefile)
+
+            for box, values in read_samples(samplefile).items():
+                boxes.setdefault(box, []).append(values)
+            os.remove(samplefile)
 
         # ---------------------------------------------------
         # Compute p_values (as in Fig. 3, Taylor et al 2012)
         # --------------------------------------------------
         info('Computing diagnostic', verbosity, required_verbosity=1)
 
-        xs, ys, p_vals = get_p_val(samplefileout)
+        xs, ys, p_vals = permutation_test.get_p_val(boxes,
+                                                    processes=processes)
 
         # --------------------------------------------------
         # Save diagnostic to netCDF file and plot
@@ -192,12 +212,6 @@ def main(project_info):
         write_nc(fileout, xs, ys, p_vals, project_info, model)
         
         plot_diagnostic(fileout, plot_dir, project_info, model)
-
-        # --------------------------------------------------
-        # Remove temporary folders
-        # --------------------------------------------------
-        shutil.rmtree(str(fileout) + 'event_output')
-        shutil.rmtree(str(fileout) + 'sample_events') 
     
 
 
@@ -241,8 +255,7 @@ def coord_change(cubelist):
 
 
 def get_monthly_input(project_info, mn, time, lon, lat,
-                      time_bnds_1, pr, sm, fileout,
-                      samplefileout, model,
+                      time_bnds_1, pr, sm, pr_index, sm_index, model,
                       verbosity):
 
     """
@@ -261,10 +274,8 @@ def get_monthly_input(project_info, mn, time, lon, lat,
     ;;          3-hourly precipitation time series
     ;;    sm: iris cube [time, lat, lon]
     ;;          3-hourly soil moisture time series
-    ;;    fileout: dir
-    ;;          output directory
-    ;;    samplefileout: dir
-    ;;          temporary outpout directory used by fortran routines
+    ;;    pr_index, sm_index: dict
+    ;;          time steps of each day of pr and sm, see get_time_index
     ;;
     ;; Return
     ;;    prbef: array [year, day time steps (=8), lat, lon]
@@ -285,9 +296,12 @@ def get_monthly_input(project_info, mn, time, lon, lat,
     ;; Description
     ;;    Prepare monthly input data for fortran routines
     ;;
+    ;;    The days are looked up in the time indices, the data of the
+    ;;    month, of the previous and of the following day are taken with
+    ;;    a single (fancy) index each.
+    ;;
     """
 
-    import projects
     E = ESMValProject(project_info)
     verbosity = E.get_verbosity()
 
@@ -296,7 +310,7 @@ def get_monthly_input(project_info, mn, time, lon, lat,
     #-------------------------
     
     model = project_info['MODELS'][0]
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = model.get_project()
 
     model_info = model.split_entries()
 
@@ -314,7 +328,6 @@ def get_monthly_input(project_info, mn, time, lon, lat,
     nyr = last_year - first_year + 1
     years = np.arange(nyr) + first_year
 
-    months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
     calendar = utimedate.calendar
 
     nx = len(lon)
@@ -341,159 +354,76 @@ def get_monthly_input(project_info, mn, time, lon, lat,
         error('Missing calendar info')
 
     # --------------------------------------
-    # Create pr, sm  before and after arrays
+    # Create pr, sm  monthly, before and after arrays
     # --------------------------------------
 
+    nt = nts[mn - 1]
+
+    pr_data = np.ma.getdata(pr.data)
+    sm_data = np.ma.getdata(sm.data)
+
     prbef = np.zeros((nyr, 8, ny, nx), dtype='f4')
     praft = np.zeros((nyr, 8, ny, nx), dtype='f4')
 
     smbef = np.zeros((nyr, 8, ny, nx), dtype='f4')
     smaft = np.zeros((nyr, 8, ny, nx), dtype='f4')
 
-    try:
-        os.mkdir(os.path.join(samplefileout, "5x5G_mon" + str(mn).zfill(2)), stat.S_IWUSR | stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-    except OSError as exc:
-        if exc.errno != errno.EEXIST:
-            raise exc
-        pass
-
-    try:
-        os.mkdir(os.path.join(fileout, "event_output", "mon" + str(mn).zfill(2)), stat.S_IWUSR | stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-    except OSError as exc:
-        if exc.errno != errno.EEXIST:
-            raise exc
-        pass
-
-    nt = nts[mn - 1]
-
-    monthlypr_list = [np.zeros((nt, ny, nx), dtype='f4') for y in years]
-    monthlysm_list = [np.zeros((nt, ny, nx), dtype='f4') for y in years]
+    monthlypr = np.zeros((nyr, nt, ny, nx), dtype='f4')
+    monthlysm = np.zeros((nyr, nt, ny, nx), dtype='f4')
 
     for yr, year in enumerate(years):
 
         info('month, year: ' + str(mn) + ", " + str(year), verbosity, required_verbosity=1)
 
-        if all([mn == 2, any([calendar == 'gregorian', calendar == 'standard'])]):
-
-            monthlysm_list[yr][:,:,:] = (
-                    sm.extract(iris.Constraint(month=months[mn-1],year=year, dom = range(1,29) )).data)
-
-            monthlypr_list[yr][:,:,:] = (
-                    pr.extract(iris.Constraint(month=months[mn-1],year=year, dom = range(1,29) )).data)
-
-        else: 
-            try:
-                monthlypr_list[yr][:,:,:] = (
-                      pr.extract(iris.Constraint(month=months[mn-1],year=year)).data)  
-            except:
-                try:
-                     monthlypr_list[yr][0,:,:] = -999.
-                     monthlypr_list[yr][1::,:,:] = (
-                          pr.extract(iris.Constraint(month=months[mn-1],year=year)).data)    
-                except:                              
-                     info('omitted pr: ' + str(mn) + ", " + str(year), verbosity, required_verbosity=1)
-
-            try:
-                monthlysm_list[yr][:,:,:] = (
-                      sm.extract(iris.Constraint(month=months[mn-1],year=year)).data)  
-            except:
-                try:
-                     monthlysm_list[yr][0,:,:] = -999.
-                     monthlysm_list[yr][1::,:,:] = (
-                          sm.extract(iris.Constraint(month=months[mn-1],year=year)).data)    
-                except:                              
-                     info('omitted sm: ' + str(mn) + ", " + str(year), verbosity, required_verbosity=1)
-
+        # Leap days are left out (February of gregorian calendars
+        # covers days 1 to 28)
+        month_days = [(year, mn, day) for day in range(1, days_permonth[mn - 1] + 1)]
 
         # last day of previous month
 
         if all([mn == 1, year == first_year]):
-
-            prbef[yr,:,:,:] = np.zeros( (8, ny, nx) ) - 999.
-            smbef[yr,:,:,:] = np.zeros( (8, ny, nx) ) - 999.
-
+            day_bef = None
         elif (mn == 1):
-
-            prbef[yr,:,:,:] = (
-                pr.extract(iris.Constraint(year=year-1,month='Dec',dom=days_permonth[-1])).data)
-
-            smbef[yr,:,:,:] = (
-                sm.extract(iris.Constraint(year=year-1,month='Dec',dom=days_permonth[-1])).data)
-
+            day_bef = (year - 1, 12, days_permonth[-1])
+        elif all([cal.isleap(year), any([calendar == 'gregorian', calendar == 'standard'])]):
+            day_bef = (year, mn - 1, days_permonth_leap[mn - 2])
         else:
+            day_bef = (year, mn - 1, days_permonth[mn - 2])
 
-            if any([calendar == '360_day', calendar == '365_day', calendar == 'noleap']):
-
-                prbef[yr,:,:,:] = (
-                     pr.extract(iris.Constraint(year=year,month=months[mn-2],dom=days_permonth[mn-2])).data)
-
-                smbef[yr,:,:,:] = (
-                     sm.extract(iris.Constraint(year=year,month=months[mn-2],dom=days_permonth[mn-2])).data)
-
-            elif any([calendar == 'gregorian', calendar == 'standard']): 
-
-                if cal.isleap(year):
-
-                    prbef[yr,:,:,:] = (
-                         pr.extract(iris.Constraint(year=year,month=months[mn-2],dom=days_permonth_leap[mn-2])).data)
-
-                    smbef[yr,:,:,:] = (
-                         sm.extract(iris.Constraint(year=year,month=months[mn-2],dom=days_permonth_leap[mn-2])).data)
-
-                else:
-                    prbef[yr,:,:,:] = (
-                         pr.extract(iris.Constraint(year=year,month=months[mn-2],dom=days_permonth[mn-2])).data)
-
-                    smbef[yr,:,:,:] = (
-                         sm.extract(iris.Constraint(year=year,month=months[mn-2],dom=days_permonth[mn-2])).data)
-
-        # first day of following month
+        # first day of following month (the leap day for February)
 
         if (mn == 12 and year == last_year):
-
-            praft[yr,:,:,:] = np.zeros( (8, ny, nx) ) - 999.
-            smaft[yr,:,:,:] = np.zeros( (8, ny, nx) ) - 999.
-
+            day_aft = None
         elif (mn == 12):
-
-            praft[yr,:,:,:] = (
-                pr.extract(iris.Constraint(year=year+1,month='Jan',dom=1)).data)
-
-            smaft[yr,:,:,:] = (
-                sm.extract(iris.Constraint(year=year+1,month='Jan',dom=1)).data) 
-
+            day_aft = (year + 1, 1, 1)
+        elif all([cal.isleap(year), mn == 2, any([calendar == 'gregorian', calendar == 'standard'])]):
+            day_aft = (year, 2, 29)
         else:
+            day_aft = (year, mn + 1, 1)
+
+        for data, time_index, monthly, bef, aft, var in \
+                [(pr_data, pr_index, monthlypr, prbef, praft, 'pr'),
+                 (sm_data, sm_index, monthlysm, smbef, smaft, 'sm')]:
+
+            steps = get_time_steps(time_index, month_days)
+            if (len(steps) == nt):
+                monthly[yr, :, :, :] = data[steps]
+            elif (len(steps) == nt - 1):
+                monthly[yr, 0, :, :] = -999.
+                monthly[yr, 1::, :, :] = data[steps]
+            else:
+                info('omitted ' + var + ': ' + str(mn) + ", " + str(year), verbosity, required_verbosity=1)
 
-            if any([calendar == '360_day', calendar == '365_day', calendar == 'noleap']):
-
-                praft[yr,:,:,:] = (
-                    pr.extract(iris.Constraint(year=year,month=months[mn],dom=1)).data)
-
-                smaft[yr,:,:,:] = (
-                    sm.extract(iris.Constraint(year=year,month=months[mn],dom=1)).data)
-
-            elif any([calendar == 'gregorian', calendar == 'standard']): 
-
-                if all([cal.isleap(year),mn == 2]):
-
-                    praft[yr,:,:,:] = (
-                        pr.extract(iris.Constraint(year=year,month=months[1],dom=29)).data)
-
-                    smaft[yr,:,:,:] = (
-                        sm.extract(iris.Constraint(year=year,month=months[1],dom=29)).data)     
-              
-                else:
-                    praft[yr,:,:,:] = (
-                        pr.extract(iris.Constraint(year=year,month=months[mn],dom=1)).data)
-
-                    smaft[yr,:,:,:] = (
-                        sm.extract(iris.Constraint(year=year,month=months[mn],dom=1)).data)
+            if day_bef is None:
+                bef[yr, :, :, :] = -999.
+            else:
+                bef[yr, :, :, :] = data[get_time_steps(time_index, [day_bef])]
 
+            if day_aft is None:
+                aft[yr, :, :, :] = -999.
+            else:
+                aft[yr, :, :, :] = data[get_time_steps(time_index, [day_aft])]
 
-    monthlypr = np.vstack(tuple(monthlypr_list))
-    monthlysm = np.vstack(tuple(monthlysm_list))
-    monthlypr  = monthlypr.reshape(nyr, nt, ny, nx)
-    monthlysm = monthlysm.reshape(nyr, nt, ny, nx)
     
     if time_bnds_1 == 0.0625:
         monthlypr[:, 0:-1, :, :]  = monthlypr[:, 1::, :, :]
@@ -508,135 +438,94 @@ def get_monthly_input(project_info, mn, time, lon, lat,
 
 
 
-def get_p_val(in_dir):
+def get_time_index(cube):
 
     """ 
     ;; Arguments
-    ;;    in_dir: dir
-    ;;          directory with intermediary files from fortran routines
+    ;;    cube: iris cube [time, lat, lon]
+    ;;          with year, month and dom (day of month) coords
     ;;
     ;; Return 
-    ;;    xs: array [lon]
-    ;;          regridding coordinates
-    ;;    ys: array [lat]
-    ;;          regridding coordinates
-    ;;    p_vals: list
-    ;;          p_values of 5x5 deg grid-boxes
+    ;;    time_index: dict
+    ;;          slice of the time steps of each day (year, month, day)
     ;;
     ;; Description
-    ;;    Computes percentiles (p_values) of "preference for afternoon 
-    ;;    precipitation over soil moisture anomalies" as in Fig.3 of
-    ;;    Taylor et al. 2012, doi:10.1038/nature11377
-    ;;
-    ;; NOTE:
-    ;; Change shuffle_times for a quicker run
+    ;;    The time steps of a day are assumed to be consecutive.
     ;;
     """
 
-    # Find gridboxes (xs, ys) with events
-
-    f_ev = glob.glob(in_dir +'*/*.4')
-    xss = []
-    yss = []
-    for f in f_ev:
-        xss.append(int(f[-12:-10]))
-        yss.append(int(f[-9:-7]))   
-    xs = np.unique(xss) 
-    ys = np.unique(yss)
-    
-    p_vals = [] 
-
-    for x in xs: 
-        for y in ys:
-            
-            # Read events
-
-            ev_f = glob.glob(in_dir +'*/i'+str(x).zfill(2) +'j'+str(y).zfill(2)+'_fort.4')
-
-            levents = []
-
-            for ef in ev_f:
-
-                levents.append((np.genfromtxt(ef,dtype=(float), \
-                               skip_header=0, delimiter=' ')).tolist())
-
-            if levents != []: 
-                events = []
-                for l in levents:
-                    if isinstance(l, list):
-                        for e in l:
-                            events.append(e)
-                    else:
-                        events.append(l)
-            else:
-               events = levents
+    month_numbers = dict([(calendar_month, i + 1) for i, calendar_month in
+                          enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                     'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])])
 
-            # Minumun number of event to consider the gridbox = 25   
-            if len(events) > 24:
+    years = np.asarray(cube.coord('year').points, dtype=int)
+    months = np.array([month_numbers[m] for m in cube.coord('month').points])
+    days = np.asarray(cube.coord('dom').points, dtype=int)
 
-                # Read non events
+    keys = (years * 100 + months) * 100 + days
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    stops = np.append(starts[1:], len(keys))
 
-                nev_f = glob.glob(in_dir +'*/i'+str(x).zfill(2) +'j'+ str(y).zfill(2) +'_fort.3')
+    time_index = {}
+    for start, stop in zip(starts, stops):
+        day = (int(years[start]), int(months[start]), int(days[start]))
+        time_index[day] = slice(start, stop)
+    return time_index
 
-                lnon_events = []
 
-                for ef in nev_f:
+def get_time_steps(time_index, days):
 
-                    lnon_events.append((np.genfromtxt(ef,dtype=(float), \
-                                   skip_header=0, delimiter=' ')).tolist())
-
-                if lnon_events != []: 
-                    non_events = []                     
-                    for l in lnon_events:
-                        if isinstance(l, list):
-                            for e in l:
-                                non_events.append(e)
-                        else:
-                            non_events.append(l) 
-                else:
-                    non_events = lnon_events 
-
-                # delta = events_average - non_events_average
-                delta = np.mean(events) - np.mean(non_events)
-
-                #-----------------------------
-                # Merge events and non events
-                # Shuffle n times (n=500)
-                # Get delta of shuffled events
-                #-----------------------------
-
-                all_ev_nev = events + non_events
-
-                sdeltas = []
-
-                shuffle_times = 500.0
-                for i in range(0, int(shuffle_times)):
-
-                    rd.shuffle(all_ev_nev)
-                    sev = all_ev_nev[0:len(events)]
-                    snev = all_ev_nev[len(events)::]
-                    sdelta = np.mean(sev) - np.mean(snev)
-                    sdeltas.append(sdelta)
-                #-----------------------------    
-                # Sort (min to max) shuffled deltas
-                # Find p_val
-                #-----------------------------
-
-                sdeltas.sort()
-
-                closet_val = min(sdeltas, key=lambda x:abs(x-delta))
+    """ 
+    ;; Arguments
+    ;;    time_index: dict
+    ;;          slice of the time steps of each day, see get_time_index
+    ;;    days: list
+    ;;          days (year, month, day)
+    ;;
+    ;; Return 
+    ;;    steps: array
+    ;;          time steps of the days, days not in time_index are left out
+    ;;
+    """
 
-                p_val = sdeltas.index(closet_val)/shuffle_times
+    steps = [np.arange(time_index[day].start, time_index[day].stop)
+             for day in days if day in time_index]
+    if steps == []:
+        return np.zeros(0, dtype=int)
+    return np.concatenate(steps)
 
-                p_vals.append(p_val)
 
-            else:
+def read_samples(samplefile):
 
-                p_vals.append(-999.)  
- 
-    return xs, ys, p_vals
+    """ 
+    ;; Arguments
+    ;;    samplefile: file
+    ;;          binary output of sample_events for one month
+    ;;
+    ;; Return 
+    ;;    boxes: dict
+    ;;          (non events, events) arrays per 5x5 deg grid-box (x, y)
+    ;;
+    ;; Description
+    ;;    The file holds one record per grid-box: x, y, number of non
+    ;;    events, number of events (int32), followed by the non events
+    ;;    and the events (float32). A later record of a grid-box
+    ;;    replaces an earlier one.
+    ;;
+    """
 
+    raw = np.fromfile(samplefile, dtype=np.int32)
 
+    boxes = {}
+    pos = 0
+    while pos < len(raw):
+        x, y, n_nev, n_ev = raw[pos:pos + 4]
+        pos += 4
+        values = raw[pos:pos + n_nev + n_ev].view(np.float32)
+        pos += n_nev + n_ev
+        boxes[(int(x), int(y))] = (values[:n_nev].astype(np.float64),
+                                   values[n_nev:].astype(np.float64))
+    return boxes
 
 
 def get_smclim(sm, lon, time):
@@ -665,60 +554,14 @@ def get_smclim(sm, lon, time):
     utimedate = time[0].units
 
     local_time = 6.0
-    time_loc_sol = local_time + 3 - data_start_time
-
-    steps_perday = 8  # 3h data
-    steps_window = steps_perday * 3
-    glob_degrees = 360.0
-    hours_perday = 24.0
 
     #-----------------------------------------------
-    # Convert longitudes to the range [-180, 180] regardless of grid type.
-    # Calculate the fractional indices of [0, 23] that correspond to the
-    # interpolation points for each longitude.
+    # Istead of interpolating, get closest value to 6:00:
+    # the time step of a 3 day window (UTC, starting the day before)
+    # closest to the local time for each longitude
     #-----------------------------------------------
 
-    lon = np.array([l - 360.0 if l >= 180.0 else l for l in lon])
-
-    utc_time = time_loc_sol - (lon * hours_perday / glob_degrees)
-    kindex = utc_time * steps_perday / hours_perday + steps_perday
-
-    # Calculate the interpolation weights.  NB For each longitude no more than
-    # two weights should be non-zero and their sum should be 1.
-    weight_lon = np.zeros((steps_window, len(lon)), dtype=lon.dtype)
-    for i, (kf, kw) in enumerate(zip(*np.modf(kindex))):
-        weight_lon[int(kw), i] = 1.0 - kf
-        weight_lon[int(kw) + 1, i] = kf
-
-    #-----------------------------------------------
-    # Istead of interpolating, get closest value to 6:00
-    # Get the closest UTC file to time_loc_sol (= 6:00)
-    #-----------------------------------------------
-
-    weights_lon = np.where((weight_lon > 0), 1, weight_lon)
-    weights_lon = weights_lon - np.concatenate((np.zeros((1,
-                                               weights_lon.shape[1])),
-                                               weights_lon[:-1]))
-    weights_lon = np.where((weights_lon < 0), 0, weights_lon)
-
-    #-----------------------------------------------
-    # Find longitude at which local day changes
-    # Convert weights from local day to UTC day
-    #-----------------------------------------------
-
-    lon_day_change = (time_loc_sol / 3.0) * 45
-    indlist = []
-    for j, i in enumerate((lon >= lon_day_change) * (lon <= lon_day_change + 90)):
-        if i:
-            indlist.append(j)
-    for i in indlist:
-        weights_lon[:, i] = np.roll(weights_lon[:, i], 8)
-    indlist = []
-    for j, i in enumerate(lon.tolist()):
-        if i in range(-180, 180, 45):
-            indlist.append(j)
-    for i in indlist:
-        weights_lon[:, i] = np.roll(weights_lon[:, i], -1)
+    steps_lon = lt.local_time_steps(lon, local_time, data_start_time)
 
     #-----------------------------------------------
     # get variable values at local time ( = 6:00 am)
@@ -728,24 +571,10 @@ def get_smclim(sm, lon, time):
     temp = np.sum(iris_cube_var.data[:, :, :], axis=0)  # fill_value = 0
     land_indexes = np.int64(np.where(temp != 0))  # land gridboxes
 
-    weights = np.tile(weights_lon.reshape(weights_lon.shape[0], 1,
-                      weights_lon.shape[1]), (iris_cube_var.data.shape[1], 1))
-    weights_lp = weights[:, land_indexes[0], land_indexes[1]]
-
-    var_3h = iris_cube_var.data[:, land_indexes[0], land_indexes[1]]
-
-    varday = []
-    for i in range(0, len(var_3h) - 16, 8):
-        threedays_3h = var_3h[i:i + 24, :]
-        varday.append(np.sum(threedays_3h * weights_lp, axis=0))
+    varday = lt.sample_local_time(iris_cube_var.data, steps_lon,
+                                  land_indexes[0], land_indexes[1])
 
-    varday.insert(0, varday[0])
-    varday.append(varday[-1])
-
-    var_array = np.zeros((len(varday), varday[0].shape[0]))
-
-    for i, l in enumerate(varday):
-        var_array[i, :] = l
+    var_array = np.concatenate((varday[:1], varday, varday[-1:]))
 
     #-----------------------------------------------
     # get monthly climatology
@@ -770,17 +599,10 @@ def get_smclim(sm, lon, time):
 
     elif any([calendar == '365_day', calendar == 'noleap']):
 
-        days_peryear = 365
-        var_array = var_array.reshape(var_array.shape[0] / days_peryear,
-                                      days_peryear, var_array.shape[1])
         mvar_array = np.ma.masked_equal(var_array, 1e20)
         days_permonth = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        ind = 0
-        var_mean = np.zeros((12, var_array.shape[2]), dtype='float32')
-        for m, mdays in enumerate(days_permonth):
-            temp = np.mean(mvar_array[:, ind:ind + mdays, :], axis=0)
-            var_mean[m] = np.mean(temp, axis=0)
-            ind = mdays + ind
+        var_mean = climatology.monthly_climatology_of_days(mvar_array,
+                                                           days_permonth)
 
     var_2d = np.zeros((12, iris_cube_var.data.shape[1], iris_cube_var.data.shape[2]), dtype='float32')
     var_2d[:, :] = -999.0
@@ -807,7 +629,6 @@ def get_topo(project_info, longi, lati, model):
     ;;    Computes topography information
     ;;
     """
-    import projects
     E = ESMValProject(project_info)
     verbosity = E.get_verbosity()
 
@@ -815,7 +636,7 @@ def get_topo(project_info, longi, lati, model):
     # Read model info
     #-------------------------
     
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = model.get_project()
 
     model_info = model.split_entries()
 
@@ -881,7 +702,6 @@ def plot_diagnostic(fileout, plot_dir, project_info, model):
     ;;    Plot diagnostic and save .png plot
     ;;
     """
-    import projects
     E = ESMValProject(project_info)
     verbosity = E.get_verbosity()
 
@@ -889,7 +709,7 @@ def plot_diagnostic(fileout, plot_dir, project_info, model):
     # Read model info
     #-------------------------
     
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = model.get_project()
 
     start_year = currProject.get_model_start_year(model)
     end_year = currProject.get_model_end_year(model)
@@ -982,14 +802,13 @@ def read_pr_sm_topo(project_info, model):
     ;;
     """
     
-    import projects
     E = ESMValProject(project_info)
     verbosity = E.get_verbosity()
     #-------------------------
     # Read model info
     #-------------------------
 
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = model.get_project()
 
     model_info = model.split_entries()
 
@@ -1231,7 +1050,6 @@ def write_nc(fileout, xs, ys, p_vals, project_info, model):
     ;;    Save netCDF file with diagnostic in a regular 5x5 deg grid 
     ;;
     """
-    import projects
     E = ESMValProject(project_info)
     verbosity = E.get_verbosity()
 
@@ -1239,7 +1057,7 @@ def write_nc(fileout, xs, ys, p_vals, project_info, model):
     # Read model info
     #-------------------------
     
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = model.get_project()
 
     model_info = model.split_entries()
 
@@ -38,11 +38,11 @@
 
 import sys   # debug
 import os
+import threading
 
 import ConfigParser
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.ndimage.interpolation import map_coordinates as interp2d
 from netCDF4 import Dataset
 #from scipy.io import netcdf as nc
 
@@ -157,7 +157,6 @@ def main(project_info):
 
 def get_climo_filenames(E, variable):
 
-    import projects
     import os
 
     res = []
@@ -169,8 +168,7 @@ def get_climo_filenames(E, variable):
         exp = currDiag.get_var_attr_exp()
         for idx in range(len(variables)):
             for model in E.project_info['MODELS']:
-                currProject = getattr(vars()['projects'],
-                                      model.split_entries()[0])()
+                currProject = model.get_project()
                 fullpath = currProject.get_cf_fullpath(E.project_info,
                                                        model,
                                                        field_types[idx],
@@ -185,119 +183,211 @@ def get_climo_filenames(E, variable):
 # Reading and Regridding functions (scroll down for main program)
 
 
-def regrid(aIn, xIn, yIn, xOut, yOut, fixmdis=True, xCyclic=0.0):
+# Regrid indices and weights computed so far, see regrid_weights
+regrid_weights_cache = {}
 
-    """
-    Function for regridding onto 2.5 degree lat-long grid as the ISCCP
-    obs data used for comparison was stored on.
-    """
-    # first represent missing data as np.NAN
-    # - this replicates the default "hard MDI" behaviour of IDL regrid
-    # code used by WW09 (in conjunction with the post-regrid "put back
-    # exact coord matches" - see last part)
-    aIn = aIn.copy()  # avoid overwriting
-    if isinstance(aIn, np.ma.masked_array):
-        aIn[np.ma.getmaskarray(aIn)] = np.NAN
+# netCDF (HDF5) reads are not thread safe, see read_and_regrid_all
+read_lock = threading.Lock()
 
-    # replicate a column to the right if we have "x-cyclic" data
 
-    # copy inputs to avoid changing them
-    xIn = xIn.copy()
-    yIn = yIn.copy()
+def regrid_weights(xIn, yIn, xOut, yOut, xCyclic=0.0):
+
+    """
+    Function computing (once per source and target grid) the indices and
+    weights of the bilinear regridding done by regrid_stack.
+    """
+    key = (np.asarray(xIn, dtype=np.float64).tostring(),
+           np.asarray(yIn, dtype=np.float64).tostring(),
+           np.asarray(xOut, dtype=np.float64).tostring(),
+           np.asarray(yOut, dtype=np.float64).tostring(),
+           xCyclic)
+    if key in regrid_weights_cache:
+        return regrid_weights_cache[key]
 
     # sort the input Xs and Ys to guarantee ascending order
     nx = len(xIn)
     ny = len(yIn)
     iSortX = np.argsort(xIn)
     xIn = np.array(xIn)[iSortX]
-    aIn = aIn[:, iSortX]
     iSortY = np.argsort(yIn)
     yIn = np.array(yIn)[iSortY]
-    aIn = aIn[iSortY, :]
 
     # simulate cyclic X-coords, if enabled
     if xCyclic > 0.0:
-        aiNew = range(nx) + [0]
+        iSortX = np.append(iSortX, iSortX[0])  # one lhs column on rhs
+        xIn = np.append(xIn, xIn[0] + xCyclic)  # bump last element by range
         nx += 1
-        aIn = aIn[:, aiNew]   # recopy one lhs column on rhs
-        xIn = xIn[aiNew]      # ditto for coords
-        xIn[-1] += xCyclic    # bump last element by range
 
     # convert input+output coordinate specs to "fractional coordinate values"
     xinds = np.interp(xOut, xIn, range(nx))
     yinds = np.interp(yOut, yIn, range(ny))
 
-    # make a full coordinate mesh
-    ainds = np.meshgrid(xinds, yinds)
-    ainds = np.array(ainds)
-    ainds = ainds[[1, 0]]
+    # 1st-order spline is just bilinear interpolation, as done by
+    # map_coordinates(order=1, mode='nearest') before: both neighbours
+    # are used (a missing one gives NaN even with a weight of 0)
+    x0 = np.clip(np.floor(xinds).astype(int), 0, max(nx - 2, 0))
+    y0 = np.clip(np.floor(yinds).astype(int), 0, max(ny - 2, 0))
+    weights = {'x0': iSortX[x0],
+               'x1': iSortX[np.minimum(x0 + 1, nx - 1)],
+               'fx': xinds - x0,
+               'y0': iSortY[y0],
+               'y1': iSortY[np.minimum(y0 + 1, ny - 1)],
+               'fy': yinds - y0}
+
+    # "exact" coordinate matches, which take the original values
+    bXexact = abs(xinds - np.round(xinds, 0)) < 1e-6
+    bYexact = abs(yinds - np.round(yinds, 0)) < 1e-6
+    weights['iXoutExact'] = np.arange(len(xOut))[bXexact]
+    weights['iXinExact'] = iSortX[np.round(xinds[bXexact]).astype(int)]
+    weights['iYoutExact'] = np.arange(len(yOut))[bYexact]
+    weights['iYinExact'] = iSortY[np.round(yinds[bYexact]).astype(int)]
+
+    regrid_weights_cache[key] = weights
+    return weights
+
 
-    # qdo main interpolation
-    result = interp2d(aIn, ainds, order=1, mode='nearest', cval=np.NAN,
-                      prefilter=False)
-    # 1st-order spline is just bilinear interpolation
+def regrid_stack(aIn, weights, fixmdis=True):
+
+    """
+    Function regridding a stack of fields (time, lat, lon) with the indices
+    and weights from regrid_weights.
+    """
+    # first represent missing data as np.NAN
+    # - this replicates the default "hard MDI" behaviour of IDL regrid
+    # code used by WW09 (in conjunction with the post-regrid "put back
+    # exact coord matches" - see last part)
+    if isinstance(aIn, np.ma.masked_array):
+        aIn = np.ma.filled(aIn.astype(np.float64), np.NAN)
+    else:
+        aIn = np.asarray(aIn, dtype=np.float64)
+
+    fx = weights['fx'][None, None, :]
+    fy = weights['fy'][None, :, None]
+    rows0 = aIn[:, weights['y0'], :]
+    rows1 = aIn[:, weights['y1'], :]
+    result = (1.0 - fy) * ((1.0 - fx) * rows0[:, :, weights['x0']]
+                           + fx * rows0[:, :, weights['x1']])
+    result += fy * ((1.0 - fx) * rows1[:, :, weights['x0']]
+                    + fx * rows1[:, :, weights['x1']])
 
     # post-process replacing originals for any "exact" coordinate matches
     if fixmdis:
-        bXexact = abs(xinds - np.round(xinds, 0)) < 1e-6
-        iXoutExact = np.arange(nx)[bXexact]
-        iXinExact = [int(round(ix)) for ix in xinds[iXoutExact]]
+        iOut = np.ix_(weights['iYoutExact'], weights['iXoutExact'])
+        iIn = np.ix_(weights['iYinExact'], weights['iXinExact'])
+        result[:, iOut[0], iOut[1]] = aIn[:, iIn[0], iIn[1]]
 
-        bYexact = abs(yinds - np.round(yinds, 0)) < 1e-6
-        iYoutExact = np.arange(ny)[bYexact]
-        iYinExact = [int(round(iy)) for iy in yinds[iYoutExact]]
+    return result
 
-        for (i, ixOut) in enumerate(iXoutExact):
-            for (j, iyOut) in enumerate(iYoutExact):
-                result[iyOut, ixOut] = aIn[iYinExact[j], iXinExact[i]]
 
-    return result
+def regrid(aIn, xIn, yIn, xOut, yOut, fixmdis=True, xCyclic=0.0):
+
+    """
+    Function for regridding onto 2.5 degree lat-long grid as the ISCCP
+    obs data used for comparison was stored on.
+    """
+    weights = regrid_weights(xIn, yIn, xOut, yOut, xCyclic=xCyclic)
+    return regrid_stack(aIn[None, :, :], weights, fixmdis=fixmdis)[0]
 
 
-def read_and_regrid(sSrcFilename, sVarname, lons2, lats2):
+def get_time_steps(sSrcFilename):
 
     """
-    Function for reading and regridding cmor compliant input data.
+    Function returning the number of time steps in a file.
     """
+    with read_lock:
+        srcDataset = Dataset(sSrcFilename, 'r')
+        nt = len(srcDataset.variables['time'])
+        srcDataset.close()
+    return nt
+
 
-    npts = len(lons2)
-    nrows = len(lats2)
+def read_and_regrid(sSrcFilename, sVarname, lons2, lats2,
+                    time_slice=slice(None)):
 
-#    nt = len(Dataset(sSrcFilename, 'r', format='NETCDF3').variables['time'][:])
-    nt = len(Dataset(sSrcFilename, 'r').variables['time'][:])
-#    f = nc.netcdf_file(sSrcFilename, 'r')
-#    time = f.variables['time'][:]
-#    nt = time.shape[0]  # number of time steps in netCDF
-    data_rg = np.zeros((nt, nrows, npts))
-    print 'Number of data times in file ', nt
+    """
+    Function for reading and regridding cmor compliant input data
+    (optionally only the time steps in time_slice).
+    """
 
     # read data
-    srcDataset = Dataset(sSrcFilename, 'r', format='NETCDF3')
-    srcData = srcDataset.variables[sVarname]
-#    srcData = f.variables[sVarname][:, :, :]
+    with read_lock:
+        srcDataset = Dataset(sSrcFilename, 'r')
+        srcData = srcDataset.variables[sVarname]
 
-    # grid of input data
-    lats = srcDataset.variables['lat'][:]
-    lons = srcDataset.variables['lon'][:]
-#    lats = f.variables['lat'][:]
-#    lons = f.variables['lon'][:]
+        # grid of input data
+        lats = srcDataset.variables['lat'][:]
+        lons = srcDataset.variables['lon'][:]
 
-    # create mask (missing values)
-#    data = np.ma.masked_equal(srcData, f.variables[sVarname]._FillValue)
-    data = np.ma.masked_equal(srcData, srcData._FillValue)
+        # create mask (missing values)
+        data = np.ma.masked_equal(srcData[time_slice], srcData._FillValue)
+        srcDataset.close()
 
-    for iT in range(nt):    # range over fields in the file
-        data_rg[iT, :, :] = regrid(data[iT, :, :], lons, lats, lons2, lats2,
-                                   xCyclic=360.0)
+    # all fields at once
+    weights = regrid_weights(lons, lats, lons2, lats2, xCyclic=360.0)
+    data_rg = regrid_stack(data, weights)
 
     rgmasked = np.ma.masked_invalid(data_rg)
     np.ma.set_fill_value(rgmasked, 0.0)
 
-#    return data_rg
     return(np.ma.filled(rgmasked))
 
 
-def crem_calc(E, pointers):
+def read_and_regrid_all(files, lons2, lats2, time_slice=slice(None)):
+
+    """
+    Function reading and regridding several (file, variable) pairs
+    concurrently, one thread per variable. The reads themselves are
+    serialized (read_lock), the regridding overlaps with them.
+    """
+    results = [None] * len(files)
+    errors = []
+
+    def worker(i, sSrcFilename, sVarname):
+        try:
+            results[i] = read_and_regrid(sSrcFilename, sVarname, lons2, lats2,
+                                         time_slice)
+        except Exception:
+            errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=worker, args=(i,) + tuple(pair))
+               for i, pair in enumerate(files)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results
+
+
+def assign_regimes(data, region_points, obs_alb, obs_pct, obs_clt,
+                   nregimes, sums):
+
+    """
+    Function assigning the valid points of each region to the nearest
+    observed regime centroid in (albisccp, pctisccp, cltisccp) space. The
+    number of points and the cloud forcing are added up per regime in
+    sums (see crem_calc).
+    """
+    for region in range(3):
+        points = region_points[region]
+        n = nregimes[region]
+
+        # Squared euclidean distances to all centroids at once
+        ed = (data['albisccp'][points][:, None] - obs_alb[None, region, 0:n]) ** 2 + \
+             (data['pctisccp'][points][:, None] - obs_pct[None, region, 0:n]) ** 2 + \
+             (data['cltisccp'][points][:, None] - obs_clt[None, region, 0:n]) ** 2
+        group = np.argmin(ed, axis=1)
+
+        sums['npoints'][region] += len(group)
+        sums['count'][region, 0:n] += np.bincount(group, minlength=n)
+        sums['swcf'][region, 0:n] += np.bincount(group, data['swcf'][points],
+                                                 minlength=n)
+        sums['lwcf'][region, 0:n] += np.bincount(group, data['lwcf'][points],
+                                                 minlength=n)
+
+
+def crem_calc(E, pointers, time_chunk=30):
 
     """
     Main program for calculating Cloud Regime Error Metric following equation
@@ -324,6 +414,9 @@ def crem_calc(E, pointers):
     If snc is not available then snw can be used instead. In this case
     pointers[snc_nc] should be set to None and snw_nc set.
 
+    The data are processed in chunks of time_chunk days, so memory does not
+    depend on the length of the record.
+
     Outputs:
     CREMpd is the present-day cloud regime error metric of WW09.
     rCREMpd is the component from each regime.
@@ -393,38 +486,18 @@ def crem_calc(E, pointers):
 
     # Read in and regrid input data
 
-    print 'Reading and regridding albisccp_nc'
-    albisccp_data = read_and_regrid(pointers['albisccp_nc'], sVarnames[0], lons2, lats2)
-    E.add_to_filelist(pointers['albisccp_nc'])
-    print 'Reading and regridding pctisccp_nc'
-    pctisccp_data = read_and_regrid(pointers['pctisccp_nc'], sVarnames[1], lons2, lats2)
-    E.add_to_filelist(pointers['pctisccp_nc'])
-    print 'Reading and regridding cltisccp_nc'
-    cltisccp_data = read_and_regrid(pointers['cltisccp_nc'], sVarnames[2], lons2, lats2)
-    E.add_to_filelist(pointers['cltisccp_nc'])
-    print 'Reading and regridding rsut_nc'
-    rsut_data = read_and_regrid(pointers['rsut_nc'], sVarnames[3], lons2, lats2)
-    E.add_to_filelist(pointers['rsut_nc'])
-    print 'Reading and regridding rsutcs_nc'
-    rsutcs_data = read_and_regrid(pointers['rsutcs_nc'], sVarnames[4], lons2, lats2)
-    E.add_to_filelist(pointers['rsutcs_nc'])
-    print 'Reading and regridding rlut_nc'
-    rlut_data = read_and_regrid(pointers['rlut_nc'], sVarnames[5], lons2, lats2)
-    E.add_to_filelist(pointers['rlut_nc'])
-    print 'Reading and regridding rlutcs_nc'
-    rlutcs_data = read_and_regrid(pointers['rlutcs_nc'], sVarnames[6], lons2, lats2)
-    E.add_to_filelist(pointers['rlutcs_nc'])
-    print 'Reading and regridding sic_nc'
-    sic_data = read_and_regrid(pointers['sic_nc'], sVarnames[8], lons2, lats2)
-    E.add_to_filelist(pointers['sic_nc'])
     if not pointers['snc_nc']:
-        print 'Reading and regridding snw_nc'
-        snc_data = read_and_regrid(pointers['snw_nc'], sVarnames[7], lons2, lats2)
-        E.add_to_filelist(pointers['snw_nc'])
+        snc_key = 'snw_nc'
     else:
-        print 'Reading and regridding snc_nc'
-        snc_data = read_and_regrid(pointers['snc_nc'], sVarnames[7], lons2, lats2)
-        E.add_to_filelist(pointers['snc_nc'])
+        snc_key = 'snc_nc'
+    keys = ['albisccp_nc', 'pctisccp_nc', 'cltisccp_nc', 'rsut_nc',
+            'rsutcs_nc', 'rlut_nc', 'rlutcs_nc', snc_key, 'sic_nc']
+    files = [(pointers[key], sVarname) for key, sVarname in zip(keys, sVarnames)]
+    for key in keys[:7] + ['sic_nc', snc_key]:
+        E.add_to_filelist(pointers[key])
+
+    nt = min([get_time_steps(sSrcFilename) for sSrcFilename, __ in files])
+    print 'Number of data times in files ', nt
 
     # -----------------------------------------------------------
 
@@ -436,60 +509,52 @@ def crem_calc(E, pointers):
     model_ncf[:] = 999.9
     rCREMpd[:] = 999.9
 
-    # Normalize data used for assignment to regimes to be in the range 0-1
-    pctisccp_data = pctisccp_data / 100000.0
-    cltisccp_data = cltisccp_data / 100.0
+    # Number of points and cloud forcing per regime, summed over all chunks
+    sums = {'npoints': np.zeros(3, dtype=int),
+            'count': np.zeros((3, 7), dtype=int),
+            'swcf': np.zeros((3, 7)),
+            'lwcf': np.zeros((3, 7))}
 
-    # Calculate cloud forcing
-    swcf_data = rsutcs_data - rsut_data
-    lwcf_data = rlutcs_data - rlut_data
+    tropics = ((lats2 >= -20) & (lats2 <= 20))[None, :, None]
 
     print 'Assigning data to observational cloud regimes'
-    for region in range(3):  # over 3 regions (tropics, extra tropics, snow/ice)
-
-        # Set up validity mask for region
-
-        mask = pctisccp_data.copy()
-        if region == 0:
-            mask[:, (lats2 < -20) | (lats2 > 20), :] = np.NAN
-        elif region == 1:
-            mask[:, (lats2 >= -20) & (lats2 <= 20), :] = np.NAN
-            mask[(snc_data >= 0.1) | (sic_data >= 0.1)] = np.NAN
-        elif region == 2:
-            mask[:, (lats2 >= -20) & (lats2 <= 20), :] = np.NAN
-            mask[(snc_data < 0.1) & (sic_data < 0.1)] = np.NAN
-
-        mask[cltisccp_data == 0.0] = np.NAN
-
-        points = np.isfinite(mask)
-        npoints = len(mask[points])  # Number of valid data points in region
-
-        group = np.zeros(npoints)
-        ed = np.zeros((npoints, nregimes[region]))
-
-        swcf_data_pts = swcf_data[points]
-        lwcf_data_pts = lwcf_data[points]
-
-        # Assign model data to observed regimes
-
-        for i in range(nregimes[region]):
-            ed[:, i] = ((albisccp_data[points] - obs_alb[region, i]) ** 2) + \
-                       ((pctisccp_data[points] - obs_pct[region, i]) ** 2) + \
-                       ((cltisccp_data[points] - obs_clt[region, i]) ** 2)
-
-        group[:] = np.argmin(ed, axis=1)
+    for start in range(0, nt, time_chunk):
+        time_slice = slice(start, min(start + time_chunk, nt))
+        print 'Reading and regridding time steps %d-%d' % (time_slice.start + 1,
+                                                            time_slice.stop)
+        albisccp_data, pctisccp_data, cltisccp_data, rsut_data, rsutcs_data, \
+            rlut_data, rlutcs_data, snc_data, sic_data = \
+            read_and_regrid_all(files, lons2, lats2, time_slice)
+
+        # Normalize data used for assignment to regimes to be in the range 0-1
+        # Calculate cloud forcing
+        data = {'albisccp': albisccp_data,
+                'pctisccp': pctisccp_data / 100000.0,
+                'cltisccp': cltisccp_data / 100.0,
+                'swcf': rsutcs_data - rsut_data,
+                'lwcf': rlutcs_data - rlut_data}
+
+        # Validity masks of the 3 regions (tropics, extra tropics, snow/ice)
+        valid = np.isfinite(data['pctisccp']) & (data['cltisccp'] != 0.0)
+        snow_ice = (snc_data >= 0.1) | (sic_data >= 0.1)
+        no_snow_ice = (snc_data < 0.1) & (sic_data < 0.1)
+        region_points = [valid & tropics,
+                         valid & ~tropics & ~snow_ice,
+                         valid & ~tropics & ~no_snow_ice]
+
+        assign_regimes(data, region_points, obs_alb, obs_pct, obs_clt,
+                       nregimes, sums)
 
+    for region in range(3):
         for i in range(nregimes[region]):
-            mem = (group == i)
-
-            count = len(group[mem])
+            count = sums['count'][region, i]
 
             if count > 0:
 
-                model_rfo[region, i] = float(count) / float(npoints)
-                model_ncf[region, i] = np.average(swcf_data_pts[mem]) \
+                model_rfo[region, i] = float(count) / float(sums['npoints'][region])
+                model_ncf[region, i] = sums['swcf'][region, i] / count \
                                        * solar_weights[region] +      \
-                                       np.average(lwcf_data_pts[mem])
+                                       sums['lwcf'][region, i] / count
             else:
                 print("Model does not reproduce all observed cloud regimes.")
                 print("Cannot calculate CREM. Abort.")
@@ -1,8 +1,16 @@
 import pdb
 import sys
 import commands
+import json
+import os
 import string
 
+# Cache of the NCL version, keyed by the path and mtime of the NCL binary
+# (outside interface_data/, which is cleaned during a run)
+ncl_version_cache = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                                os.path.expanduser('~/.cache')),
+                                 'esmvaltool', 'ncl_version.json')
+
 
 class nclExecuteError(Exception):
     def __init__(self, value):
@@ -93,21 +101,60 @@ def print_header(projdict, opt):
         info("REFORMATTING THE OBSERVATIONAL DATA...", vv, 1)
     info("", vv, 1)
 
-def ncl_version_check():
-    """ @brief Check the NCL version
+def find_executable(name):
+    """ @brief Return the full path of an executable in $PATH (or None)
     """
-    out = commands.getstatusoutput("ncl -V")
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        executable = os.path.join(path, name)
+        if os.path.isfile(executable) and os.access(executable, os.X_OK):
+            return os.path.realpath(executable)
+    return None
+
+
+def get_ncl_version():
+    """ @brief Return the version of the NCL binary in $PATH
+
+        "ncl -V" is only called if the NCL binary changed since the
+        version was cached (see ncl_version_cache).
+    """
+    ncl = find_executable("ncl")
+    if ncl is None:
+        error("NCL not found")
+    key = [ncl, os.stat(ncl).st_mtime]
+
+    try:
+        with open(ncl_version_cache) as f:
+            cached = json.load(f)
+        if cached['key'] == key:
+            return cached['version']
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
 
+    out = commands.getstatusoutput("ncl -V")
     if out[0] != 0:
         error("NCL not found")
+    try:
+        if not os.path.isdir(os.path.dirname(ncl_version_cache)):
+            os.makedirs(os.path.dirname(ncl_version_cache))
+        with open(ncl_version_cache, 'w') as f:
+            json.dump({'key': key, 'version': out[1]}, f)
+    except (IOError, OSError):
+        pass
+    return out[1]
+
+
+def ncl_version_check():
+    """ @brief Check the NCL version
+    """
+    version = get_ncl_version()
 
-    if out[1] == "6.3.0":
-        error("NCL version " + out[1] + 
+    if version == "6.3.0":
+        error("NCL version " + version + 
               " not supported due to a bug " + 
               "(see Known Issues in the ESMValTool user guide)")
 
-    if int(out[1].split(".")[0]) < 6:
-        error("NCL version " + out[1] + " not supported, need version 6.2.0 or higher")
+    if int(version.split(".")[0]) < 6:
+        error("NCL version " + version + " not supported, need version 6.2.0 or higher")
 
-    if int(out[1].split(".")[0]) == 6 and int(out[1].split(".")[1]) < 2:
-        error("NCL version " + out[1] + " not supported, need version 6.2.0 or higher")
+    if int(version.split(".")[0]) == 6 and int(version.split(".")[1]) < 2:
+        error("NCL version " + version + " not supported, need version 6.2.0 or higher")
@@ -0,0 +1,216 @@
+"""
+Catalogue of the input data directories
+
+The input file lookups of the project classes (get_cf_infile,
+get_cf_infiles) and of Diagnostic.select_base_vars probe the file system
+with os.path.isfile/glob.glob. With a catalogue in use (GLOBAL/
+data_catalogue in the namelist) these lookups are served from an SQLite
+index of the directory listings instead:
+
+    dirs      - path and modification time of each indexed directory
+    files     - entry names per directory, whether they are files, and
+                the years of their DRS date range (e.g.,
+                "..._185001-200512.nc"), as used by select_infiles
+
+A directory is (re-)listed only if its modification time changed since
+it was indexed, and checked at most once per run. The index can be
+built in advance for whole data roots:
+
+    python interface_scripts/data_catalogue.py catalogue.sqlite ROOT [ROOT ...]
+"""
+import fnmatch
+import glob as glob_module
+import os
+import pdb
+import re
+import sqlite3
+import sys
+import threading
+
+# Date range in DRS file names, e.g., "..._185001-200512.nc"
+drs_date_range = re.compile("_([0-9]{4})[0-9]*-([0-9]{4})[0-9]*(-clim)?\\.nc$")
+
+# Version of the index tables, older indexes are rebuilt
+catalogue_version = 2
+
+# The catalogue in use (None: query the file system directly)
+catalogue = None
+
+
+class Data_catalogue(object):
+    """ @brief SQLite index of directory listings
+    """
+    def __init__(self, db_file):
+        """ @param db_file Path of the SQLite database (created if needed)
+        """
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != catalogue_version:
+            self.connection.execute("DROP TABLE IF EXISTS dirs")
+            self.connection.execute("DROP TABLE IF EXISTS files")
+            self.connection.execute("PRAGMA user_version = "
+                                    + str(catalogue_version))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS dirs "
+                                "(path TEXT PRIMARY KEY, mtime REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files "
+                                "(dir TEXT, name TEXT, is_file INTEGER, "
+                                "start_year INTEGER, end_year INTEGER, "
+                                "PRIMARY KEY (dir, name))")
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+        # Listings already checked during this run, per directory a
+        # dictionary name: (is_file, start_year, end_year)
+        self.listings = {}
+
+    def index_dir(self, path, mtime):
+        """ @brief (Re-)list a directory into the index
+            @return List of (name, is_file, start_year, end_year) rows
+        """
+        rows = []
+        for name in os.listdir(path):
+            is_file = os.path.isfile(os.path.join(path, name))
+            match = drs_date_range.search(name)
+            if match is None:
+                rows.append((name, is_file, None, None))
+            else:
+                rows.append((name, is_file,
+                             int(match.group(1)), int(match.group(2))))
+        self.connection.execute("DELETE FROM files WHERE dir = ?", (path,))
+        self.connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+                                    [(path,) + row for row in rows])
+        self.connection.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)",
+                                (path, mtime))
+        self.connection.commit()
+        return rows
+
+    def get_listing(self, path):
+        """ @brief Return the entries of a directory
+            @param path The directory
+            @return Dictionary name: (is_file, start_year, end_year),
+                    empty if the directory does not exist
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            if path in self.listings:
+                return self.listings[path]
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                return {}
+            row = self.connection.execute("SELECT mtime FROM dirs WHERE path = ?",
+                                          (path,)).fetchone()
+            if row is not None and row[0] == mtime:
+                rows = self.connection.execute("SELECT name, is_file, "
+                                               "start_year, end_year "
+                                               "FROM files WHERE dir = ?",
+                                               (path,)).fetchall()
+            else:
+                rows = self.index_dir(path, mtime)
+            listing = dict([(name, (bool(is_file), start_year, end_year))
+                            for name, is_file, start_year, end_year in rows])
+            self.listings[path] = listing
+            return listing
+
+    def list_dir(self, path):
+        """ @brief Return the names of the entries of a directory
+        """
+        return self.get_listing(path).keys()
+
+    def forget(self, path):
+        """ @brief Check a directory again on its next lookup
+        """
+        with self.lock:
+            self.listings.pop(os.path.abspath(path), None)
+
+    def glob(self, pattern):
+        """ @brief Return the paths matching a pattern, see glob.glob
+        """
+        dirname, basename = os.path.split(pattern)
+        if glob_module.has_magic(dirname):
+            return glob_module.glob(pattern)
+        names = self.list_dir(dirname or os.curdir)
+        if not basename.startswith('.'):
+            names = [name for name in names if not name.startswith('.')]
+        return [os.path.join(dirname, name)
+                for name in fnmatch.filter(names, basename)]
+
+    def isfile(self, path):
+        """ @brief Check whether a file (not a directory) is listed in
+                   its directory
+        """
+        dirname, basename = os.path.split(path)
+        entry = self.get_listing(dirname or os.curdir).get(basename)
+        return entry is not None and entry[0]
+
+    def get_years(self, path):
+        """ @brief Return the years of the DRS date range of a file
+            @return (start_year, end_year), or None if the file is not
+                    listed or has no date range
+        """
+        dirname, basename = os.path.split(path)
+        entry = self.get_listing(dirname or os.curdir).get(basename)
+        if entry is None or entry[1] is None:
+            return None
+        return entry[1], entry[2]
+
+    def crawl(self, root):
+        """ @brief Index all directories below root
+            @return Number of indexed directories
+        """
+        count = 0
+        for path, dirs, files in os.walk(root):
+            self.list_dir(path)
+            count += 1
+        return count
+
+
+def use_catalogue(project_info):
+    """ @brief Use the catalogue given in the namelist (if any)
+        @param project_info Current namelist in dictionary format
+    """
+    global catalogue
+    if 'data_catalogue' in project_info['GLOBAL']:
+        catalogue = Data_catalogue(project_info['GLOBAL']['data_catalogue'])
+
+
+def glob(pattern):
+    """ @brief glob.glob, served from the catalogue if in use
+    """
+    pattern = os.path.expandvars(pattern)
+    if catalogue is None:
+        return glob_module.glob(pattern)
+    return catalogue.glob(pattern)
+
+
+def isfile(path):
+    """ @brief os.path.isfile, served from the catalogue if in use
+    """
+    if catalogue is None:
+        return os.path.isfile(path)
+    return catalogue.isfile(path)
+
+
+def get_years(path):
+    """ @brief Return the years of the DRS date range in a file name
+        @return (start_year, end_year), or None if there is none
+
+        With a catalogue in use the years are read from its index.
+    """
+    if catalogue is None:
+        match = drs_date_range.search(os.path.basename(path))
+        if match is None:
+            return None
+        return int(match.group(1)), int(match.group(2))
+    return catalogue.get_years(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.stderr.write("usage: " + sys.argv[0]
+                         + " catalogue.sqlite ROOT [ROOT ...]\n")
+        sys.exit(1)
+    data_catalogue = Data_catalogue(sys.argv[1])
+    for root in sys.argv[2:]:
+        print root + ": " + str(data_catalogue.crawl(root)) + " directories"
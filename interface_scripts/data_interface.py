@@ -4,8 +4,36 @@ import os
 import pdb
 import projects
 import re
+import run_manifest
 from auxiliary import info
 
+# Interface loaders, read once per process
+templates = {}
+
+
+def read_template(template_file):
+    """ @brief Return the content of an interface loader (cached)
+    """
+    if template_file not in templates:
+        fsource = open(template_file, "r")
+        templates[template_file] = fsource.read()
+        fsource.close()
+    return templates[template_file]
+
+
+def write_if_changed(target_file, content):
+    """ @brief Write a file, unless it already holds the given content
+    """
+    if os.path.isfile(target_file):
+        ftarget = open(target_file, "rb")
+        unchanged = ftarget.read() == content
+        ftarget.close()
+        if unchanged:
+            return
+    ftarget = open(target_file, "wb")
+    ftarget.write(content)
+    ftarget.close()
+
 
 class ESMValTool_interface(object):
     def __init__(self):
@@ -130,8 +158,7 @@ class Data_interface(object):
         figfiles_suffix = []
 
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = model.get_project()
 
             figfiles_suffix.append(currProject.get_figure_file_names(project_info,
                                                                      model,
@@ -171,8 +198,7 @@ class Data_interface(object):
 
         # Collect and extend the model_specifiers array.
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = model.get_project()
 
             for mspec in currProject.model_specifiers:
                 if mspec not in model_specifiers:
@@ -190,8 +216,7 @@ class Data_interface(object):
         # project lacks a certain specifier it can explicitly added through the
         # add_specifier-array or it is given the value 'No_value'.
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = model.get_project()
 
             models_tmp = []
             for mspecs in model_specifiers:
@@ -267,37 +292,94 @@ class Data_interface(object):
 
         return variable_info_true, variable_info
 
-    def write_env_projinfo(self, project_info):
-        """ @brief Writes XML-file information to env. variables
+    @staticmethod
+    def get_env_projinfo(project_info):
+        """ @brief Return the project_info entries passed on to scripts
             @param project_info Current namelist in dictionary format
-
-            Information between Python and NCL is (partially) exchanged
-            through environment variables. This function write the
-            project_info-dictionary content to environment variables
-            prefixed with "ESMValTool_".
+            @return Dictionary of "ESMValTool_"-prefixed (string) entries
         """
         verbosity = project_info['GLOBAL']['verbosity']
 
+        env_projinfo = {}
         for section_key in ['GLOBAL', 'RUNTIME', 'TEMPORARY']:
             if section_key in project_info.keys():
                 for key in project_info[section_key]:
                     info("writing key to env. variable, key=" + key,
                          verbosity, required_verbosity=11)
                     # Check and fail on duplicate entries
-                    if "ESMValTool_" + key in os.environ:
+                    if "ESMValTool_" + key in env_projinfo:
                         raise writeProjinfoError("Environment variable "
                                                  + "'ESMValTool_" + key
                                                  + "' already defined")
 
-                    os.environ["ESMValTool_" + key] = \
+                    env_projinfo["ESMValTool_" + key] = \
                         str(project_info[section_key][key])
+        return env_projinfo
 
-    def clean_up_interface_folder(self, exceptions):
+    @staticmethod
+    def write_env_projinfo(project_info, environ=None):
+        """ @brief Writes XML-file information to env. variables
+            @param project_info Current namelist in dictionary format
+            @param environ Environment mapping to write to (defaults to
+                           os.environ)
+            @return The entries written
+
+            Information between Python and NCL is (partially) exchanged
+            through environment variables. This function write the
+            project_info-dictionary content to environment variables
+            prefixed with "ESMValTool_".
+        """
+        if environ is None:
+            environ = os.environ
+
+        env_projinfo = Data_interface.get_env_projinfo(project_info)
+        for key in env_projinfo:
+            if key in environ:
+                raise writeProjinfoError("Environment variable '" + key
+                                         + "' already defined")
+        environ.update(env_projinfo)
+        return env_projinfo
+
+    def get_variable_info(self):
+        """ @brief Return the parsed variable_info of all variables
+            @return Dictionary variable: (variable_info_true, variable_info)
+        """
+        variable_info = {}
+        if 'variables' in vars(self.interface):
+            variable_def_dir = self.interface.variable_def_dir[0]
+            for curr_var in self.interface.variables:
+                variable_info[curr_var] \
+                    = self.reparse_variable_info(curr_var, variable_def_dir)
+        return variable_info
+
+    def write_run_manifest(self, env_projinfo, interface_dir):
+        """ @brief Write the run manifest of a job to its interface folder
+            @param env_projinfo The "ESMValTool_"-entries of the job, as
+                                returned by get_env_projinfo
+            @param interface_dir Folder to write the manifest to
+
+            The manifest (see run_manifest.py) holds the project_info
+            entries as global attributes and the interface arrays as
+            variables. It is read by the NCL/R interface loaders and
+            by run_manifest.read_run_manifest.
+        """
+        arrays = [(key, value) for key, value
+                  in sorted(vars(self.interface).items())
+                  if isinstance(value, list)
+                  and key not in ["repackage_these", "from_proj_info"]]
+        write_if_changed(os.path.join(interface_dir,
+                                      run_manifest.run_manifest_name),
+                         run_manifest.encode_run_manifest(
+                             sorted(env_projinfo.items()), arrays))
+
+    def clean_up_interface_folder(self, exceptions,
+                                  interface_dir="./interface_data"):
         """ @brief Remove files from the interface_data/-folder
             @param exceptions Do not remove these entries
+            @param interface_dir The interface folder to clean up
         """
         # Clean up interface-folder
-        listdir = os.listdir("./interface_data/")
+        listdir = os.listdir(interface_dir)
 
         # Remove exceptions from listdir
         for listitem in exceptions:
@@ -305,7 +387,7 @@ class Data_interface(object):
                 listdir.remove(listitem)
 
         for direntry in listdir:
-            os.remove(os.path.join("./interface_data", direntry))
+            os.remove(os.path.join(interface_dir, direntry))
 
 
 class Ncl_data_interface(Data_interface):
@@ -325,8 +407,7 @@ class Ncl_data_interface(Data_interface):
         # of the current data sets
         self.interface.dict_keys = []
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = model.get_project()
 
             self.interface.dict_keys.append(currProject.get_dict_key(model, self.mip, self.exp))
 
@@ -337,91 +418,61 @@ class Ncl_data_interface(Data_interface):
             if class_regex.search(self.interface.diag_script_cfg[0]) is None:
                 del(self.interface.diag_script_cfg)
 
-    def write_data_to_interface(self):
+    def write_data_to_interface(self, environ=None,
+                                interface_dir="interface_data"):
         """ @brief Write the configuration data to NCL format
+            @param environ Environment mapping for the project_info entries
+                           (defaults to os.environ)
+            @param interface_dir Folder to write the interface files to
 
             This routine writes the configuration data from the xml-,
-            diagnostic_def/-files to NCL formatted files the
-            interface_data/-folder. These files are then read by the
-            NCL diag_scripts.
+            diagnostic_def/-files to the run manifest and the NCL
+            formatted variable_info files of the interface_data/-folder.
+            The NCL diag_scripts read the manifest through the static
+            ncl.interface loader. Files already holding the same content
+            (e.g., for consecutive calls with the same models) are
+            not rewritten.
         """
-        self.clean_up_interface_folder(self.do_not_remove_these)
-
-        fsource = open("interface_data/ncl_interface_templates/ncl.tmpl", "r")
-        ftarget = open("interface_data/ncl.interface", "w")
-
-        # Replace template file placeholders, <<[A-Z_]+>>, with
-        # configuration data
-        ncl_src = fsource.readlines()
-        for line in ncl_src:
-            if re.search("<<[A-Z_]+>>", line):
-                # left_hand_side, place_holder, right_hand_side
-                lhs, place_holder, rhs \
-                    = re.search("(.*)<<([A-Z_]+)>>(.*)", line).group(1, 2, 3)
-                if place_holder.lower() in vars(self.interface):
-                    place_holder = vars(self.interface)[place_holder.lower()]
-
-                    # Extend 'lhs' array with white space elements
-                    len_lhs = len(lhs)
-                    lhs = [lhs]
-                    lhs.extend([" " * len_lhs] * len(place_holder))
-
-                    # Zip lhs- and placeholder- arrays to a new array. The
-                    # whitespace entries in lhs-array provides alignment
-                    # if/when data is written to file
-                    if isinstance(place_holder[0], int):
-                        place_holder = [str(ph) for ph in place_holder]
-
-                    else:  # Assume string
-                        place_holder = ['"' + ph + '"' for ph in place_holder]
-
-                    place_holder = [item1 + item2
-                                    for item1, item2 in zip(lhs, place_holder)]
-                    ftarget.write(', \\\n'.join(place_holder) + rhs + '\n')
-                else:
-                    pass
+        variable_info_all = self.get_variable_info()
+        interface_files = ["ncl.interface", run_manifest.run_manifest_name]
+        interface_files.extend([curr_var + "_info.tmp"
+                                for curr_var in variable_info_all])
+        self.clean_up_interface_folder(self.do_not_remove_these
+                                       + interface_files,
+                                       interface_dir)
+
+        # The (static) loader reads the interface arrays and the
+        # project_info entries from the run manifest
+        write_if_changed(os.path.join(interface_dir, "ncl.interface"),
+                         read_template("interface_data/ncl_interface_templates/ncl.interface"))
+        env_projinfo = self.write_env_projinfo(self.project_info, environ)
+        self.write_run_manifest(env_projinfo, interface_dir)
+
+        # Write the parsed var_def/-file content to temp-files in interface_data
+        for curr_var, (variable_info_true, variable_info) \
+                in variable_info_all.items():
+            variable_info_file = os.path.join(interface_dir,
+                                              curr_var + "_info.tmp")
+            if variable_info_true:
+                # A-laue_ax+
+                # Attributes of "variable_info" that are arrays might cause
+                # problems if more than one variable is used by a diagnostic
+                # script as this effectively leads to a redefinition of the
+                # already defined variable attributes. The redefinition will
+                # fail if the number of array elements does not match the
+                # "new" number of array elements.
+                # Work-around: delete "variable_info" if already defined.
+                fvarinfo = 'if (isvar("variable_info")) then\n'
+                fvarinfo += '    delete(variable_info)\n'
+                fvarinfo += 'end if\n'
+                # A-laue_ax-
+                variable_info = ["variable_info@" + key + "=" + value
+                                 for key, value in variable_info]
+
+                fvarinfo += 'variable_info = True\n' + '\n'.join(variable_info)
             else:
-                ftarget.write(line)
-        fsource.close()
-        ftarget.close()
-
-        # Write proj_info to environment variables
-        self.write_env_projinfo(self.project_info)
-
-        # Read and parse the var_def/-file
-        if 'variables' in vars(self.interface):
-            for curr_var in self.interface.variables:
-                variable_def_dir = self.interface.variable_def_dir[0]
-
-                variable_info_true, variable_info\
-                    = self.reparse_variable_info(curr_var, variable_def_dir)
-
-                # Write parsed content to temp-file in interface_data
-                variable_info_file = "interface_data/"\
-                                     + curr_var\
-                                     + "_info.tmp"
-                fvarinfo = open(variable_info_file, "w")
-
-                if variable_info_true:
-                    # A-laue_ax+
-                    # Attributes of "variable_info" that are arrays might cause
-                    # problems if more than one variable is used by a diagnostic
-                    # script as this effectively leads to a redefinition of the
-                    # already defined variable attributes. The redefinition will
-                    # fail if the number of array elements does not match the
-                    # "new" number of array elements.
-                    # Work-around: delete "variable_info" if already defined.
-                    fvarinfo.write('if (isvar("variable_info")) then\n')
-                    fvarinfo.write('    delete(variable_info)\n')
-                    fvarinfo.write('end if\n')
-                    # A-laue_ax-
-                    variable_info = ["variable_info@" + key + "=" + value
-                                     for key, value in variable_info]
-
-                    fvarinfo.write('variable_info = True\n' + '\n'.join(variable_info))
-                else:
-                    fvarinfo.write('variable_info = False')
-                fvarinfo.close()
+                fvarinfo = 'variable_info = False'
+            write_if_changed(variable_info_file, fvarinfo)
 
 
 class R_data_interface(Data_interface):
@@ -436,69 +487,41 @@ class R_data_interface(Data_interface):
         """
         Data_interface.__init__(self, project_info)
 
-    def write_data_to_interface(self):
+    def write_data_to_interface(self, environ=None,
+                                interface_dir="interface_data"):
         """ @brief Write the configuration data to Matlab format
+            @param environ Environment mapping for the project_info entries
+                           (defaults to os.environ)
+            @param interface_dir Folder to write the interface files to
         """
-        self.clean_up_interface_folder(self.do_not_remove_these)
-
-        fsource = open("interface_data/r_interface_templates/r.tmpl", "r")
-        ftarget = open("interface_data/r.interface", "w")
-        line_cont = ', \n'
-
-        # Replace template file placeholders, <<[A-Z_]+>>, with
-        # configuration data
-        r_src = fsource.readlines()
-        for line in r_src:
-            if re.search("<<[A-Z_]+>>", line):
-                # left_hand_side, place_holder, right_hand_side
-                lhs, place_holder, rhs \
-                    = re.search("(.*)<<([A-Z_]+)>>(.*)", line).group(1, 2, 3)
-                if place_holder.lower() in vars(self.interface):
-                    place_holder = vars(self.interface)[place_holder.lower()]
-
-                    # Extend 'lhs' array with white space elements
-                    len_lhs = len(lhs)
-                    lhs = [lhs]
-                    lhs.extend([" " * len_lhs] * len(place_holder))
-
-                    # Zip lhs- and placeholder- arrays to a new array. The
-                    # whitespace entries in lhs-array provides alignment
-                    # if/when data is written to file
-                    place_holder = ['"' + str(ph) + '"' for ph in place_holder]
-                    place_holder = [item1 + item2
-                                    for item1, item2 in zip(lhs, place_holder)]
-                    ftarget.write(line_cont.join(place_holder) + rhs + '\n')
-                else:
-                    pass
+        variable_info_all = self.get_variable_info()
+        interface_files = ["r.interface", run_manifest.run_manifest_name]
+        interface_files.extend([curr_var + "_info.tmp"
+                                for curr_var in variable_info_all])
+        self.clean_up_interface_folder(self.do_not_remove_these
+                                       + interface_files,
+                                       interface_dir)
+
+        # The (static) loader reads the interface arrays and the
+        # project_info entries from the run manifest
+        write_if_changed(os.path.join(interface_dir, "r.interface"),
+                         read_template("interface_data/r_interface_templates/r.interface"))
+        env_projinfo = self.write_env_projinfo(self.project_info, environ)
+        self.write_run_manifest(env_projinfo, interface_dir)
+
+        # Write the parsed var_def/-file content to temp-files in data_interface
+        for curr_var, (variable_info_true, variable_info) \
+                in variable_info_all.items():
+            variable_info_file = os.path.join(interface_dir,
+                                              curr_var + "_info.tmp")
+            if variable_info_true:
+                variable_info = ["variable_info@" + key + " <- " + value
+                                 for key, value in variable_info]
+
+                fvarinfo = 'variable_info <- True\n' + '\n'.join(variable_info)
             else:
-                ftarget.write(line)
-        fsource.close()
-        ftarget.close()
-
-        # Write proj_info to environment variables
-        self.write_env_projinfo(self.project_info)
-        # Read and parse the var_def/-file
-        if 'variables' in vars(self.interface):
-            for curr_var in self.interface.variables:
-                variable_def_dir = self.interface.variable_def_dir[0]
-
-                variable_info_true, variable_info\
-                    = self.reparse_variable_info(curr_var, variable_def_dir)
-
-                # Write parsed content to temp-file in data_interface
-                variable_info_file = "interface_data/"\
-                                     + curr_var\
-                                     + "_info.tmp"
-                fvarinfo = open(variable_info_file, "w")
-
-                if variable_info_true:
-                    variable_info = ["variable_info@" + key + " <- " + value
-                                     for key, value in variable_info]
-
-                    fvarinfo.write('variable_info <- True\n' + '\n'.join(variable_info))
-                else:
-                    fvarinfo.write('variable_info <- False')
-                fvarinfo.close()
+                fvarinfo = 'variable_info <- False'
+            write_if_changed(variable_info_file, fvarinfo)
 
 
 class Py_data_interface(Data_interface):
@@ -513,7 +536,15 @@ class Py_data_interface(Data_interface):
         """
         Data_interface.__init__(self, project_info)
 
-    def write_data_to_interface(self):
+    def write_data_to_interface(self, environ=None,
+                                interface_dir="interface_data"):
         """ @brief Write the configuration data to Matlab format
+            @param environ Environment mapping for the project_info entries
+                           (defaults to os.environ)
+            @param interface_dir Folder to write the interface files to
         """
-        self.clean_up_interface_folder(self.do_not_remove_these)
+        self.clean_up_interface_folder(self.do_not_remove_these
+                                       + [run_manifest.run_manifest_name],
+                                       interface_dir)
+        env_projinfo = self.write_env_projinfo(self.project_info, environ)
+        self.write_run_manifest(env_projinfo, interface_dir)
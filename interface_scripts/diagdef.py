@@ -18,6 +18,8 @@ from auxiliary import info
 import re
 import copy
 import os
+import data_catalogue
+import projects
 import reformat
 import operator
 import glob
@@ -333,26 +335,7 @@ class Diagnostic:
                 continue
 
             # first try: use base variables provided by variable_defs script
-            os.environ['__ESMValTool_base_var'] = base_var.var
-            infile = reformat.infile(currProject,
-                                     project_info,
-                                     base_var,
-                                     model)
-            precomputed = currProject.get_cf_fullpath(project_info,
-                                                      model,
-                                                      base_var.fld,
-                                                      base_var.var,
-                                                      base_var.mip,
-                                                      base_var.exp)
-
-            if (len(glob.glob(infile) + glob.glob(precomputed)) == 0):
-                info(" No input files found for " + base_var.var +
-                     " (" + base_var.fld + ") as " + infile, verbosity, 1)
-
-                base_var.var = base_var.var0
-                base_var.fld = base_var.fld0
-
-                # try again with input variable = base variable (non derived)
+            with projects.base_var_scope(base_var.var):
                 infile = reformat.infile(currProject,
                                          project_info,
                                          base_var,
@@ -364,7 +347,27 @@ class Diagnostic:
                                                           base_var.mip,
                                                           base_var.exp)
 
-                if (len(glob.glob(infile) + glob.glob(precomputed)) == 0):
+            if (len(data_catalogue.glob(infile) + glob.glob(precomputed)) == 0):
+                info(" No input files found for " + base_var.var +
+                     " (" + base_var.fld + ") as " + infile, verbosity, 1)
+
+                base_var.var = base_var.var0
+                base_var.fld = base_var.fld0
+
+                # try again with input variable = base variable (non derived)
+                with projects.base_var_scope(base_var.var):
+                    infile = reformat.infile(currProject,
+                                             project_info,
+                                             base_var,
+                                             model)
+                    precomputed = currProject.get_cf_fullpath(project_info,
+                                                              model,
+                                                              base_var.fld,
+                                                              base_var.var,
+                                                              base_var.mip,
+                                                              base_var.exp)
+
+                if (len(data_catalogue.glob(infile) + glob.glob(precomputed)) == 0):
                     raise exceptions.IOError(2, "No input files found in ",
                                              infile)
                 else:
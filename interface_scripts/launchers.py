@@ -1,4 +1,5 @@
 from auxiliary import nclExecuteError, nclExecuteWarning, error, info
+import collections
 import os
 import pdb
 import re
@@ -7,6 +8,30 @@ import sys
 import string
 import StringIO
 import contextlib
+import threading
+
+# Serializes the screen output of launchers running in parallel threads
+output_lock = threading.Lock()
+
+# Number of output lines repeated in the error report of a launcher
+output_tail_lines = 200
+
+# Environment variables kept after the execution of a launcher
+persistent_env_variables = ['ESMValTool_data_root']
+
+
+def get_job_environ():
+    """ @brief Return a private environment for a launcher
+        @return A copy of os.environ without the (non-persistent)
+                'ESMValTool_'-prefixed variables
+
+        Launchers running in parallel cannot share os.environ, instead
+        each of them is given a copy to which its own project_info
+        entries are written.
+    """
+    return dict([(key, value) for key, value in os.environ.items()
+                 if re.search('^ESMValTool_', key) is None
+                 or key in persistent_env_variables])
 
 @contextlib.contextmanager
 def stdoutIO(std_outerr=None):
@@ -25,9 +50,21 @@ def stdoutIO(std_outerr=None):
 
 class launchers(object):
     def __init__(self):
-        self.persistent_env_variables = ['ESMValTool_data_root']
+        self.persistent_env_variables = persistent_env_variables
         self.filename = os.path.join(os.path.dirname(__file__),                   
                                         '../interface_data/curr_trace_indent.txt') 
+        self.cwd = None
+
+    def set_cwd(self, cwd):
+        """ @brief Use a private working directory for the launched process
+            @param cwd Working directory with its own interface_data/-folder,
+                       or None to run in the current working directory
+        """
+        self.cwd = cwd
+        if cwd is not None:
+            self.filename = os.path.join(cwd, 'interface_data',
+                                         'curr_trace_indent.txt')
+
     def convert_arguments(self):
         """
         convert launcher arguments to a dictionary
@@ -48,88 +85,143 @@ class launchers(object):
             # input to the dict() command. As a result one obtains a dictionary
             exec 'self.launch_args = dict(' + self.arguments + ')'
 
-    def write_stdouterr(self, std_outerr, verbosity, exit_on_warning):
-        """ @brief Filder and write subprocess output to screen
-            @param std_outerr Array with stdout/stderr mixed
+    def get_warnings_to_ignore(self):
+        """ @brief Return the warnings to suppress, written to the ignore
+                   file by the (running) diagnostic script
+        """
+        warnings_ignore_file = "interface_data/warnings_to_ignore.txt"
+        if self.cwd is not None:
+            warnings_ignore_file = os.path.join(self.cwd, warnings_ignore_file)
+        if not os.path.isfile(warnings_ignore_file):
+            return []
+        with open(warnings_ignore_file) as fin:
+            return [w.strip() for w in fin.readlines()]
+
+    def run_process(self, command, verbosity, exit_on_warning, env=None,
+                    cwd=None, shell=False):
+        """ @brief Run a process, filtering its output while it runs
+            @param command Command to execute (list, or string if shell)
             @param verbosity Integer controling the verbosity of the output
             @param exit_on_warning Boolean defining whether the wrapper should
                                    exit on warnings
-        """
-        # Supress some warnings if they've been written to the ignore file
-        # (this should be done by the diagnostic script)
-        warnings_ignore_file = "interface_data/warnings_to_ignore.txt"
-        if os.path.isfile(warnings_ignore_file):
-            fin = open(warnings_ignore_file)
-            diag_specific_warnings_to_ignore = fin.readlines()
-        else:
-            diag_specific_warnings_to_ignore = []
-
-        # Suppress version info output and empty lines
-        info = [line for line in range(len(std_outerr)) if ((line > self.filter_max_line) and len(std_outerr[line]) > 0)]
+            @param env Private environment for the process (optional)
+            @param cwd Private working directory for the process (optional)
+            @param shell Run the command through the shell
 
-        fatal = [line for line in range(len(std_outerr))
-                 if re.search(self.fatal_string, std_outerr[line], re.IGNORECASE)]
+            stdout and stderr are read line by line as they are written
+            (the pipe never fills up) and passed to an output_filter.
+        """
+        run_application = subprocess.Popen(command, shell=shell,
+                                           stdin=open(os.devnull),
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT,
+                                           env=env, cwd=cwd)
+        output = output_filter(self, verbosity, exit_on_warning)
+        for line in iter(run_application.stdout.readline, ''):
+            output.add_line(line.rstrip('\n'))
+        run_application.stdout.close()
+        run_application.wait()
+        output.finish()
 
-        error = [line for line in range(len(std_outerr))
-                 if re.search(self.error_string, std_outerr[line], re.IGNORECASE)]
 
-        warning = [line for line in range(len(std_outerr))
-                   if re.search(self.warning_string, std_outerr[line], re.IGNORECASE)]
+class output_filter(object):
+    """ @brief Classifies and forwards the output of a launched process
 
-        # Remove warnings to be skipped
-        warnings_to_skip = []
-        if len(diag_specific_warnings_to_ignore) == 0:
-            warnings_to_keep = warning
-        else:
-            warnings_to_keep = []
-            for line in warning:
-                if std_outerr[line].strip() in [w.strip() for w in diag_specific_warnings_to_ignore]:
-                    warnings_to_skip.append(line)
-                else:
-                    warnings_to_keep.append(line)
-
-        if len(fatal) > 0:
-            for line in [currLine for currLine in std_outerr]:
+        Each line is classified as fatal/error/warning in a single pass
+        of one compiled expression and forwarded to the screen right
+        away. Only the last output_tail_lines lines are kept, they are
+        repeated in the error report at the end.
+    """
+    def __init__(self, launcher, verbosity, exit_on_warning):
+        self.launcher = launcher
+        self.lang = launcher.lang
+        self.verbosity = verbosity
+        self.exit_on_warning = exit_on_warning
+        self.classifier = re.compile('(?P<fatal>' + launcher.fatal_string + ')|'
+                                     + '(?P<error>' + launcher.error_string + ')|'
+                                     + '(?P<warning>' + launcher.warning_string + ')',
+                                     re.IGNORECASE)
+        self.tail = collections.deque(maxlen=output_tail_lines)
+        self.line_no = -1
+        self.fatal = 0
+        self.error = 0
+        self.warning = 0
+        self.warnings_to_skip = []
+
+    def write(self, stream, text):
+        with output_lock:
+            stream.write(text + '\n')
+            stream.flush()
+
+    def add_line(self, line):
+        """ @brief Classify and forward a single line of output
+        """
+        self.line_no += 1
+        self.tail.append(line)
+        kinds = set([match.lastgroup for match in self.classifier.finditer(line)])
+
+        if 'fatal' in kinds:
+            self.fatal += 1
+        if 'error' in kinds:
+            self.error += 1
+        if 'warning' in kinds and 'fatal' not in kinds and 'error' not in kinds:
+            # Supress warnings written to the ignore file
+            # (this should be done by the diagnostic script)
+            if line.strip() in self.launcher.get_warnings_to_ignore():
+                self.warnings_to_skip.append(line)
+                return
+            self.warning += 1
+            self.write(sys.stderr, self.lang + " WARNING MESSAGE: " + line)
+            return
+
+        if self.verbosity > 10:
+            self.write(sys.stdout, line)
+        elif len(kinds) > 0:
+            self.write(sys.stderr, self.lang + " ERROR MESSAGE: " + line)
+        # Suppress version info output and empty lines
+        elif self.line_no > self.launcher.filter_max_line and len(line) > 0:
+            remove_quotation_marks = re.sub('"', '', line)
+            if re.search('.*info: (.*)', remove_quotation_marks) is not None:
+                output_string = re.search(".*info: (.*)", remove_quotation_marks).group(1)
+                self.write(sys.stdout, self.lang + " info: " + output_string)
+            else:
+                self.write(sys.stdout, line)
+
+    def write_tail(self):
+        with output_lock:
+            if self.line_no + 1 > len(self.tail):
+                sys.stderr.write(self.lang + " ERROR MESSAGE: ("
+                                 + str(self.line_no + 1 - len(self.tail))
+                                 + " earlier lines not repeated)\n")
+            for line in self.tail:
                 sys.stderr.write(self.lang + " ERROR MESSAGE: " + line + '\n')
+
+    def finish(self):
+        """ @brief Report the outcome once the process has finished
+        """
+        if self.fatal > 0:
+            self.write_tail()
             raise nclExecuteError(self.lang + " ERROR (see full NCL output above)")
 
-        if len(error) > 0:
-            for line in [currLine for currLine in std_outerr]:
-                sys.stderr.write(self.lang + " ERROR MESSAGE: " + line + '\n')
+        if self.error > 0:
 # A-laue_ax+
             # In contrast to "fatal" errors, we treat "normal" errors as warnings
             # and do not abort (except if "exit_on_warning" in the namelist is set
             # to "True".)
-            if exit_on_warning:
+            if self.exit_on_warning:
 # A-laue_ax-
+                self.write_tail()
                 raise nclExecuteError(self.lang + " ERROR (see full NCL output above)")
 
-        all_output_as_warning = False
-        if len(warnings_to_keep) > 0:
-            all_output_as_warning = True
-            for line in [currLine for currLine in std_outerr]:
-                sys.stderr.write(self.lang + " WARNING MESSAGE: " + line + '\n')
-            if exit_on_warning:
-                raise nclExecuteWarning(self.lang + " WARNING (see full NCL output above)")
-
-        if len(info) > 0 and verbosity <= 10 and not all_output_as_warning:
-            for line_no in info:
-                remove_quotation_marks = re.sub('"', '', std_outerr[line_no])
-                if re.search('.*info: (.*)', remove_quotation_marks) is not None:
-                    output_string = re.search(".*info: (.*)", remove_quotation_marks).group(1)
-                    sys.stdout.write(self.lang + " info: " + output_string + '\n')
-                else:
-                    sys.stdout.write(std_outerr[line_no] + '\n')
-
-        if verbosity > 10:
-            for line in [currLine for currLine in std_outerr]:
-                sys.stdout.write(line + '\n')
-
-        if len(warnings_to_skip) > 0:
-            sys.stdout.write(self.lang + " info: The following warnings were ignored (specified to" + '\n')
-            sys.stdout.write(self.lang + " info: be ignored in the diagnostic script)" + '\n')
-            for line in warnings_to_skip:
-                sys.stdout.write(self.lang + " info: " + std_outerr[line] + '\n')
+        if self.warning > 0 and self.exit_on_warning:
+            raise nclExecuteWarning(self.lang + " WARNING (see full NCL output above)")
+
+        if len(self.warnings_to_skip) > 0:
+            with output_lock:
+                sys.stdout.write(self.lang + " info: The following warnings were ignored (specified to" + '\n')
+                sys.stdout.write(self.lang + " info: be ignored in the diagnostic script)" + '\n')
+                for line in self.warnings_to_skip:
+                    sys.stdout.write(self.lang + " info: " + line + '\n')
 
 
 class ncl_launcher(launchers):
@@ -141,19 +233,25 @@ class ncl_launcher(launchers):
         self.fatal_string = 'fatal:'
         self.warning_string = 'warning:'
 
-    def execute(self, ncl_executable, project_info, verbosity, exit_on_warning):
+    def execute(self, ncl_executable, project_info, verbosity, exit_on_warning,
+                env=None, cwd=None):
         """ @brief Wrapper to execute NCL scripts
             @param ncl_command Full path to the NCL script to execute
             @param project_info Current namelist in dictionary format
             @param verbosity Set the verbosity level (0 minimum verbosity)
             @param exit_on_warning Boolean defining whether the wrapper should
             crash on any NCL warnings
+            @param env Private environment for the NCL process (optional)
+            @param cwd Private working directory for the NCL process (optional)
 
             This wrapper will take an NCL script, execute it then scan the
             stdout for the keywords 'fatal' and 'warning'. If they occur an
             exception is raised. The wrapper will also delete all
-            'ESMValTool_'-prefixed environment variables after execution.
+            'ESMValTool_'-prefixed environment variables after execution,
+            unless a private environment was given.
         """
+        self.set_cwd(cwd)
+
         # Reset NCL trace back indent (available with verbosity=2)
 	f_ncl_indent = open(self.filename, "w")
         f_ncl_indent.write("0")
@@ -164,16 +262,14 @@ class ncl_launcher(launchers):
                                             + ncl_executable
                                             + "\", is missing)")
 
-        run_application = subprocess.Popen("ncl " + ncl_executable, shell=True,
-                                           stdin=open(os.devnull),
-                                           stdout=subprocess.PIPE)
-        #run_application.wait()
-        std_outerr = run_application.communicate()[0].split('\n')
-        self.write_stdouterr(std_outerr, verbosity, exit_on_warning)
+        # Started directly (no intermediate shell), once per script
+        self.run_process(["ncl", ncl_executable], verbosity, exit_on_warning,
+                         env=env, cwd=cwd)
 
-        for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:
-            if key not in self.persistent_env_variables:
-                del(os.environ[key])
+        if env is None:
+            for key in [var for var in os.environ if re.search('^ESMValTool_*', var)]:
+                if key not in self.persistent_env_variables:
+                    del(os.environ[key])
 
 
 class r_launcher(launchers):
@@ -185,18 +281,23 @@ class r_launcher(launchers):
         self.fatal_string = 'fatal:'
         self.warning_string = 'Warning '
 
-    def execute(self, r_script, project_info, verbosity, exit_on_warning):
+    def execute(self, r_script, project_info, verbosity, exit_on_warning,
+                env=None, cwd=None):
         """ @brief Wrapper to execute R scripts
             @param r_script Full path to the R script to execute
             @param project_info Current namelist in dictionary format
             @param verbosity Set the verbosity level (0 minimum verbosity)
             @param exit_on_warning Boolean defining whether the wrapper should
             crash on any R warnings
+            @param env Private environment for the R process (optional)
+            @param cwd Private working directory for the R process (optional)
 
             This wrapper will take an R script and executes it.
             The wrapper will also delete all 'ESMValTool_'-prefixed
             environment variables after execution.
         """
+        self.set_cwd(cwd)
+
         # Reset NCL trace back indent (available with verbosity=2)
 	f_r_indent = open(self.filename, "w")
         f_r_indent.write("0" + '\n')
@@ -223,16 +324,12 @@ class r_launcher(launchers):
 
         r_run = r_pre_launch + r_launch + r_script
 
-        run_application = subprocess.Popen(r_run, shell=True,
-                                           stdin=open(os.devnull),
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.STDOUT)
-        run_application.wait()
-        std_outerr = run_application.communicate()[0].split('\n')
-        self.write_stdouterr(std_outerr, verbosity, exit_on_warning)
+        self.run_process(r_run, verbosity, exit_on_warning, env=env, cwd=cwd,
+                         shell=True)
 
-        for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:
-            del(os.environ[key])
+        if env is None:
+            for key in [var for var in os.environ if re.search('^ESMValTool_*', var)]:
+                del(os.environ[key])
 
 
 class py_launcher(launchers):
@@ -255,13 +352,18 @@ class py_launcher(launchers):
         self.warning_string = 'warning:'
         self.execute_as_shell = execute_as_shell
 
-    def execute(self, python_executable, project_info, verbosity, exit_on_warning):
+    def execute(self, python_executable, project_info, verbosity, exit_on_warning,
+                env=None, cwd=None):
         """ @brief Wrapper to execute PYTHON scripts
             @param python_executable: Full path to the python script to execute
             @param project_info Current namelist in dictionary format
             @param verbosity Set the verbosity level (0 minimum verbosity)
             @param exit_on_warning Boolean defining whether the wrapper should
             crash on any python warnings
+            @param env Private environment for the python process (only
+            used when executed in a shell)
+            @param cwd Private working directory for the python process (only
+            used when executed in a shell)
 
             This wrapper will take a PYTHON script, execute it then scan the
             stdout for the keywords 'fatal' and 'warning'. If they occur an
@@ -284,7 +386,8 @@ class py_launcher(launchers):
                 self.execute_as_shell = self.launch_args['execute_as_shell']
 
         if self.execute_as_shell:
-            self._execute_shell(python_executable, project_info, verbosity, exit_on_warning)
+            self._execute_shell(python_executable, project_info, verbosity, exit_on_warning,
+                                env=env, cwd=cwd)
         else:  # Default option
             self._execute_script(python_executable, project_info, verbosity, exit_on_warning)
 
@@ -323,19 +426,18 @@ class py_launcher(launchers):
         # This catpures Traceback but won't let us analyse the stdout/err for text warnings
         usr_script.main(project_info)
 
-    def _execute_shell(self, python_executable, project_info, verbosity, exit_on_warning):
+    def _execute_shell(self, python_executable, project_info, verbosity, exit_on_warning,
+                       env=None, cwd=None):
         """
         execute python script in shell as subprocess
         """
-        run_application = subprocess.Popen("python " + python_executable, shell=True,
-                                           stdin=open(os.devnull),
-                                           stdout=subprocess.PIPE)
-        run_application.wait()
-        std_outerr = run_application.communicate()[0].split('\n')
-        self.write_stdouterr(std_outerr, verbosity, exit_on_warning)
+        self.set_cwd(cwd)
+        self.run_process("python " + python_executable, verbosity,
+                         exit_on_warning, env=env, cwd=cwd, shell=True)
 
-        for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:
-            del(os.environ[key])
+        if env is None:
+            for key in [var for var in os.environ if re.search('^ESMValTool_*', var)]:
+                del(os.environ[key])
 
 class shell_launcher(launchers):                                                           
       """ @brief general unix shell launcher                                             
@@ -347,8 +449,21 @@ class shell_launcher(launchers):
               else:                                                                        
                       raise error('Unknown shell: {0}'.format(shell))                      
               super(shell_launcher, self).__init__()                                       
+
+      def forward_lines(self, pipe, label):
+              """ @brief Print the non-empty lines of a pipe as they arrive
+              """
+              for line in iter(pipe.readline, ''):
+                      line = line.rstrip('\n')
+                      if len(line) > 0:
+                              with output_lock:
+                                      print self.lang.upper() + label + line
+                                      sys.stdout.flush()
+              pipe.close()
                                                                                            
-      def execute(self, executable, project_info, verbosity, exit_on_warning):             
+      def execute(self, executable, project_info, verbosity, exit_on_warning, env=None,
+                  cwd=None):
+              self.set_cwd(cwd)
               try:                                                                         
                       with open(self.filename, "w") as f:                                  
                               f.write("0")                                                 
@@ -363,19 +478,19 @@ class shell_launcher(launchers):
               run_application = subprocess.Popen(cmd, shell=True,                          
                                            stdin=open(os.devnull),                         
                                            stdout=subprocess.PIPE,                         
-                                           stderr=subprocess.PIPE)                         
-              run_application.wait()                                                       
-              output = run_application.communicate()                                       
-              std_out = filter(None,output[0].split('\n'))                                 
-              std_err = filter(None,output[1].split('\n'))                                 
-              for i in [self.lang.upper() + ' INFO : ' + item for item in std_out]:        
-                      print i                                                              
-              for i in [self.lang.upper() + ' ERROR: ' + item for item in std_err]:        
-                                                                                           
-                      print i                                                              
-                                                                                           
-              for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:   
-                      del(os.environ[key])                                                 
+                                           stderr=subprocess.PIPE,
+                                           env=env, cwd=cwd)
+              # Forward stdout and stderr while the script runs
+              stderr_reader = threading.Thread(target=self.forward_lines,
+                                               args=(run_application.stderr, ' ERROR: '))
+              stderr_reader.start()
+              self.forward_lines(run_application.stdout, ' INFO : ')
+              stderr_reader.join()
+              run_application.wait()
+
+              if env is None:
+                      for key in [var for var in os.environ if re.search('^ESMValTool_*', var)]:
+                              del(os.environ[key])
                                                                                            
 class csh_launcher(shell_launcher):                                                        
       """ @brief csh-shell script launcher                                               
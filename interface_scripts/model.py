@@ -7,6 +7,11 @@ class Model(object):
         self.diag_specific = diag_specific_model
         self.attributes = attributes
 
+        # The model line is parsed once, see split_entries/get_facets
+        self.entries = tuple(model_line.split())
+        self.facets = {}
+        self.project = None
+
     def get_model_line(self):
         return self.model_line
 
@@ -17,7 +22,33 @@ class Model(object):
         return self.diag_specific
 
     def split_entries(self):
-        return self.model_line.split()
+        return list(self.entries)
+
+    def get_facets(self, model_specifiers):
+        """ @brief Return the entries of the model line by name
+            @param model_specifiers Names of the entries (of the project)
+            @return A dictionary (a copy, the parsed record is kept)
+
+            Raises a ValueError if the model line has fewer entries than
+            there are names.
+        """
+        key = tuple(model_specifiers)
+        if key not in self.facets:
+            if len(self.entries) < len(key):
+                raise ValueError("Model line '" + self.model_line + "' has "
+                                 + str(len(self.entries)) + " entries, "
+                                 + self.entries[0] + " expects "
+                                 + str(len(key)) + ": " + " ".join(key))
+            self.facets[key] = tuple(zip(key, self.entries))
+        return dict(self.facets[key])
+
+    def get_project(self):
+        """ @brief Return the project class instance of the model (cached)
+        """
+        if self.project is None:
+            import projects
+            self.project = getattr(projects, self.entries[0])()
+        return self.project
 
     def __str__(self):
         model_line = self.get_model_line()
@@ -1,4 +1,5 @@
-from auxiliary import info
+from auxiliary import info, error
+import data_catalogue
 import data_interface
 import exceptions
 import os
@@ -6,8 +7,40 @@ import launchers
 import pdb
 import re
 import datetime
+import contextlib
+import threading
+
+# Years of the input files, parsed once per file
+infile_years = {}
+
+# Base variable of the ${VARIABLE}-placeholder in the model directories,
+# set per thread by base_var_scope
+_base_var_scope = threading.local()
+
+
+@contextlib.contextmanager
+def base_var_scope(base_var):
+    """ @brief Use base_var for the ${VARIABLE}-placeholder in the model
+               directories of the current thread within the block
+        @param base_var Name of the base variable, if None the
+                        '__ESMValTool_base_var' of os.environ is used
+    """
+    previous = getattr(_base_var_scope, 'base_var', None)
+    _base_var_scope.base_var = base_var
+    try:
+        yield
+    finally:
+        _base_var_scope.base_var = previous
+
+
+def get_base_var():
+    """ @brief Return the base variable of the ${VARIABLE}-placeholder
+    """
+    base_var = getattr(_base_var_scope, 'base_var', None)
+    if base_var is None:
+        base_var = os.environ['__ESMValTool_base_var']
+    return base_var
 
-from esgf_search import ESGFSearch
 
 
 class Project:
@@ -21,21 +54,20 @@ class Project:
             @param model One of the <model>-tags in the XML namelist file
             @param model_section Which of the model entries to retrieve
         """
-        section = \
-            model.split_entries()[self.model_specifiers.index(model_section)]
+        if model_section not in self.model_specifiers:
+            raise ValueError(model_section + " is not in list")
+        section = model.get_facets(self.model_specifiers)[model_section]
         return section
 
     def get_model_sections(self, model):
         """ @brief Retrieve all model entries from a <model> tag line
             @param model One of the <model>-tags in the XML namelist file
         """
-        model_sections = [self.get_model_subsection(model, modelpart)
-                          for modelpart in self.model_specifiers]
-        model_sect_dict = dict(zip(self.model_specifiers, model_sections))
+        model_sect_dict = model.get_facets(self.model_specifiers)
 
         # Replace the ${VARIABLE}-placeholder in infile dir with base var
         if re.search("\$\{VARIABLE\}", model_sect_dict['dir']) is not None:
-            base_var = os.environ['__ESMValTool_base_var']
+            base_var = get_base_var()
             model_sect_dict['dir'] \
                 = re.sub("\$\{VARIABLE\}", base_var, model_sect_dict['dir'])
         return model_sect_dict
@@ -193,6 +225,28 @@ class Project:
             msd['end_year'],\
             msd['dir']
 
+    def get_cf_infiles(self, project_info, model, field, variable, mip, exp):
+        """ @brief Returns the input files overlapping the model years
+            @param project_info Current namelist in dictionary format
+            @param model One of the <model>-tags in the XML namelist file
+            @param field The field (see tutorial.pdf for available fields)
+            @param variable The variable
+            @return A list of strings (full paths of the input files)
+
+            The files matching get_cf_infile are selected by the date range
+            in their (DRS) file names, files without a date range are always
+            selected. With 'verify_time_axis' in the GLOBAL section of the
+            namelist the date ranges are checked against the time axis.
+        """
+        indir, infile = self.get_cf_infile(project_info, model, field,
+                                           variable, mip, exp)
+        project, name, ensemble, start_year, end_year, dir\
+            = self.get_cf_sections(model)
+        verify_time_axis = project_info['GLOBAL'].get('verify_time_axis', False)
+        return select_infiles(os.path.join(indir, infile),
+                              int(start_year), int(end_year),
+                              verify_time_axis)
+
     def get_model_name(self, model):
         return self.get_model_subsection(model, "name")
 
@@ -497,7 +551,7 @@ class obs4mips(Project):
                            msd['level'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['name'],
                                msd['level'],
@@ -622,7 +676,7 @@ class ana4mips(Project):
                            msd['ensemble'],
                            msd['name']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['ensemble'],
@@ -775,7 +829,7 @@ class CMIP5(Project):
                            msd['experiment'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['name'],
@@ -1023,7 +1077,7 @@ class CMIP5_SMHI(CMIP5):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1070,7 +1124,7 @@ class CMIP5_ETHZ(CMIP5):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1289,7 +1343,7 @@ class MiKlip(Project):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1427,7 +1481,7 @@ class MiKlip_baseline0(MiKlip):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1553,7 +1607,7 @@ class O3_Cionni(Project):
         infile = '_'.join([variable,
                            msd['experiment'],]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join(['Ozone_CMIP5_ACC_SPARC_*',
                                msd['experiment'],
                                field,
@@ -1669,7 +1723,7 @@ class CCMVal(Project):
                            msd['ensemble'],
                            field,
                            variable]) + '.nc'
-        if (os.path.isfile(os.path.join(indir, infile))):
+        if (data_catalogue.isfile(os.path.join(indir, infile))):
             return indir, infile
 
         # Try alternative variable names
@@ -1680,7 +1734,7 @@ class CCMVal(Project):
                                msd['ensemble'],
                                field,
                                altvar]) + '.nc'
-            if (os.path.isfile(os.path.join(indir, infile))):
+            if (data_catalogue.isfile(os.path.join(indir, infile))):
                 info("  No input files found, trying with the alternative "
                      + "variable name " + altvar,
                      project_info["GLOBAL"]["verbosity"], 1)
@@ -2252,7 +2306,7 @@ class GO(CCMVal):
 
         info("file = " + infile, 1, 1)
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join([msd['project'],
                                msd['case_name'],
                                msd['name'],
@@ -2260,7 +2314,7 @@ class GO(CCMVal):
                                field,
                                variable]) + '*.nc'
 
-        if (len(glob.glob(os.path.join(indir, infile))) == 0):
+        if (len(data_catalogue.glob(os.path.join(indir, infile))) == 0):
             raise exceptions.IOError(2, "No input files found in", indir)
 
         return indir, infile
@@ -2549,7 +2603,7 @@ class CCMI(Project):
                            msd['experiment'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['name'],
@@ -2667,7 +2721,7 @@ class CCMI_DLR(CCMI):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -3037,6 +3091,9 @@ class ESGF:
 
                 result += "Searching for matching remote dataset on ESGF.\n\n"
 
+                # Imported here, pyesgf/urllib2 are only needed for
+                # actual ESGF searches
+                from esgf_search import ESGFSearch
                 esgf_search = ESGFSearch(esgf_config, self.info)
 
                 # Add each model section as a constraint,
@@ -3065,9 +3122,7 @@ class ESGF:
         Overwrites the base class version of this function
         :param model: One of the <model>-tags in the XML namelist file
         """
-        model_sections = [self.get_model_subsection(model, modelpart)
-                          for modelpart in self.model_specifiers]
-        model_sect_dict = dict(zip(self.model_specifiers, model_sections))
+        model_sect_dict = model.get_facets(self.model_specifiers)
         if 'dir' not in model_sect_dict:
                model_sect_dict['dir'] = 'If_this_appears_in_a_path_see_get_model_sections'
 
@@ -3309,7 +3364,7 @@ class ESGF_CMIP5(ESGF, CMIP5):
                            msd['experiment'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not data_catalogue.isfile(os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['model'], # in CMIP5 class this was 'name'
@@ -3367,6 +3422,66 @@ class ESGF_CMIP5_fx(ESGF_CMIP5):
         return CMIP5_fx.__dict__['get_fx_file'](self, project_info, model)
 
 
+def get_infile_years(infile, verify_time_axis=False):
+    """ @brief Returns the years covered by an input file
+        @param infile Full path of the input file
+        @param verify_time_axis Check the file name against the time axis
+        @return (first year, last year), or None if unknown
+
+        The years are parsed from the DRS date range in the file name
+        (once per file), with a data catalogue in use they are read from
+        its index (see data_catalogue.get_years). If verify_time_axis is set, the years are read
+        from the time axis instead (requires the netCDF4 module).
+    """
+    key = (infile, verify_time_axis)
+    if key in infile_years:
+        return infile_years[key]
+
+    years = data_catalogue.get_years(infile)
+
+    if years is not None and verify_time_axis:
+        try:
+            import netCDF4
+        except ImportError:
+            error("verify_time_axis requires the Python netCDF4 module")
+        ncfile = netCDF4.Dataset(infile)
+        time = ncfile.variables['time']
+        calendar = getattr(time, 'calendar', 'standard')
+        dates = netCDF4.num2date([time[0], time[-1]], time.units, calendar)
+        ncfile.close()
+        axis_years = (dates[0].year, dates[1].year)
+        if axis_years != years:
+            info("Time axis of " + infile + " covers "
+                 + str(axis_years[0]) + "-" + str(axis_years[1])
+                 + ", not the years in its file name", 1, 1)
+        years = axis_years
+
+    infile_years[key] = years
+    return years
+
+
+def select_infiles(pattern, start_year, end_year, verify_time_axis=False):
+    """ @brief Returns the input files overlapping start_year-end_year
+        @param pattern Path of the input files (may contain wildcards)
+        @param start_year First year requested in the <model> tag
+        @param end_year Last year requested in the <model> tag
+        @param verify_time_axis See get_infile_years
+        @return A (sorted) list of full paths
+    """
+    infiles = sorted(data_catalogue.glob(pattern))
+
+    # start_year = end_year = 0: no time range selection (e.g., F2Ms)
+    if start_year == 0 and end_year == 0:
+        return infiles
+
+    selected = []
+    for infile in infiles:
+        years = get_infile_years(infile, verify_time_axis)
+        if years is None or (years[0] <= end_year and years[1] >= start_year):
+            selected.append(infile)
+    return selected
+
+
 def find_varname(var):
     """
     @brief Read and return alternative names for the given var
@@ -3411,37 +3526,59 @@ def remove_diag_specific_models(project_models):
     return project_models
 
 
-def write_data_interface(executable, project_info):
+def write_data_interface(executable, project_info, environ=None,
+                         interface_dir="interface_data"):
     """ @brief Write Python data structures to target script format interface
         @param executable String pointing to the script/binary to execute
         @param project_info Current namelist in dictionary format
+        @param environ Environment mapping for the project_info entries
+                       (defaults to os.environ)
+        @param interface_dir Folder to write the interface files to
 
         Data structures in Python are rewritten to the interface folder in
         a format appropriate for the target script/binary
     """
     suffix = os.path.splitext(executable)[1][1:]
     currInterface = vars(data_interface)[suffix.title() + '_data_interface'](project_info)
-    currInterface.write_data_to_interface()
+    currInterface.write_data_to_interface(environ, interface_dir)
 
 
 def run_executable(string_to_execute,
                    project_info,
                    verbosity,
                    exit_on_warning,
-                   launcher_arguments=None,write_di=True):
+                   launcher_arguments=None,write_di=True,
+                   env=None, cwd=None):
     """ @brief Executes script/binary
         @param executable String pointing to the script/binary to execute
         @param project_info Current namelist in dictionary format
         @param verbosity The requested verbosity level
         @param exit_on_warning Boolean defining whether the wrapper should
                                crash on warnings
+        @param env Private environment for the launched process, if None
+                   a copy of os.environ is used (see launchers.get_job_environ)
+        @param cwd Private working directory (with its own interface_data/
+                   folder) for the launched process, see
+                   scheduler.make_job_dir
 
         Check the type of script/binary from the executable string suffix and
-        execute the script/binary properly.
+        execute the script/binary properly. The project_info entries are
+        handed over through the run manifest of the interface folder (see
+        run_manifest.py) and the private environment, os.environ is not
+        modified.
     """
+    if env is None:
+        env = launchers.get_job_environ()
 
     if write_di:
-	write_data_interface(string_to_execute, project_info)
+        # The model directories of the interface use the base variable of
+        # the launched process
+        with base_var_scope(env.get('__ESMValTool_base_var')):
+            if cwd is None:
+                write_data_interface(string_to_execute, project_info, env)
+            else:
+                write_data_interface(string_to_execute, project_info, env,
+                                     os.path.join(cwd, "interface_data"))
 
     suffix = os.path.splitext(string_to_execute)[1][1:]
     currLauncher = vars(launchers)[suffix + '_launcher']()
@@ -3450,4 +3587,6 @@ def run_executable(string_to_execute,
     currLauncher.execute(string_to_execute,
                          project_info,
                          verbosity,
-                         exit_on_warning)
+                         exit_on_warning,
+                         env=env,
+                         cwd=cwd)
@@ -33,6 +33,8 @@ import exceptions
 import os
 import pdb
 import projects
+import re
+import reformat_cache
 
 
 def infile(currProject, project_info, variable, model):
@@ -53,20 +55,53 @@ def infile(currProject, project_info, variable, model):
     return(os.path.join(indir, infile))
 
 
-def cmor_reformat(currProject, project_info, variable, model):
-    model_name = currProject.get_model_name(model)
-    project_name = currProject.get_project_name(model)
-    project_basename = currProject.get_project_basename()
-    project_info['RUNTIME']['model'] = model_name
-    project_info['RUNTIME']['project'] = project_name
-    project_info['RUNTIME']['project_basename'] = project_basename
+class Reformat_job(object):
+    """ @brief Class holding a single (model, variable) reformat job
+
+        All information needed to run the reformat script is resolved
+        when the job is created, such that jobs can be executed
+        independently of each other (and of os.environ).
+    """
+    def __init__(self, reformat_script, runtime, temporary, base_var,
+                 infile_pattern=None):
+        self.reformat_script = reformat_script
+        self.runtime = runtime
+        self.temporary = temporary
+        self.base_var = base_var
+        # Input file pattern the infile_path files were selected from
+        self.infile_pattern = infile_pattern
+
+    def get_outfile(self):
+        return self.temporary['outfile_fullpath']
+
+    def __str__(self):
+        return self.runtime['model'] + " (" + self.runtime['project'] + "), "\
+            + self.temporary['variable'] + " (" + self.temporary['field'] + ")"
+
+
+def prepare_reformat(currProject, project_info, variable, model):
+    """ @brief Resolve all paths and settings of a single reformat job
+        @param currProject Project class instance of the current model
+        @param project_info Current namelist in dictionary format
+        @param variable Current (base) variable
+        @param model One of the <model>-tags in the XML namelist file
+        @return A Reformat_job instance
+    """
+    # The base variable is used for the (optional) wildcard syntax in the
+    # model path, ".../${VARIABLE}/..." in the namelist
+    with projects.base_var_scope(variable.var):
+        return _prepare_reformat(currProject, project_info, variable, model)
+
+
+def _prepare_reformat(currProject, project_info, variable, model):
+    """ @brief See prepare_reformat (within the scope of the base variable)
+    """
     verbosity = project_info["GLOBAL"]["verbosity"]
-    exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
 
-    # Variable put in environment to be used for the (optional)
-    # wildcard syntax in the model path, ".../${VARIABLE}/..."
-    # in the namelist
-    os.environ['__ESMValTool_base_var'] = variable.var
+    runtime = {}
+    runtime['model'] = currProject.get_model_name(model)
+    runtime['project'] = currProject.get_project_name(model)
+    runtime['project_basename'] = currProject.get_project_basename()
 
     # Build input and output file names
     indir, infile = currProject.get_cf_infile(project_info,
@@ -86,9 +121,6 @@ def cmor_reformat(currProject, project_info, variable, model):
 #    print "infile = %s" % infile
 #    print "fullpath = %s" % fullpath
 
-    if (not os.path.isdir(os.path.dirname(fullpath))):
-        os.makedirs(os.path.dirname(fullpath))
-
     # Area file name for ocean grids
     areafile_path = currProject.get_cf_areafile(project_info, model)
 
@@ -133,56 +165,127 @@ def cmor_reformat(currProject, project_info, variable, model):
                                    which_reformat,
                                    "reformat_" + which_reformat + "_main.ncl")
 
+    # The default reformat script reads the files listed in infile_path,
+    # only pass on those overlapping the requested years
+    infile_path = os.path.join(indir, infile)
+    if which_reformat == 'default':
+        infiles = currProject.get_cf_infiles(project_info,
+                                             model,
+                                             variable.fld,
+                                             variable.var,
+                                             variable.mip,
+                                             variable.exp)
+        if len(infiles) > 0:
+            infile_path = " ".join(infiles)
+        info("  Selected " + str(len(infiles)) + " input file(s) for "
+             + start_year + "-" + end_year, verbosity, required_verbosity=2)
+
     # Set enviroment variables
-    project_info['TEMPORARY'] = {}
-    project_info['TEMPORARY']['indir_path'] = indir
-    project_info['TEMPORARY']['outfile_fullpath'] = fullpath
-    project_info['TEMPORARY']['infile_path'] = os.path.join(indir, infile)
-    project_info['TEMPORARY']['areafile_path'] = areafile_path
-    project_info['TEMPORARY']['lmaskfile_path'] = lmaskfile_path
-    project_info['TEMPORARY']['omaskfile_path'] = omaskfile_path
-    project_info['TEMPORARY']['porofile_path'] = porofile_path
-    project_info['TEMPORARY']['start_year'] = start_year
-    project_info['TEMPORARY']['end_year'] = end_year
-    project_info['TEMPORARY']['ensemble'] = ensemble
-    project_info['TEMPORARY']['variable'] = variable.var
-    project_info['TEMPORARY']['field'] = variable.fld
+    temporary = {}
+    temporary['indir_path'] = indir
+    temporary['outfile_fullpath'] = fullpath
+    temporary['infile_path'] = infile_path
+    temporary['areafile_path'] = areafile_path
+    temporary['lmaskfile_path'] = lmaskfile_path
+    temporary['omaskfile_path'] = omaskfile_path
+    temporary['porofile_path'] = porofile_path
+    temporary['start_year'] = start_year
+    temporary['end_year'] = end_year
+    temporary['ensemble'] = ensemble
+    temporary['variable'] = variable.var
+    temporary['field'] = variable.fld
 
     # FX file path
     if fx_file_path:
-        project_info['TEMPORARY']['fx_file_path'] = fx_file_path
+        temporary['fx_file_path'] = fx_file_path
 
     # Special cases
-    if 'realm' in currProject.get_model_sections(model):
-        project_info['TEMPORARY']['realm'] = \
-            currProject.get_model_sections(model)["realm"]
-    if 'shift_year' in currProject.get_model_sections(model):
-        project_info['TEMPORARY']['shift_year'] = \
-            currProject.get_model_sections(model)["shift_year"]
-    if 'case_name' in currProject.get_model_sections(model):
-        project_info['TEMPORARY']['case_name'] = \
-            currProject.get_model_sections(model)["case_name"]
+    model_sections = currProject.get_model_sections(model)
+    for key in ['realm', 'shift_year', 'case_name']:
+        if key in model_sections:
+            temporary[key] = model_sections[key]
 
     if hgridfile_path and zgridfile_path:
-        project_info['TEMPORARY']['hgridfile_path'] = hgridfile_path
-        project_info['TEMPORARY']['zgridfile_path'] = zgridfile_path
+        temporary['hgridfile_path'] = hgridfile_path
+        temporary['zgridfile_path'] = zgridfile_path
     if lsmfile_path:
-        project_info['TEMPORARY']['lsmfile_path'] = lsmfile_path
+        temporary['lsmfile_path'] = lsmfile_path
+
+    return Reformat_job(reformat_script, runtime, temporary, variable.var,
+                        os.path.join(indir, infile))
+
+
+def run_reformat_job(job, project_info, env=None, cwd=None):
+    """ @brief Run the reformat script of a single job (if needed)
+        @param job A Reformat_job instance
+        @param project_info Current namelist in dictionary format. Its
+                            'RUNTIME' and 'TEMPORARY' sections are set
+                            for the job
+        @param env Private environment for the reformat script, if None
+                   os.environ is used
+        @param cwd Private working directory for the reformat script
+                   (see scheduler.make_job_dir)
+    """
+    verbosity = project_info["GLOBAL"]["verbosity"]
+    exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
+
+    project_info['RUNTIME'].update(job.runtime)
+    project_info['TEMPORARY'] = dict(job.temporary)
 
-    # Execute the ncl reformat script
-    if ((not os.path.isfile(project_info['TEMPORARY']['outfile_fullpath']))
-            or project_info['GLOBAL']['force_processing']):
+    # Paths relative to the ESMValTool root are not valid in a
+    # private working directory
+    if cwd is not None:
+        for key, value in project_info['TEMPORARY'].items():
+            if isinstance(value, str) and re.search('(_path|fullpath)$', key):
+                # infile_path may list several files
+                project_info['TEMPORARY'][key] \
+                    = " ".join([os.path.abspath(path) for path in value.split()])
 
-        info("  Calling " + reformat_script + " to check/reformat model data",
+    # Execute the ncl reformat script, unless the reformatted file
+    # exists and was produced from the current inputs
+    cache = reformat_cache.Reformat_cache(project_info['GLOBAL']['climo_dir'])
+    outfile = project_info['TEMPORARY']['outfile_fullpath']
+    if project_info['GLOBAL']['force_processing']:
+        run_script = True
+    elif not os.path.isfile(outfile):
+        run_script = True
+    elif not cache.is_valid(job):
+        info("  Inputs changed since " + outfile + " was written",
+             verbosity, required_verbosity=1)
+        run_script = True
+    else:
+        info("  Using cached " + outfile, verbosity, required_verbosity=2)
+        run_script = False
+
+    if run_script:
+        info("  Calling " + job.reformat_script + " to check/reformat model data",
              verbosity,
              required_verbosity=1)
 
-        projects.run_executable(reformat_script, project_info, verbosity,
-                                exit_on_warning)
-    if 'NO_REFORMAT' in reformat_script:
+        # Concurrent jobs may write to the same climo folder
+        outdir = os.path.dirname(outfile)
+        if not os.path.isdir(outdir):
+            try:
+                os.makedirs(outdir)
+            except OSError:
+                if not os.path.isdir(outdir):
+                    raise
+
+        projects.run_executable(job.reformat_script, project_info,
+                                verbosity, exit_on_warning,
+                                env=env, cwd=cwd)
+    if 'NO_REFORMAT' in job.reformat_script:
         pass
     else:
-        if (not os.path.isfile(project_info['TEMPORARY']['outfile_fullpath'])):
+        if (not os.path.isfile(outfile)):
             raise exceptions.IOError(2, "Expected reformatted file isn't available: ",
-                                     project_info['TEMPORARY']['outfile_fullpath'])
+                                     outfile)
+        if run_script:
+            cache.update(job)
     del(project_info['TEMPORARY'])
+
+
+def cmor_reformat(currProject, project_info, variable, model):
+    job = prepare_reformat(currProject, project_info, variable, model)
+    run_reformat_job(job, project_info)
+
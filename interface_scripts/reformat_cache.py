@@ -0,0 +1,239 @@
+"""
+Manifest of the reformatted (climo) files
+
+For each file written by a reformat script the manifest in climo_dir
+records a fingerprint of everything the file was produced from:
+
+    paths     - the input files (infile_path with wildcards expanded) and
+                the auxiliary area/mask/grid files, as (size, mtime)
+    patterns  - the names of the files matching the input file pattern
+                the infile_path files were selected from that overlap the
+                time range (see projects.select_infiles), so that a file
+                added to/removed from the time range is noticed, while
+                files of other years do not matter
+    scripts   - the reformat scripts and the model specific fix file, as
+                a hash of their content
+    settings  - time range, ensemble, variable, field and the other
+                (non-path) settings of the reformat job
+
+A reformatted file is reused only if its recorded fingerprint matches
+the current one, i.e., it is redone if any input changed. Stale entries
+can be listed/evicted with "main.py --reformat-cache=list|evict".
+"""
+import glob
+import hashlib
+import json
+import os
+import pdb
+import projects
+import threading
+
+# Name of the manifest file in climo_dir
+manifest_name = 'reformat_cache.json'
+manifest_version = 3
+
+# Reformat jobs may run in parallel threads (see scheduler.py)
+manifest_lock = threading.Lock()
+
+
+def hash_file(path):
+    """ @brief Return the SHA-1 of the content of a file
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def stat_files(pattern):
+    """ @brief Return (path, size, mtime) of all files matching a pattern
+        @param pattern A path, optionally with wildcards and environment
+                       variables, or a space separated list of paths (as
+                       used in the reformat scripts)
+    """
+    files = []
+    for sub_pattern in pattern.split():
+        for path in sorted(glob.glob(os.path.expandvars(sub_pattern))):
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append([path, stat.st_size, stat.st_mtime])
+    return files
+
+
+def list_files(pattern, start_year, end_year):
+    """ @brief Return the sorted paths of the files matching a pattern
+               that overlap a time range
+        @param pattern A path, optionally with wildcards
+        @param start_year First year of the time range
+        @param end_year Last year of the time range
+
+        The files are selected by the years in their names as in
+        projects.select_infiles, files of other years are left out.
+        Unlike stat_files the files themselves are not looked at.
+    """
+    return projects.select_infiles(os.path.expandvars(pattern),
+                                   int(start_year), int(end_year))
+
+
+def describe_job(job):
+    """ @brief Return the (JSON serializable) sources of a reformat job
+        @param job A reformat.Reformat_job instance
+    """
+    paths = {}
+    patterns = {}
+    settings = {}
+    for key, value in job.temporary.items():
+        if key in ['outfile_fullpath', 'indir_path']:
+            continue
+        if key.endswith('_path'):
+            if value:
+                paths[key] = " ".join([os.path.abspath(path)
+                                       for path in value.split()])
+        else:
+            settings[key] = str(value)
+    # Files added/removed later on (the selection depends on the pattern)
+    if getattr(job, 'infile_pattern', None) is not None:
+        patterns['infile_pattern'] = os.path.abspath(job.infile_pattern)
+
+    script_dir = os.path.dirname(job.reformat_script)
+    scripts = sorted(glob.glob(os.path.join(script_dir, '*.ncl')))
+    fix_file = os.path.join('reformat_scripts', 'fixes',
+                            job.runtime['project_basename'] + '_'
+                            + job.runtime['model'] + '_fix.ncl')
+    scripts.append(fix_file)
+
+    return {'paths': paths,
+            'patterns': patterns,
+            'scripts': scripts,
+            'settings': settings}
+
+
+def fingerprint(description):
+    """ @brief Compute the fingerprint of a job description
+        @param description As returned by describe_job
+        @return SHA-1 (string) over the current state of all sources
+
+        The fingerprint is computed from the files on disk, hence the
+        same description gives a different fingerprint if any of the
+        input files/scripts changed.
+    """
+    settings = description['settings']
+    state = {'paths': {},
+             'patterns': {},
+             'scripts': {},
+             'settings': settings}
+    for key, pattern in description['paths'].items():
+        state['paths'][key] = stat_files(pattern)
+    for key, pattern in description['patterns'].items():
+        state['patterns'][key] = list_files(pattern, settings['start_year'],
+                                            settings['end_year'])
+    for script in description['scripts']:
+        if os.path.isfile(script):
+            state['scripts'][script] = hash_file(script)
+        else:
+            state['scripts'][script] = None
+    return hashlib.sha1(json.dumps(state, sort_keys=True)).hexdigest()
+
+
+class Reformat_cache(object):
+    """ @brief Manifest of the reformatted files in a climo_dir
+    """
+    def __init__(self, climo_dir):
+        self.climo_dir = climo_dir
+        self.manifest = os.path.join(climo_dir, manifest_name)
+
+    def load(self):
+        """ @brief Return the manifest entries, keyed by the output file
+                   path relative to climo_dir
+        """
+        if not os.path.isfile(self.manifest):
+            return {}
+        with open(self.manifest) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != manifest_version:
+            return {}
+        return manifest['entries']
+
+    def save(self, entries):
+        """ @brief Write the manifest (atomically, via a temporary file)
+        """
+        if not os.path.isdir(self.climo_dir):
+            os.makedirs(self.climo_dir)
+        tmp_manifest = self.manifest + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_manifest, 'w') as f:
+            json.dump({'version': manifest_version, 'entries': entries},
+                      f, indent=1, sort_keys=True)
+        os.rename(tmp_manifest, self.manifest)
+
+    def get_key(self, outfile):
+        return os.path.relpath(os.path.abspath(outfile),
+                               os.path.abspath(self.climo_dir))
+
+    def is_valid(self, job):
+        """ @brief Check whether the output file of a job is up to date
+            @param job A reformat.Reformat_job instance
+            @return True if the output file exists and was produced from
+                    the current inputs
+        """
+        if not os.path.isfile(job.get_outfile()):
+            return False
+        with manifest_lock:
+            entry = self.load().get(self.get_key(job.get_outfile()))
+        if entry is None:
+            return False
+        return entry['fingerprint'] == fingerprint(describe_job(job))
+
+    def update(self, job):
+        """ @brief Record the fingerprint of a (just produced) output file
+            @param job A reformat.Reformat_job instance
+        """
+        description = describe_job(job)
+        entry = {'description': description,
+                 'fingerprint': fingerprint(description),
+                 'reformat_script': job.reformat_script}
+        with manifest_lock:
+            entries = self.load()
+            entries[self.get_key(job.get_outfile())] = entry
+            self.save(entries)
+
+    def get_status(self):
+        """ @brief Return the status of all entries
+            @return List of (key, status) tuples, status being one of
+                    'valid', 'stale' (inputs changed) or 'missing'
+                    (output file deleted)
+        """
+        with manifest_lock:
+            entries = self.load()
+        status = []
+        for key in sorted(entries.keys()):
+            if not os.path.isfile(os.path.join(self.climo_dir, key)):
+                status.append((key, 'missing'))
+            elif (entries[key]['fingerprint']
+                  != fingerprint(entries[key]['description'])):
+                status.append((key, 'stale'))
+            else:
+                status.append((key, 'valid'))
+        return status
+
+    def evict(self):
+        """ @brief Remove all stale/missing entries (and stale files)
+            @return List of the evicted keys
+        """
+        evicted = []
+        with manifest_lock:
+            entries = self.load()
+            for key in sorted(entries.keys()):
+                outfile = os.path.join(self.climo_dir, key)
+                if not os.path.isfile(outfile):
+                    del entries[key]
+                elif (entries[key]['fingerprint']
+                      != fingerprint(entries[key]['description'])):
+                    os.remove(outfile)
+                    del entries[key]
+                else:
+                    continue
+                evicted.append(key)
+            if len(evicted) > 0:
+                self.save(entries)
+        return evicted
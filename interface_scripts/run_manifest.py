@@ -0,0 +1,272 @@
+"""
+Run manifest of a launched script
+
+Everything handed over to a script is written once per launch to a
+single, versioned netCDF file in the interface_data/-folder of its job
+(see scheduler.make_job_dir), interface_data/run_manifest.nc:
+
+    global attributes  - 'run_manifest_version' and the "ESMValTool_"
+                         project_info entries (as strings, see
+                         Data_interface.get_env_projinfo)
+    variables          - one per interface array (models_name, infiles,
+                         variables, ...), with a 'type' attribute:
+                         "string"/"logical" arrays are stored as
+                         (n, strlen) characters, "integer" ones as int
+
+The NCL (ncl.interface, run_manifest.ncl) and R (r.interface) loaders
+read it with addfile/ncdf4, Python scripts with read_run_manifest. The
+file is written in the netCDF classic format by this module, hence no
+netCDF library is needed on the Python side.
+"""
+import os
+import pdb
+import struct
+
+# Version of the run manifest format
+run_manifest_version = 1
+run_manifest_name = "run_manifest.nc"
+
+# netCDF classic format tags and external types
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+NC_BYTE = 1
+NC_CHAR = 2
+NC_SHORT = 3
+NC_INT = 4
+NC_FLOAT = 5
+NC_DOUBLE = 6
+nc_formats = {NC_BYTE: 'b', NC_CHAR: 'c', NC_SHORT: 'h',
+              NC_INT: 'i', NC_FLOAT: 'f', NC_DOUBLE: 'd'}
+
+
+def to_string(value):
+    """ @brief Return a value as a (UTF-8 encoded) byte string
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def padding(size):
+    """ @brief Return the zero bytes padding a size to 4 bytes
+    """
+    return '\0' * (-size % 4)
+
+
+def pack_name(name):
+    """ @brief Return a netCDF name (length, characters, padding)
+    """
+    name = to_string(name)
+    return struct.pack('>i', len(name)) + name + padding(len(name))
+
+
+def pack_values(nc_type, values):
+    """ @brief Return the (padded) external representation of values
+        @param nc_type netCDF type of the values
+        @param values A string for NC_CHAR, a list of numbers otherwise
+    """
+    if nc_type == NC_CHAR:
+        data = values
+    else:
+        data = struct.pack('>%d%s' % (len(values), nc_formats[nc_type]),
+                           *values)
+    return data + padding(len(data))
+
+
+def pack_attributes(attributes):
+    """ @brief Return a netCDF attribute list
+        @param attributes List of (name, value), the values are written
+                          as NC_INT if integer, as NC_CHAR otherwise
+    """
+    if len(attributes) == 0:
+        return struct.pack('>ii', 0, 0)
+    packed = struct.pack('>ii', NC_ATTRIBUTE, len(attributes))
+    for name, value in attributes:
+        if isinstance(value, (int, long)) and not isinstance(value, bool):
+            nc_type, values = NC_INT, [value]
+        else:
+            nc_type, values = NC_CHAR, to_string(value)
+        packed += pack_name(name) + struct.pack('>ii', nc_type, len(values))
+        packed += pack_values(nc_type, values)
+    return packed
+
+
+def encode_array(values):
+    """ @brief Return the manifest representation of an interface array
+        @param values List of values
+        @return (type, nc_type, shape, data) with the type attribute of
+                the variable, the netCDF type, the shape and the packed
+                values
+
+        Lists of booleans are stored as "True"/"False" strings, lists of
+        integers as int, all other lists as strings.
+    """
+    if all([isinstance(value, bool) for value in values]):
+        array_type = "logical"
+        values = [str(value) for value in values]
+    elif all([isinstance(value, (int, long)) for value in values]):
+        return "integer", NC_INT, [len(values)], pack_values(NC_INT, values)
+    else:
+        array_type = "string"
+        values = [to_string(value) for value in values]
+    strlen = max([1] + [len(value) for value in values])
+    data = ''.join([value.ljust(strlen, '\0') for value in values])
+    return array_type, NC_CHAR, [len(values), strlen], pack_values(NC_CHAR, data)
+
+
+def encode_run_manifest(attributes, arrays):
+    """ @brief Return the content of a run manifest
+        @param attributes List of (name, value) global attributes (the
+                          version is added)
+        @param arrays List of (name, values) interface arrays, empty
+                      arrays are left out
+        @return The netCDF classic file content as a string
+    """
+    dimensions = []
+    variables = []
+    for name, values in arrays:
+        if len(values) == 0:
+            continue
+        array_type, nc_type, shape, data = encode_array(values)
+        dim_names = ["n_" + name, "strlen_" + name][:len(shape)]
+        dim_ids = range(len(dimensions), len(dimensions) + len(shape))
+        dimensions.extend(zip(dim_names, shape))
+        variables.append((name, dim_ids, array_type, nc_type, data))
+
+    if len(dimensions) == 0:
+        dim_list = struct.pack('>ii', 0, 0)
+    else:
+        dim_list = struct.pack('>ii', NC_DIMENSION, len(dimensions))
+        for name, size in dimensions:
+            dim_list += pack_name(name) + struct.pack('>i', size)
+
+    head = 'CDF\x01' + struct.pack('>i', 0) + dim_list
+    head += pack_attributes([('run_manifest_version', run_manifest_version)]
+                            + list(attributes))
+
+    # The variable entries end with the (fixed size) offset of their
+    # data, hence the size of the header is known before the offsets
+    entries = []
+    for name, dim_ids, array_type, nc_type, data in variables:
+        entries.append(pack_name(name)
+                       + struct.pack('>i%di' % len(dim_ids), len(dim_ids), *dim_ids)
+                       + pack_attributes([('type', array_type)])
+                       + struct.pack('>ii', nc_type, len(data)))
+    if len(variables) == 0:
+        var_list = struct.pack('>ii', 0, 0)
+    else:
+        var_list = struct.pack('>ii', NC_VARIABLE, len(variables))
+    begin = len(head) + len(var_list) + sum([len(entry) + 4 for entry in entries])
+    for entry, variable in zip(entries, variables):
+        var_list += entry + struct.pack('>i', begin)
+        begin += len(variable[4])
+    return head + var_list + ''.join([variable[4] for variable in variables])
+
+
+class ManifestReader(object):
+    """ @brief Reads the netCDF classic files written by encode_run_manifest
+    """
+    def __init__(self, content):
+        self.content = content
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from('>' + fmt, self.content, self.offset)
+        self.offset += struct.calcsize('>' + fmt)
+        return values
+
+    def read_name(self):
+        length, = self.unpack('i')
+        name = self.content[self.offset:self.offset + length]
+        self.offset += length + len(padding(length))
+        return name
+
+    def read_values(self, nc_type, nelems):
+        if nc_type == NC_CHAR:
+            values = self.content[self.offset:self.offset + nelems]
+            self.offset += nelems
+        else:
+            values = list(self.unpack('%d%s' % (nelems, nc_formats[nc_type])))
+        self.offset += len(padding(self.offset))
+        return values
+
+    def read_list(self, tag):
+        list_tag, nelems = self.unpack('ii')
+        if list_tag not in (0, tag):
+            raise ValueError("Not a netCDF classic file")
+        return nelems
+
+    def read_attributes(self):
+        attributes = {}
+        for i in range(self.read_list(NC_ATTRIBUTE)):
+            name = self.read_name()
+            nc_type, nelems = self.unpack('ii')
+            values = self.read_values(nc_type, nelems)
+            if nc_type != NC_CHAR and len(values) == 1:
+                values = values[0]
+            attributes[name] = values
+        return attributes
+
+    def read(self):
+        """ @brief Return (global attributes, variables), the variables
+                   as name: (attributes, shape, values)
+        """
+        if self.content[:4] != 'CDF\x01':
+            raise ValueError("Not a netCDF classic file")
+        self.offset = 8
+        dimensions = []
+        for i in range(self.read_list(NC_DIMENSION)):
+            name = self.read_name()
+            dimensions.append(self.unpack('i')[0])
+        attributes = self.read_attributes()
+
+        variables = {}
+        for i in range(self.read_list(NC_VARIABLE)):
+            name = self.read_name()
+            ndims, = self.unpack('i')
+            shape = [dimensions[dim_id] for dim_id in self.unpack('%di' % ndims)]
+            var_attributes = self.read_attributes()
+            nc_type, vsize, begin = self.unpack('iii')
+            nelems = reduce(lambda x, y: x * y, shape, 1)
+            data_reader = ManifestReader(self.content)
+            data_reader.offset = begin
+            variables[name] = (var_attributes, shape,
+                               data_reader.read_values(nc_type, nelems))
+        return attributes, variables
+
+
+def decode_array(attributes, shape, values):
+    """ @brief Return an interface array as written by encode_array
+    """
+    if attributes.get('type') == "integer":
+        return values
+    strlen = shape[1]
+    strings = [values[i:i + strlen].rstrip('\0')
+               for i in range(0, len(values), strlen)]
+    if attributes.get('type') == "logical":
+        return [string == "True" for string in strings]
+    return strings
+
+
+def read_run_manifest(interface_dir="interface_data"):
+    """ @brief Read the run manifest of the current job
+        @param interface_dir The interface folder of the job
+        @return The manifest (dictionary), None if not available
+
+        The manifest holds the 'environment' entries (project_info as
+        "ESMValTool_"-strings) and the 'interface' arrays of the job.
+    """
+    manifest_file = os.path.join(interface_dir, run_manifest_name)
+    if not os.path.isfile(manifest_file):
+        return None
+    fmanifest = open(manifest_file, "rb")
+    attributes, variables = ManifestReader(fmanifest.read()).read()
+    fmanifest.close()
+    version = attributes.pop('run_manifest_version', None)
+    if version != run_manifest_version:
+        return None
+    return {'version': version,
+            'environment': attributes,
+            'interface': dict([(name, decode_array(*variable))
+                               for name, variable in variables.items()])}
@@ -0,0 +1,476 @@
+"""
+Dependency graph scheduler for the diagnostics of a namelist
+
+The namelist is planned as a graph of tasks before anything is executed:
+
+    reformat  - one task per reformatted (climo) file, keyed by the
+                output path from Project.get_cf_fullpath. Shared files
+                are produced once, even if several diagnostics need them
+    derive    - one task per derived variable of a diagnostic, depending
+                on the reformat tasks of the diagnostic
+    diag      - the diag_script of a diagnostic, depending on its derive
+                tasks
+
+The derive and diag tasks use the shared interface_data/-folder and may
+read output of earlier diag_scripts, hence they are run in the order of
+the namelist. Reformat tasks have no such restrictions, they run with a
+private environment in their own job directory (see make_job_dir) and
+overlap with the other tasks.
+"""
+from auxiliary import info
+import data_catalogue
+import launchers
+import os
+import pdb
+import projects
+import reformat
+import shutil
+import sys
+import tempfile
+import threading
+
+
+class Task(object):
+    """ @brief A single node in the task graph
+    """
+    def __init__(self, key, action, deps, description, in_main_thread,
+                 inputs=None):
+        """ @param key Unique key of the task
+            @param action Callable running the task
+            @param deps Keys of the tasks that need to finish first
+            @param description Short description for (error) messages
+            @param in_main_thread Run the task in the main thread, e.g.,
+                                  Python diagnostics executed in-process
+            @param inputs Files (or patterns) read by the task, see
+                          check_task_graph
+        """
+        self.key = key
+        self.action = action
+        self.deps = deps
+        self.description = description
+        self.in_main_thread = in_main_thread
+        if inputs is None:
+            inputs = []
+        self.inputs = inputs
+
+    def __str__(self):
+        return self.description
+
+
+class Task_graph(object):
+    """ @brief Directed acyclic graph of tasks, kept in insertion order
+    """
+    def __init__(self):
+        self.tasks = []
+        self.keys = set()
+        self.job_dirs = None
+
+    def add(self, task):
+        """ @brief Add a task, unless a task with the same key exists
+            @param task A Task instance
+            @return The key of the task
+        """
+        if task.key not in self.keys:
+            self.keys.add(task.key)
+            self.tasks.append(task)
+        return task.key
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        for task in self.tasks:
+            yield task
+
+
+def make_job_dir(project_info, prefix):
+    """ @brief Create a private working directory for a single job
+        @param project_info Current namelist in dictionary format
+        @param prefix Prefix of the directory name
+        @return Full path of the job directory
+
+        The job directory mirrors the ESMValTool root folder through
+        symbolic links, except for the interface_data/-folder which is
+        private to the job. Scripts loading "./interface_data/..." can
+        thus be run in parallel to other scripts.
+    """
+    jobs_root = os.path.join(project_info['GLOBAL']['wrk_dir'], 'jobs')
+    if not os.path.isdir(jobs_root):
+        try:
+            os.makedirs(jobs_root)
+        except OSError:
+            # Created by a concurrent job in the meantime
+            if not os.path.isdir(jobs_root):
+                raise
+    job_dir = tempfile.mkdtemp(prefix=prefix + '_', dir=jobs_root)
+
+    root = os.getcwd()
+    for entry in os.listdir(root):
+        if entry != 'interface_data':
+            os.symlink(os.path.join(root, entry), os.path.join(job_dir, entry))
+
+    interface_dir = os.path.join(job_dir, 'interface_data')
+    os.mkdir(interface_dir)
+    for entry in os.listdir(os.path.join(root, 'interface_data')):
+        if entry.endswith('_interface_templates') or entry == 'README':
+            os.symlink(os.path.join(root, 'interface_data', entry),
+                       os.path.join(interface_dir, entry))
+    return job_dir
+
+
+def remove_job_dir(job_dir):
+    """ @brief Remove a job directory (the symbolic links are not followed)
+    """
+    shutil.rmtree(job_dir)
+
+
+class Job_dir_pool(object):
+    """ @brief Pool of job directories, reused by consecutive jobs
+
+        Setting up a job directory (see make_job_dir) is done once per
+        worker rather than once per job: a released directory is handed
+        to the next job, which overwrites the interface_data/-files it
+        reads. All directories are removed by close().
+    """
+    def __init__(self, project_info, prefix):
+        self.project_info = project_info
+        self.prefix = prefix
+        self.idle = []
+        self.all = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ @brief Return an idle job directory (created if needed)
+        """
+        with self.lock:
+            if len(self.idle) > 0:
+                return self.idle.pop()
+        job_dir = make_job_dir(self.project_info, self.prefix)
+        with self.lock:
+            self.all.append(job_dir)
+        return job_dir
+
+    def release(self, job_dir):
+        with self.lock:
+            self.idle.append(job_dir)
+
+    def close(self):
+        with self.lock:
+            for job_dir in self.all:
+                remove_job_dir(job_dir)
+            self.idle = []
+            self.all = []
+
+
+def get_diag_models(project_info, currDiag):
+    """ @brief Return the models used by a diagnostic
+        @param project_info Current namelist in dictionary format
+        @param currDiag The current Diagnostic instance
+        @return List of Model instances (global + diag specific models)
+    """
+    diag_models = projects.remove_diag_specific_models(project_info['MODELS'])
+    diag_models.extend(currDiag.get_diag_models())
+    return diag_models
+
+
+def reformat_action(job, diag_info, job_dirs):
+    """ @brief Return the action running a reformat job in a job directory
+        @param job A reformat.Reformat_job instance
+        @param diag_info project_info of the diagnostic
+        @param job_dirs Job_dir_pool providing the job directory
+    """
+    # Snapshot of the diagnostic's 'RUNTIME' entries at planning time
+    reformat_info = dict(diag_info)
+    reformat_info['RUNTIME'] = dict(diag_info['RUNTIME'])
+
+    def action():
+        job_info = dict(reformat_info)
+        job_info['RUNTIME'] = dict(reformat_info['RUNTIME'])
+        env = launchers.get_job_environ()
+        env['__ESMValTool_base_var'] = job.base_var
+        job_dir = job_dirs.acquire()
+        job_info['RUNTIME']['cwd'] = job_dir
+        try:
+            reformat.run_reformat_job(job, job_info, env=env, cwd=job_dir)
+        finally:
+            job_dirs.release(job_dir)
+    return action
+
+
+def get_diag_environ(base_var):
+    """ @brief Return the private environment of a derive/diag task
+        @param base_var Last base variable planned for the diagnostic (for
+                        the ${VARIABLE}-placeholder of the model paths),
+                        None to keep the one of os.environ
+    """
+    env = launchers.get_job_environ()
+    if base_var is not None:
+        env['__ESMValTool_base_var'] = base_var
+    return env
+
+
+def derive_action(diag_info, derived_var, derived_field, base_var):
+    """ @brief Return the action running derive_var.ncl for a variable
+    """
+    def action():
+        verbosity = diag_info['GLOBAL']['verbosity']
+        exit_on_warning = diag_info['GLOBAL'].get('exit_on_warning', False)
+        diag_info['RUNTIME']['derived_var'] = derived_var
+        diag_info['RUNTIME']['derived_field_type'] = derived_field
+
+        executable = "./interface_scripts/derive_var.ncl"
+        info("", verbosity, required_verbosity=1)
+        info("Calling " + executable + " for '" + derived_var + "'",
+             verbosity, required_verbosity=1)
+        projects.run_executable(executable, diag_info, verbosity,
+                                exit_on_warning,
+                                env=get_diag_environ(base_var))
+    return action
+
+
+def diag_action(diag_info, currDiag, base_var):
+    """ @brief Return the action running the diag_script of a diagnostic
+    """
+    def action():
+        verbosity = diag_info['GLOBAL']['verbosity']
+        exit_on_warning = diag_info['GLOBAL'].get('exit_on_warning', False)
+        diag_info['RUNTIME']['derived_var'] = "Undefined"
+
+        executable = "./diag_scripts/" + currDiag.get_diag_script()
+        configfile = currDiag.get_diag_script_cfg()
+        info("", verbosity, required_verbosity=1)
+        info("Running diag_script: " + executable, verbosity,
+             required_verbosity=1)
+        info("with configuration file: " + configfile, verbosity,
+             required_verbosity=1)
+
+        projects.run_executable(executable,
+                                diag_info,
+                                verbosity,
+                                exit_on_warning,
+                                launcher_arguments=currDiag.get_launcher_arguments(),
+                                env=get_diag_environ(base_var))
+    return action
+
+
+def plan_namelist(project_info):
+    """ @brief Build the task graph for all diagnostics of a namelist
+        @param project_info Current namelist in dictionary format
+        @return A Task_graph instance
+
+        Each diagnostic is given its own shallow copy of project_info
+        with its own 'MODELS' and 'RUNTIME' entries, such that the tasks
+        of different diagnostics do not interfere. Likewise its derive
+        and diag tasks are run with the last base variable planned for
+        the diagnostic, as in a serial run.
+    """
+    verbosity = project_info['GLOBAL']['verbosity']
+    task_graph = Task_graph()
+    task_graph.job_dirs = Job_dir_pool(project_info, 'reformat')
+    previous_diag = None
+    diag_base_var = None
+
+    for diag_idx, currDiag in enumerate(project_info['DIAGNOSTICS']):
+        diag_info = dict(project_info)
+        diag_info['MODELS'] = get_diag_models(project_info, currDiag)
+        diag_info['RUNTIME'] = dict(project_info['RUNTIME'])
+
+        # Are the requested variables derived from other, more basic, variables?
+        requested_vars = currDiag.get_variables_list()
+
+        # Prepare/reformat model data for each model
+        reformat_keys = []
+        for model in diag_info['MODELS']:
+            currProject = model.get_project()
+            model_name = currProject.get_model_name(model)
+            project_name = currProject.get_project_name(model)
+            info("", verbosity, 1)
+            info("MODEL = " + model_name + " (" + project_name + ")", verbosity, 1)
+
+            # variables needed for target variable, according to variable_defs
+            variable_defs_base_vars = currDiag.add_base_vars_fields(requested_vars, model)
+            # if not all variable_defs_base_vars are available, try to fetch
+            # the target variable directly (relevant for derived variables)
+            base_vars = currDiag.select_base_vars(variable_defs_base_vars,
+                                                  model,
+                                                  currProject,
+                                                  diag_info)
+
+            # process base variables
+            for base_var in base_vars:
+                if currDiag.id_is_explicitly_excluded(base_var, model):
+                    continue
+                info("VARIABLE = " + base_var.var + " (" + base_var.fld + ")",
+                     verbosity, 1)
+
+                job = reformat.prepare_reformat(currProject, diag_info,
+                                                base_var, model)
+                diag_base_var = job.base_var
+                key = ('reformat', job.get_outfile())
+                if key in task_graph:
+                    info("  Reformat already planned for " + job.get_outfile(),
+                         verbosity, 2)
+                task_graph.add(Task(key,
+                                    reformat_action(job, diag_info,
+                                                    task_graph.job_dirs),
+                                    [],
+                                    "reformat " + str(job),
+                                    in_main_thread=False,
+                                    inputs=job.temporary['infile_path'].split()))
+                reformat_keys.append(key)
+
+        diag_info['RUNTIME']['currDiag'] = currDiag
+
+        # The derive/diag tasks are run in the order of the namelist
+        derive_keys = []
+        if previous_diag is not None:
+            derive_keys.append(previous_diag)
+        for derived_var, derived_field in zip(currDiag.get_variables(),
+                                              currDiag.get_field_types()):
+            key = ('derive', diag_idx, derived_var, derived_field)
+            task_graph.add(Task(key,
+                                derive_action(diag_info, derived_var,
+                                              derived_field, diag_base_var),
+                                reformat_keys + derive_keys,
+                                "derive_var.ncl for '" + derived_var + "'",
+                                in_main_thread=True,
+                                inputs=["./interface_scripts/derive_var.ncl"]))
+            derive_keys = [key]
+
+        key = ('diag', diag_idx)
+        diag_inputs = ["./diag_scripts/" + currDiag.get_diag_script()]
+        if currDiag.get_diag_script_cfg():
+            diag_inputs.append(currDiag.get_diag_script_cfg())
+        task_graph.add(Task(key,
+                            diag_action(diag_info, currDiag, diag_base_var),
+                            reformat_keys + derive_keys,
+                            "diag_script " + currDiag.get_diag_script(),
+                            in_main_thread=True,
+                            inputs=diag_inputs))
+        previous_diag = key
+
+    return task_graph
+
+
+def describe_task_graph(task_graph):
+    """ @brief Return a listing of the planned tasks
+        @param task_graph A Task_graph instance
+        @return List of lines, one per task with the numbers of the tasks
+                it depends on
+    """
+    numbers = {}
+    lines = []
+    for task in task_graph:
+        numbers[task.key] = len(numbers) + 1
+        line = "%4d  %s" % (numbers[task.key], str(task))
+        if len(task.deps) > 0:
+            line += "  (after " + ", ".join([str(numbers[dep])
+                                             for dep in task.deps]) + ")"
+        lines.append(line)
+    return lines
+
+
+def check_task_graph(task_graph):
+    """ @brief Check that the inputs of all planned tasks exist
+        @param task_graph A Task_graph instance
+        @return List of error messages (empty if all inputs exist)
+    """
+    errors = []
+    for task in task_graph:
+        for path in task.inputs:
+            if len(data_catalogue.glob(path)) == 0:
+                errors.append(str(task) + ": missing input " + path)
+    return errors
+
+
+def run_task_graph(task_graph, project_info, max_jobs):
+    """ @brief Execute a task graph with up to max_jobs concurrent tasks
+        @param task_graph A Task_graph instance
+        @param project_info Current namelist in dictionary format
+        @param max_jobs Maximum number of tasks running at once
+
+        Ready tasks are started in the order they were planned. Tasks
+        flagged 'in_main_thread' run in the main thread, all others in
+        worker threads (with max_jobs = 1 everything runs in the main
+        thread, in the order of the serial loop). After the first failure
+        no new tasks are started; the errors of all failed tasks are
+        reported and the first one is raised again.
+    """
+    if max_jobs < 1:
+        raise ValueError("max_jobs must be >= 1, got " + str(max_jobs))
+    verbosity = project_info['GLOBAL']['verbosity']
+    info("Executing " + str(len(task_graph)) + " tasks with up to "
+         + str(max_jobs) + " in parallel", verbosity, required_verbosity=2)
+
+    pending = list(task_graph)
+    done = set()
+    running = {}
+    failed = []
+    condition = threading.Condition()
+
+    def start_ready_tasks(main_thread):
+        """ Start the ready worker tasks and return the first ready main
+            thread task (if called from the main thread). The caller must
+            hold the condition lock.
+        """
+        main_task = None
+        for task in list(pending):
+            if len(failed) > 0 or len(running) >= max_jobs:
+                break
+            if not all([dep in done for dep in task.deps]):
+                continue
+            if task.in_main_thread or max_jobs == 1:
+                if not main_thread or main_task is not None:
+                    continue
+                main_task = task
+            else:
+                worker = threading.Thread(target=execute, args=(task,))
+                worker.daemon = True
+                worker.start()
+            pending.remove(task)
+            running[task.key] = task
+        return main_task
+
+    def execute(task):
+        try:
+            task.action()
+            exc_info = None
+        # error() calls from the tasks exit through SystemExit
+        except (Exception, SystemExit):
+            exc_info = sys.exc_info()
+        with condition:
+            del running[task.key]
+            if exc_info is None:
+                done.add(task.key)
+            else:
+                failed.append((task, exc_info))
+            start_ready_tasks(main_thread=False)
+            condition.notify()
+
+    while True:
+        with condition:
+            main_task = start_ready_tasks(main_thread=True)
+            while main_task is None and len(running) > 0:
+                # Time out regularly to stay responsive to Ctrl-C
+                condition.wait(1.0)
+                main_task = start_ready_tasks(main_thread=True)
+        if main_task is None:
+            break
+        execute(main_task)
+
+    # All tasks finished, the job directories are no longer in use
+    if task_graph.job_dirs is not None:
+        task_graph.job_dirs.close()
+
+    for task, exc_info in failed:
+        sys.stderr.write("error: task failed: " + str(task) + ": "
+                         + str(exc_info[1]) + '\n')
+    if len(failed) > 0:
+        exc_info = failed[0][1]
+        raise exc_info[0], exc_info[1], exc_info[2]
+    if len(pending) > 0:
+        raise RuntimeError("Unresolved dependencies for "
+                           + ", ".join([str(task) for task in pending]))
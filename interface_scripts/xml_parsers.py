@@ -4,6 +4,7 @@ import nml_tags
 import xml.dom.minidom
 from auxiliary import info, error
 import base64
+import launchers
 import re
 import os
 
@@ -216,4 +217,6 @@ class namelistHandler(xml.sax.handler.ContentHandler):
 				#		      a different Path-ID'.format(k,self.include))
 				#	else:
 				#		self.project_info[k] = v['path']
-				os.putenv("ESMValTool_" + k, str(v['path']))
+				os.environ["ESMValTool_" + k] = str(v['path'])
+				# Passed on to the environment of every launched script
+				launchers.persistent_env_variables.append("ESMValTool_" + k)
@@ -37,11 +37,13 @@ sys.path.append("./diag_scripts")
 from auxiliary import info, error, print_header, ncl_version_check
 ## from climate import climate
 from optparse import OptionParser
+import data_catalogue
 import datetime
 import projects
 import os
 import pdb
-import reformat
+import reformat_cache
+import scheduler
 import xml.sax
 import xml_parsers
 
@@ -49,9 +51,6 @@ import xml_parsers
 version = "1.1.0"
 os.environ['0_ESMValTool_version'] = version
 
-# Check NCL version
-ncl_version_check()
-
 # Check command arguments.
 usage = "%prog nml/namelist-file.xml"
 description = """ESMValTool - Earth System Model Evaluation Tool.
@@ -61,6 +60,23 @@ parser = OptionParser(usage=usage, description=description)
 parser.add_option("-r", "--reformat",
                   action="store_true", dest="reformat", default=False,
                   help="run reformat scripts for the observations according to namelist")
+parser.add_option("-j", "--jobs",
+                  action="store", type="int", dest="jobs", default=None,
+                  help="number of tasks (reformat, derive_var, diag_script) "
+                       "to run in parallel (overrides GLOBAL/max_parallel_jobs "
+                       "in the namelist)")
+parser.add_option("--reformat-cache",
+                  action="store", type="choice", dest="reformat_cache",
+                  choices=["list", "evict"], default=None,
+                  help="list the reformatted files in climo_dir with their "
+                       "status (valid/stale/missing), or evict the stale ones")
+parser.add_option("--plan",
+                  action="store_true", dest="plan", default=False,
+                  help="list the tasks planned for the namelist and exit")
+parser.add_option("--check",
+                  action="store_true", dest="check", default=False,
+                  help="check the namelist, the NCL version and that the "
+                       "input files of all tasks exist, then exit")
 options, args = parser.parse_args()
 if len(args) == 0:
     parser.print_help()
@@ -69,6 +85,10 @@ if len(args) == 0:
 # Get command arguments.
 input_xml_full_path = args[0]
 
+# Check NCL version (not needed to list the plan or the reformat cache)
+if not options.plan and options.reformat_cache is None:
+    ncl_version_check()
+
 # Parse input namelist into project_info-dictionary.
 Project = xml_parsers.namelistHandler()
 parser = xml.sax.make_parser()
@@ -78,6 +98,9 @@ parser.parse(input_xml_full_path)
 # Project_info is a dictionary with all info from the namelist.
 project_info = Project.project_info
 
+# Serve the input file lookups from the data catalogue (if configured)
+data_catalogue.use_catalogue(project_info)
+
 if options.reformat:
 	if 'REFORMAT' not in project_info.keys():
 		error('No REFORMAT tag specified in {0}'.format(input_xml_full_path))
@@ -96,7 +119,29 @@ if options.reformat:
 
 verbosity = project_info['GLOBAL']['verbosity']
 climo_dir = project_info['GLOBAL']['climo_dir']
+
+if options.reformat_cache is not None:
+    cache = reformat_cache.Reformat_cache(climo_dir)
+    if options.reformat_cache == 'list':
+        for key, status in cache.get_status():
+            print "%-8s %s" % (status, os.path.join(climo_dir, key))
+    else:
+        for key in cache.evict():
+            info("Evicted " + os.path.join(climo_dir, key), verbosity, 1)
+    sys.exit(0)
+
 exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
+if options.jobs is not None:
+    max_parallel_jobs = options.jobs
+else:
+    max_parallel_jobs = project_info['GLOBAL'].get('max_parallel_jobs', 1)
+try:
+    max_parallel_jobs = int(max_parallel_jobs)
+except ValueError:
+    max_parallel_jobs = 0
+if max_parallel_jobs < 1:
+    error("The number of parallel jobs (-j/max_parallel_jobs) must be an "
+          "integer >= 1")
 
 # Additional entries to 'project_info'. The 'project_info' construct
 # is one way by which Python passes on information to the NCL-routines.
@@ -111,59 +156,35 @@ project_info['RUNTIME']['xml_name'] = input_xml_file
 in_refs = os.path.join(os.getcwd(), 'doc/MASTER_authors-refs-acknow.txt')
 project_info['RUNTIME']['in_refs'] = in_refs
 
-# Create refs-acknows file in workdir (delete if existing)
+# Prepare writing of references/acknowledgementes to file (in the workdir,
+# created below)
 wrk_dir = project_info['GLOBAL']['wrk_dir']
-if not os.path.isdir(wrk_dir):
-    os.mkdir(wrk_dir)
-
-# Prepare writing of references/acknowledgementes to file
 refs_acknows_file = str.replace(input_xml_file, "namelist_", "refs-acknows_")
 refs_acknows_file = refs_acknows_file.split(os.extsep)[0] + ".log"
 
 out_refs = os.path.join(wrk_dir, refs_acknows_file)
-if (os.path.isfile(out_refs)):
-    os.remove(out_refs)
-f = open(out_refs, "w")
-f.close()
 project_info['RUNTIME']['out_refs'] = out_refs
 
 # Current working directory
 project_info['RUNTIME']['cwd'] = os.getcwd()
 
-# Summary to std-out before starting the loop
 timestamp1 = datetime.datetime.now()
 timestamp_format = "%Y-%m-%d --  %H:%M:%S"
 
-print_header(project_info, options.reformat)
-info("Starting the Earth System Model Evaluation Tool v" + version + " at time: "
-     + timestamp1.strftime(timestamp_format) + "...", verbosity, 1)
-
-# Load ESGF config info (if specified in namelist)
-print project_info['ESGF']
+# Load ESGF config info (if specified in namelist), needed to plan the
+# reformat of ESGF models
 if 'ESGF' in project_info and 'config_file' in project_info['ESGF']:
     esgf_config_file = project_info['ESGF']['config_file']
     if os.path.isfile(esgf_config_file):
-        info("Loading ESGF config file", verbosity, 2)
         esgf_config_handler = xml_parsers.ESGFConfigHandler()
         parser = xml.sax.make_parser()
         parser.setContentHandler(esgf_config_handler)
         parser.parse(esgf_config_file)
         esgf_config = esgf_config_handler.current_tag.config
         esgf_config.config_file_name = esgf_config_file
-        info("ESGF config file loaded", verbosity, 2)
-
-        # Summary of ESGF config info (if exists) to std-out
-        info('', verbosity, 3)
-        info('Summary of ESGF config information:',\
-            verbosity, 3)
-        msg = str(esgf_config)
-        for msg_line in msg.split('\n'):
-            info(msg_line, verbosity, 3)
-        info("", verbosity, 3)
 
         # Perform quality check on ESGF config
         projects.ESGF.quality_check(esgf_config)
-        info("ESGF config file passed quality check.", verbosity, 2)
 
         # Store ESGF config in project_info
         project_info['ESGF']['config'] = esgf_config
@@ -178,76 +199,53 @@ if 'ESGF' in project_info and 'config_file' in project_info['ESGF']:
         msg = "Cannot find ESGF config file '%s'" % esgf_config_file
         raise IOError(msg)
 
-# Loop over all diagnostics defined in project_info and
-# create/prepare netCDF files for each variable
-for currDiag in project_info['DIAGNOSTICS']:
-
-    # Are the requested variables derived from other, more basic, variables?
-    requested_vars = currDiag.get_variables_list()
-
-    # Update currDiag-specific models
-    project_info['MODELS'] = projects.remove_diag_specific_models(
-        project_info['MODELS'])
-    diag_specific_models = currDiag.get_diag_models()
-    projects.add_model(project_info, diag_specific_models)
-
-    # Prepare/reformat model data for each model
-    for model in project_info['MODELS']:
-        currProject = getattr(vars()['projects'], model.split_entries()[0])()
-        model_name = currProject.get_model_name(model)
-        project_name = currProject.get_project_name(model)
-        info("", verbosity, 1)
-        info("MODEL = " + model_name + " (" + project_name + ")", verbosity, 1)
-
-        # variables needed for target variable, according to variable_defs
-        variable_defs_base_vars = currDiag.add_base_vars_fields(requested_vars, model)
-        # if not all variable_defs_base_vars are available, try to fetch
-        # the target variable directly (relevant for derived variables)
-        base_vars = currDiag.select_base_vars(variable_defs_base_vars,
-                                              model,
-                                              currProject,
-                                              project_info)
-
-        # process base variables
-        for base_var in base_vars:
-            if currDiag.id_is_explicitly_excluded(base_var, model):
-                continue
-            info("VARIABLE = " + base_var.var + " (" + base_var.fld + ")",
-                 verbosity, 1)
-
-            # Rewrite netcdf to expected input format.
-            info("Calling cmor_reformat.py to check/reformat model data",
-                 verbosity, 2)
-            reformat.cmor_reformat(currProject, project_info, base_var, model)
-
-    variables = currDiag.get_variables()
-    field_types = currDiag.get_field_types()
-
-    project_info['RUNTIME']['currDiag'] = currDiag
-    for derived_var, derived_field in zip(variables, field_types):
-        project_info['RUNTIME']['derived_var'] = derived_var
-        project_info['RUNTIME']['derived_field_type'] = derived_field
-
-        executable = "./interface_scripts/derive_var.ncl"
-        info("", verbosity, required_verbosity=1)
-        info("Calling " + executable + " for '" + derived_var + "'",
-             verbosity, required_verbosity=1)
-        projects.run_executable(executable, project_info, verbosity,
-                                exit_on_warning)
-    project_info['RUNTIME']['derived_var'] = "Undefined"
-
-    executable = "./diag_scripts/" + currDiag.get_diag_script()
-    configfile = currDiag.get_diag_script_cfg()
-    info("", verbosity, required_verbosity=1)
-    info("Running diag_script: " + executable, verbosity, required_verbosity=1)
-    info("with configuration file: " + configfile, verbosity,
-         required_verbosity=1)
-
-    projects.run_executable(executable,
-                            project_info,
-                            verbosity,
-                            exit_on_warning,
-                            launcher_arguments=currDiag.get_launcher_arguments())
+# Plan all diagnostics defined in project_info as a graph of
+# reformat/derive/diag tasks
+task_graph = scheduler.plan_namelist(project_info)
+
+# --plan/--check only look at the namelist and the input files, nothing
+# is written to the workdir
+if options.plan:
+    for line in scheduler.describe_task_graph(task_graph):
+        print line
+    sys.exit(0)
+
+if options.check:
+    errors = scheduler.check_task_graph(task_graph)
+    for msg in errors:
+        sys.stderr.write("error: " + msg + '\n')
+    if len(errors) > 0:
+        sys.exit(1)
+    info("Checked " + str(len(task_graph)) + " tasks, all inputs found",
+         verbosity, 1)
+    sys.exit(0)
+
+# Create refs-acknows file in workdir (delete if existing)
+if not os.path.isdir(wrk_dir):
+    os.mkdir(wrk_dir)
+if (os.path.isfile(out_refs)):
+    os.remove(out_refs)
+f = open(out_refs, "w")
+f.close()
+
+# Summary to std-out before running the tasks
+print_header(project_info, options.reformat)
+info("Starting the Earth System Model Evaluation Tool v" + version + " at time: "
+     + timestamp1.strftime(timestamp_format) + "...", verbosity, 1)
+
+# Summary of ESGF config info (if exists) to std-out
+if 'ESGF' in project_info and 'config' in project_info['ESGF']:
+    info("ESGF config file loaded", verbosity, 2)
+    info('', verbosity, 3)
+    info('Summary of ESGF config information:',\
+        verbosity, 3)
+    msg = str(project_info['ESGF']['config'])
+    for msg_line in msg.split('\n'):
+        info(msg_line, verbosity, 3)
+    info("", verbosity, 3)
+    info("ESGF config file passed quality check.", verbosity, 2)
+
+scheduler.run_task_graph(task_graph, project_info, max_parallel_jobs)
 
 # delete environment variable
 del(os.environ['0_ESMValTool_version'])
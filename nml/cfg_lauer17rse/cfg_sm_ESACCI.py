@@ -20,6 +20,8 @@ mima_globmeandiff_r=[-1,1]
 trend = True
 anomalytrend = False
 trend_p=False
+# number of worker processes of the trend and tau maps (default 1)
+processes = 1
 
 # flags for specific diagnostics
 percentile = True
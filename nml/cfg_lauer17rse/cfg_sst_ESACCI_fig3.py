@@ -18,6 +18,8 @@ mima_globmeandiff_r=[-0.03,0.03]
 trend = False# True
 anomalytrend =False#True
 trend_p=False
+# number of worker processes of the trend and tau maps (default 1)
+processes = 1
 
 # flags for specific diagnostics
 percentile = False#True
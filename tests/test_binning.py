@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+
+
+def reference_binned_means(cloud, radiation, bins):
+    """ Counts and means per bin as done by calculate_scatterplot_values
+        before (one masked copy per bin) """
+    nbins = len(bins) - 1
+    cl_count = np.zeros(nbins)
+    cl_values = np.zeros(nbins) * np.nan
+    rd_values = np.zeros(nbins) * np.nan
+    for i in xrange(nbins):
+        # Open ended for end points
+        if (i == 0):
+            cl_masked = np.ma.masked_greater(cloud, bins[i + 1])
+        elif (i == nbins - 1):
+            cl_masked = np.ma.masked_less(cloud, bins[i])
+        else:
+            cl_masked = np.ma.masked_outside(cloud, bins[i], bins[i + 1])
+        rd_masked = np.ma.masked_array(radiation, cl_masked.mask)
+        cl_count[i] = np.ma.count(cl_masked)
+        if cl_count[i] > 0:
+            cl_values[i] = cl_masked.mean()
+            rd_values[i] = rd_masked.mean()
+    return cl_count, cl_values, rd_values
+
+
+class TestBinning(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.bins = np.linspace(0., 100., 21)
+        # Many values on the bin edges
+        self.cloud = [np.ma.masked_array(np.round(rs.rand(12, 6, 8) * 40) * 2.5,
+                                         rs.rand(12, 6, 8) < 0.1),
+                      np.ma.masked_array(rs.rand(5, 9) * 110. - 5.)]
+        self.radiation = [np.ma.masked_array(rs.rand(12, 6, 8) * 300.,
+                                             rs.rand(12, 6, 8) < 0.1),
+                          np.ma.masked_array(rs.rand(5, 9) * 300.)]
+
+    def test_binned_means(self):
+        from binning import binned_means
+        counts, x_means, y_means = binned_means(self.cloud, self.radiation, self.bins)
+        self.assertEqual(counts.shape, (2, 20))
+        for member in xrange(2):
+            expected = reference_binned_means(self.cloud[member],
+                                              self.radiation[member], self.bins)
+            filled = counts[member] > 0
+            self.assertTrue(np.array_equal(counts[member], expected[0]))
+            self.assertTrue(np.allclose(x_means[member][filled],
+                                        expected[1][filled], rtol=1e-12))
+            self.assertTrue(np.allclose(y_means[member][filled],
+                                        expected[2][filled], rtol=1e-12))
+
+    def test_bin_edges(self):
+        from binning import binned_means
+        bins = np.array([0., 10., 20., 30.])
+        cloud = [np.array([-5., 10., 15., 20., 20., 35.])]
+        radiation = [np.array([1., 2., 3., 4., 6., 7.])]
+        counts, x_means, y_means = binned_means(cloud, radiation, bins)
+        # 10 and 20 are counted in both adjacent bins, -5 and 35 in the
+        # open ended first/last bin
+        self.assertEqual(counts.tolist(), [[2, 4, 3]])
+        self.assertTrue(np.allclose(x_means, [[2.5, 16.25, 25.]]))
+        self.assertTrue(np.allclose(y_means, [[1.5, 3.75, 17. / 3]]))
+
+    def test_empty_and_invalid(self):
+        from binning import binned_means
+        bins = np.array([0., 10., 20., 30.])
+        cloud = [np.ma.masked_array([5., 25., np.nan, 15.], [False, False, False, True]),
+                 np.ma.masked_all((2, 2))]
+        radiation = [np.ma.masked_array([1., 2., 3., 4.], [False, True, False, False]),
+                     np.ma.zeros((2, 2))]
+        counts, x_means, y_means = binned_means(cloud, radiation, bins)
+        self.assertEqual(counts.tolist(), [[1, 0, 1], [0, 0, 0]])
+        self.assertTrue(np.isnan(x_means[0, 1]) and np.isnan(y_means[0, 2]))
+        self.assertTrue(np.isnan(x_means[1]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+
+
+def reference_annual(data):
+    """ Mean annual cycle as done by ESMValProject.average_data before """
+    means = np.zeros((12,) + data.shape[1:])
+    for month in xrange(12):
+        for lat in xrange(means.shape[1]):
+            for lon in xrange(means.shape[2]):
+                means[month, lat, lon] = np.ma.mean(data[month::12, lat, lon])
+    return means
+
+
+def reference_monthly(data):
+    """ Means of each calendar month as done by average_data before """
+    means = np.zeros(12)
+    for month in xrange(12):
+        means[month] = np.ma.mean(data[month::12, :, :])
+    return means
+
+
+def reference_seasonal(data, months):
+    """ Seasonal means as done by extract_seasonal_mean_values before """
+    mask = np.ones(data.shape)
+    for month in months:
+        mask[month - 1::12, :, :] = 0
+    masked_values = np.ma.masked_array(data, np.ma.getmaskarray(data) | (mask > 0))
+    mean_values = np.zeros(data.shape[1:])
+    for lat in xrange(data.shape[1]):
+        for lon in xrange(data.shape[2]):
+            mean_values[lat, lon] = masked_values[:, lat, lon].mean()
+    return mean_values
+
+
+class TestClimatology(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.data = np.ma.masked_greater(250 + 50 * rs.rand(12 * 4, 5, 7), 295)
+
+    def test_full_years(self):
+        import climatology
+        self.assertTrue(np.allclose(climatology.monthly_climatology(self.data),
+                                    reference_annual(self.data), rtol=1e-12))
+        self.assertTrue(np.allclose(climatology.monthly_means(self.data),
+                                    reference_monthly(self.data), rtol=1e-12))
+        for months in [[12, 1, 2], [6, 7, 8]]:
+            self.assertTrue(np.allclose(climatology.seasonal_mean(self.data, months),
+                                        reference_seasonal(self.data, months),
+                                        rtol=1e-12))
+
+    def test_incomplete_years(self):
+        import climatology
+        # Three years and five months, January-May have one more year
+        data = self.data[:12 * 3 + 5]
+        self.assertTrue(np.allclose(climatology.monthly_climatology(data),
+                                    reference_annual(data), rtol=1e-12))
+        self.assertTrue(np.allclose(climatology.monthly_means(data),
+                                    reference_monthly(data), rtol=1e-12))
+        self.assertTrue(np.allclose(climatology.seasonal_mean(data, [12, 1, 2]),
+                                    reference_seasonal(data, [12, 1, 2]),
+                                    rtol=1e-12))
+
+    def test_all_masked(self):
+        import climatology
+        data = self.data.copy()
+        data[1::12, 2, 3] = np.ma.masked
+        annual = climatology.monthly_climatology(data)
+        self.assertTrue(np.isnan(annual[1, 2, 3]))
+        self.assertEqual(np.isnan(annual).sum(), 1)
+
+    def test_float32_accumulation(self):
+        import climatology
+        data = self.data.astype(np.float32)
+        annual = climatology.monthly_climatology(data, dtype=np.float32)
+        self.assertEqual(annual.dtype, np.float32)
+        self.assertTrue(np.allclose(annual, reference_annual(data), rtol=1e-6))
+        means = climatology.monthly_means(data[:12 * 3 + 5], dtype=np.float32)
+        self.assertEqual(means.dtype, np.float32)
+        self.assertTrue(np.allclose(means, reference_monthly(data[:12 * 3 + 5]),
+                                    rtol=1e-6))
+        seasonal = climatology.seasonal_mean(data, [6, 7, 8], dtype=np.float32)
+        self.assertEqual(seasonal.dtype, np.float32)
+        self.assertTrue(np.allclose(seasonal, reference_seasonal(data, [6, 7, 8]),
+                                    rtol=1e-6))
+
+
+if __name__ == "__main__":
+    unittest.main()
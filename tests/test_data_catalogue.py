@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+import unittest
+
+
+class TestDataCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.datadir = os.path.join(self.tmpdir, 'data')
+        os.mkdir(self.datadir)
+        for years in ['185001-189912', '190001-194912']:
+            open(os.path.join(self.datadir, 'ta_Amon_M_historical_r1i1p1_'
+                              + years + '.nc'), 'w').close()
+        self.db_file = os.path.join(self.tmpdir, 'catalogue.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_catalogue_glob(self):
+        from interface_scripts.data_catalogue import Data_catalogue
+        catalogue = Data_catalogue(self.db_file)
+        pattern = os.path.join(self.datadir, 'ta_Amon_M_*.nc')
+        self.assertEqual(len(catalogue.glob(pattern)), 2)
+        self.assertTrue(catalogue.isfile(os.path.join(self.datadir,
+                        'ta_Amon_M_historical_r1i1p1_185001-189912.nc')))
+        self.assertFalse(catalogue.isfile(os.path.join(self.datadir, 'missing.nc')))
+        self.assertEqual(catalogue.glob(os.path.join(self.tmpdir, 'nodir', '*.nc')), [])
+
+        # Directories are listed, but are not files
+        self.assertEqual(catalogue.glob(os.path.join(self.tmpdir, 'da*')), [self.datadir])
+        self.assertFalse(catalogue.isfile(self.datadir))
+
+    def test_catalogue_select_infiles(self):
+        import interface_scripts.data_catalogue as data_catalogue
+        from interface_scripts.projects import select_infiles
+        pattern = os.path.join(self.datadir, 'ta_Amon_M_*.nc')
+        data_catalogue.catalogue = data_catalogue.Data_catalogue(self.db_file)
+        try:
+            # The years are read from the index, not from the file names
+            data_catalogue.catalogue.list_dir(self.datadir)
+            data_catalogue.catalogue.connection.execute(
+                "UPDATE files SET start_year = start_year + 1000, "
+                "end_year = end_year + 1000")
+            data_catalogue.catalogue.listings = {}
+            self.assertEqual(data_catalogue.get_years(os.path.join(
+                self.datadir, 'ta_Amon_M_historical_r1i1p1_185001-189912.nc')), (2850, 2899))
+            self.assertEqual([os.path.basename(f) for f in select_infiles(pattern, 2890, 2900)],
+                             ['ta_Amon_M_historical_r1i1p1_185001-189912.nc',
+                              'ta_Amon_M_historical_r1i1p1_190001-194912.nc'])
+            self.assertEqual(select_infiles(pattern, 1890, 1900), [])
+        finally:
+            data_catalogue.catalogue = None
+
+    def test_catalogue_refresh(self):
+        from interface_scripts.data_catalogue import Data_catalogue
+        pattern = os.path.join(self.datadir, 'ta_Amon_M_*.nc')
+        self.assertEqual(len(Data_catalogue(self.db_file).glob(pattern)), 2)
+
+        # A new file changes the directory mtime, the listing is refreshed
+        new_file = os.path.join(self.datadir, 'ta_Amon_M_historical_r1i1p1_195001-199912.nc')
+        open(new_file, 'w').close()
+        mtime = os.stat(self.datadir).st_mtime
+        os.utime(self.datadir, (mtime + 10, mtime + 10))
+        catalogue = Data_catalogue(self.db_file)
+        self.assertEqual(len(catalogue.glob(pattern)), 3)
+        years = catalogue.connection.execute("SELECT start_year, end_year FROM files "
+                                             "WHERE name = ?",
+                                             (os.path.basename(new_file),)).fetchone()
+        self.assertEqual(years, (1950, 1999))
+
+
+if __name__ == "__main__":
+    unittest.main()
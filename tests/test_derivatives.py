@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+
+
+def convert_latlon_meters(lat1, lat2, lon1, lon2):
+    """ Distance in meters as done by TropicalVariability_wind before """
+    return np.arccos(np.sin(lat1 * np.pi / 180) * np.sin(lat2 * np.pi / 180)
+                     + np.cos(lat1 * np.pi / 180) * np.cos(lat2 * np.pi / 180)
+                     * np.cos(lon2 * np.pi / 180 - lon1 * np.pi / 180)) * 6371000
+
+
+def reference_d_dlon(means, lats, lons):
+    """ Longitudinal derivative as done by calculate_derivatives before """
+    output = np.zeros((means.shape[0], means.shape[1] - 2))
+    for lat in xrange(len(lats)):
+        for lon in xrange(len(lons) - 2):
+            delta = convert_latlon_meters(lats[lat], lats[lat],
+                                          lons[lon], lons[lon + 2])
+            output[lat, lon] = (means[lat, lon + 2] - means[lat, lon]) / delta
+    return output
+
+
+def reference_d_dlat(means, lats, lons):
+    """ Latitudinal derivative as done by calculate_derivatives before """
+    output = np.zeros((means.shape[0] - 2, means.shape[1]))
+    for lat in xrange(len(lats) - 2):
+        for lon in xrange(len(lons)):
+            delta = convert_latlon_meters(lats[lat], lats[lat + 2],
+                                          lons[lon], lons[lon])
+            output[lat, lon] = (means[lat + 2, lon] - means[lat, lon]) / delta
+    return output
+
+
+class TestDerivatives(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.lats = np.array([-31., -28.5, -25., -20., -17.5, -10., 0., 12.5])
+        self.lons = np.arange(0., 360., 7.5)
+        self.data = rs.rand(4, len(self.lats), len(self.lons))
+
+    def test_ghost_layers(self):
+        import derivatives
+        for step in xrange(self.data.shape[0]):
+            self.assertTrue(np.allclose(
+                derivatives.d_dlon(self.data, self.lats, self.lons)[step],
+                reference_d_dlon(self.data[step], self.lats, self.lons),
+                rtol=1e-9))
+            self.assertTrue(np.allclose(
+                derivatives.d_dlat(self.data, self.lats, self.lons)[step],
+                reference_d_dlat(self.data[step], self.lats, self.lons),
+                rtol=1e-9))
+
+    def test_periodic(self):
+        import derivatives
+        # Periodic longitudes give the result of ghost layers holding the
+        # wrapped around first/last longitude
+        ghost_data = np.concatenate((self.data[..., -1:], self.data,
+                                     self.data[..., :1]), axis=-1)
+        ghost_lons = np.concatenate(([self.lons[-1] - 360.], self.lons,
+                                     [self.lons[0] + 360.]))
+        periodic = derivatives.d_dlon(self.data, self.lats, self.lons, periodic=True)
+        self.assertEqual(periodic.shape, self.data.shape)
+        self.assertTrue(np.allclose(periodic,
+                                    derivatives.d_dlon(ghost_data, self.lats, ghost_lons),
+                                    rtol=1e-12))
+
+        u, v = self.data, self.data[::-1]
+        divergence = derivatives.divergence(u, v, self.lats, self.lons, periodic=True)
+        ghost_divergence = derivatives.divergence(ghost_data, ghost_data[::-1],
+                                                  self.lats, ghost_lons)
+        self.assertEqual(divergence.shape, (4, len(self.lats) - 2, len(self.lons)))
+        self.assertTrue(np.allclose(divergence, ghost_divergence, rtol=1e-12))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+
+import unittest
+import tempfile
+
+import numpy as np
+
+
+class TestIntermediateStore(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.tmpdir, 'intermediate')
+        self.infile = os.path.join(self.tmpdir, 'pr.nc')
+        with open(self.infile, 'w') as f:
+            f.write('input')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_load(self):
+        import intermediate_store as store
+        lons = np.arange(0, 360, 2.5)
+        data = np.ma.masked_greater(np.linspace(0, 1, len(lons)), 0.9)
+        store.save(self.store_dir, 'eq_pr_model_A', {'lons': lons, 'data': data})
+        self.assertEqual(store.names(self.store_dir, 'eq_pr'), ['eq_pr_model_A'])
+        self.assertEqual(store.names(self.store_dir, 'eq_ts'), [])
+
+        arrays = store.load(self.store_dir, 'eq_pr_model_A')
+        self.assertTrue(isinstance(arrays['data'], np.memmap))
+        self.assertTrue(np.array_equal(arrays['lons'], lons))
+        self.assertTrue(np.array_equal(np.isnan(arrays['data']), data.mask))
+        self.assertEqual(store.load(self.store_dir, 'eq_pr_model_A', ['lons']).keys(),
+                         ['lons'])
+
+    def test_reuse(self):
+        import intermediate_store as store
+        inputs = store.signature([self.infile], {'lat_min': '-5'})
+        store.save(self.store_dir, 'eq_pr_model_A', {'data': np.zeros(3)}, inputs)
+        store.release(self.store_dir, 'eq_')
+        self.assertEqual(store.names(self.store_dir), [])
+
+        # Other settings or changed input files
+        self.assertFalse(store.reuse(self.store_dir, 'eq_pr_model_A',
+                                     store.signature([self.infile], {'lat_min': '-10'})))
+        self.assertFalse(store.reuse(self.store_dir, 'eq_pr_model_B', inputs))
+        self.assertTrue(store.reuse(self.store_dir, 'eq_pr_model_A', inputs))
+        self.assertEqual(store.names(self.store_dir), ['eq_pr_model_A'])
+
+        with open(self.infile, 'a') as f:
+            f.write('changed')
+        self.assertNotEqual(store.signature([self.infile], {'lat_min': '-5'}), inputs)
+
+
+if __name__ == "__main__":
+    unittest.main()
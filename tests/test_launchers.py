@@ -10,6 +10,7 @@ Tests are implemented using *assert* statements
 import sys
 import os
 import glob
+import json
 
 import unittest
 import tempfile
@@ -110,6 +111,42 @@ class TestPythonLauncher(TestLauncher):
         with self.assertRaises(ValueError):
             L.execute(script, project_info, 0, False)
 
+    def test_python_launcher_execute_shell_private_env(self):
+        # a private environment is passed to the script, os.environ is untouched
+        from interface_scripts.launchers import py_launcher, get_job_environ
+        testoutput = self.tmpdir + 'test_result_env.json'
+
+        script = self.tmpdir + 'testscript_env.py'
+        o = open(script, 'w')
+        o.write('import json, os\n')
+        o.write("json.dump(os.environ['ESMValTool_test_key'], open('" + testoutput + "', 'w'))\n")
+        o.close()
+
+        env = get_job_environ()
+        env['ESMValTool_test_key'] = 'test_value'
+        L = py_launcher(execute_as_shell=True)
+        L.execute(script, {}, 0, False, env=env)
+        self.assertEqual(json.load(open(testoutput)), 'test_value')
+        self.assertFalse('ESMValTool_test_key' in os.environ)
+
+    def test_python_launcher_execute_shell_large_output_warning(self):
+        # output larger than the pipe buffer is streamed, a warning in
+        # it is found and raised with exit_on_warning
+        from interface_scripts.launchers import py_launcher
+        from interface_scripts.auxiliary import nclExecuteWarning
+
+        script = self.tmpdir + 'testscript_output.py'
+        o = open(script, 'w')
+        o.write("import sys\n")
+        o.write("for i in range(20000):\n")
+        o.write("    sys.stdout.write('line %d of some chatty output\\n' % i)\n")
+        o.write("sys.stdout.write('warning: something is odd\\n')\n")
+        o.close()
+
+        L = py_launcher(execute_as_shell=True)
+        with self.assertRaises(nclExecuteWarning):
+            L.execute(script, {}, 0, True)
+
 class TestCSHLauncher(TestLauncher):
 
         def setUp(self):
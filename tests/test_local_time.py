@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+
+
+def reference_daily(data, lon, data_start_time, land_indexes):
+    """ Weighted sampling at 6:00 local time as done by get_smclim before """
+    time_loc_sol = 6.0 + 3 - data_start_time
+    lon = np.array([l - 360.0 if l >= 180.0 else l for l in lon])
+    kindex = (time_loc_sol - (lon * 24.0 / 360.0)) * 8 / 24.0 + 8
+
+    weight_lon = np.zeros((24, len(lon)), dtype=lon.dtype)
+    for i, (kf, kw) in enumerate(zip(*np.modf(kindex))):
+        weight_lon[int(kw), i] = 1.0 - kf
+        weight_lon[int(kw) + 1, i] = kf
+    weights_lon = np.where((weight_lon > 0), 1, weight_lon)
+    weights_lon = weights_lon - np.concatenate((np.zeros((1, weights_lon.shape[1])),
+                                                weights_lon[:-1]))
+    weights_lon = np.where((weights_lon < 0), 0, weights_lon)
+
+    lon_day_change = (time_loc_sol / 3.0) * 45
+    for j, i in enumerate((lon >= lon_day_change) * (lon <= lon_day_change + 90)):
+        if i:
+            weights_lon[:, j] = np.roll(weights_lon[:, j], 8)
+    for j, i in enumerate(lon.tolist()):
+        if i in range(-180, 180, 45):
+            weights_lon[:, j] = np.roll(weights_lon[:, j], -1)
+
+    weights = np.tile(weights_lon.reshape(24, 1, len(lon)), (data.shape[1], 1))
+    weights_lp = weights[:, land_indexes[0], land_indexes[1]]
+    var_3h = data[:, land_indexes[0], land_indexes[1]]
+    varday = []
+    for i in range(0, len(var_3h) - 16, 8):
+        varday.append(np.sum(var_3h[i:i + 24, :] * weights_lp, axis=0))
+    return np.array(varday)
+
+
+class TestLocalTime(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.data = (20 + 10 * rs.rand(8 * 30, 6, 48)).astype('f4')
+        mask = np.zeros(self.data.shape, dtype=bool)
+        mask[:, :2, :] = True
+        mask |= rs.rand(*self.data.shape) < 0.02
+        self.data = np.ma.masked_array(self.data, mask)
+
+    def test_sample_local_time(self):
+        import local_time as lt
+        land_indexes = np.where(np.ones(self.data.shape[1:], dtype=bool))
+        for lon in [np.arange(0, 360, 7.5, dtype='f4'),
+                    np.arange(-180, 180, 7.5, dtype='f4') + 3.75]:
+            for data_start_time in [3., 1.5]:
+                steps = lt.local_time_steps(lon, 6.0, data_start_time)
+                daily = lt.sample_local_time(self.data, steps, *land_indexes)
+                self.assertTrue(np.array_equal(
+                    daily, reference_daily(self.data, lon, data_start_time, land_indexes)))
+
+    def test_monthly_climatology_of_days(self):
+        from climatology import monthly_climatology_of_days
+        days_permonth = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+        rs = np.random.RandomState(1)
+        data = np.ma.masked_greater(rs.rand(2 * 365, 5), 0.9)
+        result = monthly_climatology_of_days(data, days_permonth)
+        by_day = data.reshape(2, 365, 5)
+        start = 0
+        for month, days in enumerate(days_permonth):
+            expected = np.mean(np.mean(by_day[:, start:start + days], axis=0), axis=0)
+            self.assertTrue(np.allclose(result[month], expected, rtol=1e-12))
+            start += days
+
+
+if __name__ == "__main__":
+    unittest.main()
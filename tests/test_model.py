@@ -31,6 +31,18 @@ class Test(unittest.TestCase):
         M = Model('modelname', 'diagname')
         self.assertEqual(M.get_model_line(), 'modelname')
 
+    def test_model_get_facets(self):
+        from interface_scripts.model import Model
+        M = Model('CMIP5 M Amon historical r1i1p1 2000 2004 /data/M', [], False)
+        names = ['project', 'name', 'mip', 'experiment', 'ensemble',
+                 'start_year', 'end_year', 'dir']
+        self.assertEqual(M.get_facets(names)['dir'], '/data/M')
+        self.assertRaises(ValueError, M.get_facets, names + ['realm'])
+        try:
+            M.get_facets(names + ['realm'])
+        except ValueError as e:
+            self.assertTrue('CMIP5 M Amon historical' in str(e))
+
 if __name__ == "__main__":
     unittest.main()
 
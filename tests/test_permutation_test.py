@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import random
+
+import unittest
+
+import numpy as np
+
+
+def reference_p_val(events, non_events, shuffle_times, shuffle):
+    """ p_value as done by get_p_val of sm_pr_diag_nml.py before, shuffle
+        permutes the list of all values in place """
+    delta = np.mean(events) - np.mean(non_events)
+    all_ev_nev = list(events) + list(non_events)
+    sdeltas = []
+    for i in range(0, shuffle_times):
+        shuffle(all_ev_nev)
+        sev = all_ev_nev[0:len(events)]
+        snev = all_ev_nev[len(events)::]
+        sdeltas.append(np.mean(sev) - np.mean(snev))
+    sdeltas.sort()
+    closet_val = min(sdeltas, key=lambda x: abs(x - delta))
+    return sdeltas.index(closet_val) / float(shuffle_times)
+
+
+class TestPermutationTest(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.boxes = {}
+        for x in xrange(3):
+            for y in xrange(2):
+                n_events = 10 if (x, y) == (2, 1) else 30
+                self.boxes[x, y] = [(rs.normal(0., 1., 40), rs.normal(0.3 * x, 1., n_events)),
+                                    (rs.normal(0., 1., 25), rs.normal(0.3 * x, 1., 10))]
+
+    def test_random_subsets(self):
+        from permutation_test import random_subsets
+        rs = np.random.RandomState(1)
+        # Floyd's algorithm, its complement and the argsort
+        for n, k in [(50, 10), (50, 45), (50, 50), (400, 200)]:
+            subsets = random_subsets(n, k, 2000, rs)
+            self.assertEqual(subsets.shape, (2000, k))
+            self.assertTrue(((subsets >= 0) & (subsets < n)).all())
+            self.assertTrue((np.sort(subsets, axis=1)[:, 1:]
+                             != np.sort(subsets, axis=1)[:, :-1]).all())
+            # Each value is in about k / n of the subsets
+            counts = np.bincount(subsets.ravel(), minlength=n)
+            expected = 2000. * k / n
+            self.assertTrue(np.abs(counts - expected).max()
+                            <= 5 * np.sqrt(expected * (1. - float(k) / n)) + 1e-9)
+
+    def test_permutation_p_val(self):
+        from permutation_test import permutation_p_val, random_subsets
+        rs = np.random.RandomState(2)
+        events = rs.normal(0.2, 1., 30)
+        non_events = rs.normal(0., 1., 60)
+
+        # The rank search of the brute-force shuffle, on the same permutations
+        subsets = random_subsets(90, 30, 500, np.random.RandomState(3))
+        permutations = iter([np.concatenate((subset, np.setdiff1d(np.arange(90), subset)))
+                             for subset in subsets])
+        all_values = np.concatenate((events, non_events))
+
+        def shuffle(values):
+            values[:] = all_values[next(permutations)].tolist()
+        self.assertAlmostEqual(permutation_p_val(events, non_events, 500,
+                                                 np.random.RandomState(3)),
+                               reference_p_val(events, non_events, 500, shuffle))
+
+        # Against random.shuffle only up to the Monte Carlo noise
+        random.seed(4)
+        p_val = permutation_p_val(events, non_events, 4000, np.random.RandomState(4))
+        self.assertTrue(abs(p_val - reference_p_val(events, non_events, 4000,
+                                                    random.shuffle)) < 0.05)
+
+    def test_get_p_val_processes(self):
+        from permutation_test import get_p_val
+        xs, ys, serial = get_p_val(self.boxes, shuffle_times=200, processes=1)
+        self.assertEqual(xs.tolist(), [0, 1, 2])
+        self.assertEqual(ys.tolist(), [0, 1])
+        self.assertEqual(serial[-1], -999.)
+        self.assertTrue(all([0. <= p_val <= 1. for p_val in serial[:-1]]))
+        xs, ys, parallel = get_p_val(self.boxes, shuffle_times=200, processes=3)
+        self.assertEqual(parallel, serial)
+        xs, ys, other_seed = get_p_val(self.boxes, shuffle_times=200, seed=1)
+        self.assertNotEqual(other_seed, serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,8 @@ Tests are implemented using *assert* statements
 import sys
 import os
 import glob
+import shutil
+import tempfile
 
 import unittest
 
@@ -36,6 +38,50 @@ class Test(unittest.TestCase):
         P = CMIP5()
         self.assertEqual(P.basename, 'CMIP5')
 
+    def test_select_infiles(self):
+        from interface_scripts.projects import select_infiles
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for years in ['185001-189912', '190001-194912', '195001-199912',
+                          '200001-200512']:
+                open(os.path.join(tmpdir, 'ta_Amon_M_historical_r1i1p1_'
+                                  + years + '.nc'), 'w').close()
+            pattern = os.path.join(tmpdir, 'ta_Amon_M_historical_r1i1p1*.nc')
+            selected = [os.path.basename(f) for f in select_infiles(pattern, 1949, 1960)]
+            self.assertEqual(selected, ['ta_Amon_M_historical_r1i1p1_190001-194912.nc',
+                                        'ta_Amon_M_historical_r1i1p1_195001-199912.nc'])
+            self.assertEqual(len(select_infiles(pattern, 0, 0)), 4)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_model_sections_cached(self):
+        from interface_scripts.model import Model
+        os.environ['__ESMValTool_base_var'] = 'ta'
+        M = Model('CMIP5_ETHZ M Amon historical r1i1p1 2000 2004 /data/${VARIABLE}/M',
+                  [], False)
+        P = M.get_project()
+        self.assertTrue(M.get_project() is P)
+        self.assertEqual(P.__class__.__name__, 'CMIP5_ETHZ')
+        msd = P.get_model_sections(M)
+        self.assertEqual(msd['dir'], '/data/ta/M')
+        msd['mip'] = 'day'
+        self.assertEqual(P.get_model_subsection(M, 'mip'), 'Amon')
+        self.assertEqual(P.get_model_sections(M)['dir'], '/data/ta/M')
+
+    def test_base_var_scope(self):
+        from interface_scripts.model import Model
+        from interface_scripts.projects import base_var_scope
+        os.environ['__ESMValTool_base_var'] = 'ta'
+        M = Model('CMIP5_ETHZ M Amon historical r1i1p1 2000 2004 /data/${VARIABLE}/M',
+                  [], False)
+        P = M.get_project()
+        with base_var_scope('pr'):
+            self.assertEqual(P.get_model_sections(M)['dir'], '/data/pr/M')
+            with base_var_scope(None):
+                self.assertEqual(P.get_model_sections(M)['dir'], '/data/ta/M')
+        self.assertEqual(P.get_model_sections(M)['dir'], '/data/ta/M')
+        self.assertEqual(os.environ['__ESMValTool_base_var'], 'ta')
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+
+import unittest
+import tempfile
+
+
+class TestReformatCache(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.climo_dir = os.path.join(self.tmpdir, 'climo')
+        self.infile = os.path.join(self.tmpdir, 'ta_Amon_MA_historical_r1i1p1_200001-200412.nc')
+        with open(self.infile, 'w') as f:
+            f.write('input')
+
+        from interface_scripts.reformat import Reformat_job
+        runtime = {'model': 'MA', 'project': 'CMIP5', 'project_basename': 'CMIP5'}
+        temporary = {'outfile_fullpath': os.path.join(self.climo_dir, 'CMIP5', 'MA_ta.nc'),
+                     'infile_path': os.path.join(self.tmpdir, 'ta_*.nc'),
+                     'areafile_path': False,
+                     'start_year': '2000',
+                     'end_year': '2004',
+                     'variable': 'ta',
+                     'field': 'T3M'}
+        self.job = Reformat_job('reformat_scripts/default/reformat_default_main.ncl',
+                                runtime, temporary, 'ta')
+        os.makedirs(os.path.dirname(self.job.get_outfile()))
+        with open(self.job.get_outfile(), 'w') as f:
+            f.write('output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_reformat_cache_valid(self):
+        from interface_scripts.reformat_cache import Reformat_cache
+        cache = Reformat_cache(self.climo_dir)
+        assert not cache.is_valid(self.job)
+        cache.update(self.job)
+        assert cache.is_valid(self.job)
+        assert cache.get_status() == [(os.path.join('CMIP5', 'MA_ta.nc'), 'valid')]
+
+    def test_reformat_cache_stale_input(self):
+        from interface_scripts.reformat_cache import Reformat_cache
+        cache = Reformat_cache(self.climo_dir)
+        cache.update(self.job)
+        mtime = os.stat(self.infile).st_mtime
+        os.utime(self.infile, (mtime + 60, mtime + 60))
+        assert not cache.is_valid(self.job)
+        assert cache.get_status()[0][1] == 'stale'
+        assert cache.evict() == [os.path.join('CMIP5', 'MA_ta.nc')]
+        assert not os.path.isfile(self.job.get_outfile())
+        assert cache.get_status() == []
+
+    def test_reformat_cache_changed_time_range(self):
+        from interface_scripts.reformat_cache import Reformat_cache
+        cache = Reformat_cache(self.climo_dir)
+        cache.update(self.job)
+        self.job.temporary['end_year'] = '2005'
+        assert not cache.is_valid(self.job)
+
+    def test_reformat_cache_infile_pattern(self):
+        from interface_scripts.reformat_cache import Reformat_cache
+        other = os.path.join(self.tmpdir, 'ta_Amon_MA_historical_r1i1p1_190001-190412.nc')
+        with open(other, 'w') as f:
+            f.write('input')
+        self.job.temporary['infile_path'] = self.infile
+        self.job.infile_pattern = os.path.join(self.tmpdir, 'ta_*.nc')
+        cache = Reformat_cache(self.climo_dir)
+        cache.update(self.job)
+
+        # Files outside the selection are not looked at...
+        mtime = os.stat(other).st_mtime
+        os.utime(other, (mtime + 60, mtime + 60))
+        assert cache.is_valid(self.job)
+
+        # ...neither are new files of other years...
+        open(os.path.join(self.tmpdir, 'ta_Amon_MA_historical_r1i1p1_200501-200912.nc'),
+             'w').close()
+        assert cache.is_valid(self.job)
+
+        # ...but a new file in the time range invalidates
+        open(os.path.join(self.tmpdir, 'ta_Amon_MA_historical_r1i1p1_200301-200312.nc'),
+             'w').close()
+        assert not cache.is_valid(self.job)
+
+
+if __name__ == "__main__":
+    unittest.main()
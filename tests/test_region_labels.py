@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+
+import unittest
+import tempfile
+
+import numpy as np
+
+
+def point_in_poly(x, y, poly):
+    """ ray casting test of a single point """
+    c = False
+    j = len(poly) - 1
+    for i in range(len(poly)):
+        if ((poly[i][1] > y) != (poly[j][1] > y)) and \
+                (x < (poly[j][0] - poly[i][0]) * (y - poly[i][1]) /
+                 (poly[j][1] - poly[i][1]) + poly[i][0]):
+            c = not c
+        j = i
+    return c
+
+
+class TestRegionLabels(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        self.tmpdir = tempfile.mkdtemp()
+        lon, lat = np.meshgrid(np.arange(0, 360, 5.), np.arange(-87.5, 90, 5.))
+        self.lon = lon
+        self.lat = lat
+        # a region with a hole and a region overlapping it, crossing the
+        # dateline
+        outer = np.array([[-40., -30.], [60., -35.], [55., 45.], [-35., 40.]])
+        hole = np.array([[0., 0.], [20., 0.], [20., 20.]])
+        east = np.array([[40., -10.], [200., -10.], [200., 10.], [40., 10.]])
+        self.polygons = [[outer, hole], [east]]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rasterize(self):
+        import region_labels
+        labels = region_labels.rasterize(self.polygons, self.lon, self.lat)
+        self.assertEqual(labels.shape, (2,) + self.lon.shape)
+        for region, rings in enumerate(self.polygons):
+            inside = (labels == region).any(axis=0)
+            for (y, x), value in np.ndenumerate(inside):
+                lon = self.lon[y, x] if self.lon[y, x] < 180 else self.lon[y, x] - 360
+                expected = sum([point_in_poly(lon, self.lat[y, x], ring)
+                                for ring in rings]) % 2 == 1
+                self.assertEqual(value, expected)
+        self.assertTrue(((labels[0] == 0) & (labels[1] == 1)).any())
+
+        masks = [~(labels == region).any(axis=0) for region in range(2)]
+        self.assertTrue(np.array_equal(region_labels.from_masks(masks), labels))
+
+    def test_cache(self):
+        import region_labels
+        cache_dir = os.path.join(self.tmpdir, 'regions')
+        labels = region_labels.labels(self.polygons, self.lon, self.lat, cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        cached = region_labels.labels(self.polygons, self.lon, self.lat, cache_dir)
+        self.assertTrue(np.array_equal(cached, labels))
+        region_labels.labels(self.polygons[:1], self.lon, self.lat, cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_statistics(self):
+        import region_labels
+        labels = region_labels.rasterize(self.polygons, self.lon, self.lat)
+        data = np.ma.masked_greater(np.cos(np.deg2rad(self.lat)) * self.lon, 300.)
+        weights = np.cos(np.deg2rad(self.lat))
+        stats = region_labels.statistics(data, labels, 3, weights=weights)
+        for region in range(2):
+            values = data[(labels == region).any(axis=0)]
+            w = weights[(labels == region).any(axis=0)][~values.mask]
+            values = values.compressed()
+            mean = np.sum(w * values) / np.sum(w)
+            expected = [values.min(), mean, values.max(),
+                        np.sqrt(np.sum(w * values ** 2) / np.sum(w) - mean ** 2),
+                        len(values)]
+            for result, value in zip(stats, expected):
+                self.assertAlmostEqual(result[region], value, places=10)
+        self.assertEqual(stats[4][2], 0)
+        self.assertTrue(np.isnan(stats[1][2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+
+
+class Variable(object):
+    """ (time, lat, lon) variable read like a netCDF4.Variable """
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.data[index]
+
+
+def reference_region(data, lat_indices, lon_indices):
+    """ The region as an index list per axis """
+    return data[:, lat_indices][:, :, lon_indices]
+
+
+class TestRegionReader(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.data = np.ma.masked_array(rs.rand(7, 10, 12).astype(np.float32),
+                                       rs.rand(7, 10, 12) < 0.1)
+
+    def test_index_pieces(self):
+        from region_reader import index_pieces, take_pieces
+        self.assertEqual(index_pieces(2, 5), [slice(2, 6)])
+        self.assertEqual(index_pieces(10, 1), [slice(10, None), slice(None, 2)])
+        lons = np.arange(12)
+        self.assertEqual(take_pieces(lons, index_pieces(10, 1)).tolist(), [10, 11, 0, 1])
+
+    def test_take_region(self):
+        from region_reader import take_region
+        # Wrapped longitudes and global longitudes with ghost layers
+        for lon_pieces, lon_indices in [
+                ([slice(10, None), slice(None, 3)], [10, 11, 0, 1, 2]),
+                ([slice(-1, None), slice(None), slice(0, 1)],
+                 [11] + range(12) + [0])]:
+            region = take_region(self.data, [slice(2, 5)], lon_pieces)
+            expected = reference_region(self.data, [2, 3, 4], lon_indices)
+            self.assertTrue(np.ma.isMaskedArray(region))
+            self.assertTrue(np.array_equal(region.mask, expected.mask))
+            self.assertTrue(np.array_equal(region.data, expected.data))
+        region = take_region(self.data.data, [slice(8, None), slice(None, 1)],
+                             [slice(3, 4)])
+        self.assertFalse(np.ma.isMaskedArray(region))
+        self.assertTrue(np.array_equal(region, self.data.data[:, [8, 9, 0], 3:4]))
+
+    def test_bounding_piece(self):
+        from region_reader import bounding_piece, take_region
+        lon_pieces = [[slice(4, 8)], [slice(-1, None), slice(None), slice(0, 1)],
+                      [slice(6, 10)]]
+        band, pieces = bounding_piece(lon_pieces, 12)
+        self.assertEqual(band, slice(0, 12))
+        self.assertEqual(pieces[0], [slice(4, 8)])
+        self.assertEqual(pieces[1], [slice(11, 12), slice(0, 12), slice(0, 1)])
+        lat_pieces = [[slice(2, 5)], [slice(3, 7)], [slice(4, 5)]]
+        band, pieces = bounding_piece(lat_pieces, 10)
+        self.assertEqual(band, slice(2, 7))
+        self.assertEqual(pieces, [[slice(0, 3)], [slice(1, 5)], [slice(2, 3)]])
+        # Cutting the regions out of the band gives the regions
+        for region_lats, band_lats in zip(lat_pieces, pieces):
+            self.assertTrue(np.array_equal(
+                take_region(self.data[:, band], band_lats, [slice(None)]),
+                take_region(self.data, region_lats, [slice(None)])))
+
+    def test_read_region(self):
+        from region_reader import read_region, iter_region
+        for lon_pieces, lon_indices in [
+                ([slice(4, 8)], [4, 5, 6, 7]),
+                ([slice(10, None), slice(None, 3)], [10, 11, 0, 1, 2]),
+                ([slice(-1, None), slice(None), slice(0, 1)],
+                 [11] + range(12) + [0])]:
+            variable = Variable(self.data)
+            expected = reference_region(self.data, [2, 3, 4], lon_indices)
+            region = read_region(variable, [slice(2, 5)], lon_pieces)
+            self.assertEqual(region.dtype, np.float32)
+            self.assertTrue(np.array_equal(np.ma.getmaskarray(region), expected.mask))
+            self.assertTrue(np.array_equal(np.ma.getdata(region), expected.data))
+            # One read per piece, only the region
+            self.assertEqual(len(variable.reads), len(lon_pieces))
+
+            blocks = list(iter_region(variable, [slice(2, 5)], lon_pieces, 3))
+            self.assertEqual([time_slice for time_slice, block in blocks],
+                             [slice(0, 3), slice(3, 6), slice(6, 7)])
+            region = np.ma.concatenate([block for time_slice, block in blocks])
+            self.assertTrue(np.array_equal(region.mask, expected.mask))
+            self.assertTrue(np.array_equal(region.data, expected.data))
+
+        # Unmasked variables give plain arrays
+        region = read_region(Variable(self.data.data), [slice(2, 5)],
+                             [slice(10, None), slice(None, 3)])
+        self.assertFalse(np.ma.isMaskedArray(region))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+
+def reference_bilinear(data, lats, lons, target_lats, target_lons):
+    """ Bilinear interpolation of an ascending grid, border values outside """
+    interpolator = RegularGridInterpolator((lats, lons), data, method='linear')
+    grid_lats, grid_lons = np.meshgrid(np.clip(target_lats, lats[0], lats[-1]),
+                                       np.clip(target_lons, lons[0], lons[-1]),
+                                       indexing='ij')
+    return interpolator(np.dstack((grid_lats, grid_lons)))
+
+
+class TestRegrid(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(0)
+        self.lats = np.linspace(-87.5, 87.5, 15)
+        self.lons = np.arange(0., 360., 15.)
+        self.data = rs.rand(3, len(self.lats), len(self.lons))
+        self.target_lats = np.linspace(-90., 90., 37)
+        self.target_lons = np.arange(-5., 360., 10.)
+
+    def test_regrid(self):
+        from regrid import regrid
+        result = regrid(self.data, self.lats, self.lons,
+                        self.target_lats, self.target_lons)
+        self.assertEqual(result.shape, (3, 37, 37))
+        for step in xrange(3):
+            self.assertTrue(np.allclose(result[step],
+                                        reference_bilinear(self.data[step],
+                                                           self.lats, self.lons,
+                                                           self.target_lats,
+                                                           self.target_lons),
+                                        rtol=1e-12))
+        self.assertTrue(regrid(self.data, self.lats, self.lons,
+                               self.lats, self.lons) is self.data)
+
+    def test_regrid_descending_lats(self):
+        from regrid import regrid
+        expected = regrid(self.data, self.lats, self.lons,
+                          self.target_lats, self.target_lons)
+        result = regrid(self.data[:, ::-1], self.lats[::-1], self.lons,
+                        self.target_lats, self.target_lons)
+        self.assertTrue(np.allclose(result, expected, rtol=1e-12))
+        result = regrid(self.data, self.lats, self.lons,
+                        self.target_lats[::-1], self.target_lons)
+        self.assertTrue(np.allclose(result, expected[:, ::-1], rtol=1e-12))
+
+    def test_regrid_masked(self):
+        from regrid import regrid
+        data = np.ma.masked_array(self.data)
+        data[0, 7, 2] = np.ma.masked
+        data[1, 7:9, 2:4] = np.ma.masked
+        target_lats = np.array([self.lats[7] + 3.])
+        target_lons = np.array([self.lons[2] + 5.])
+        result = regrid(data, self.lats, self.lons, target_lats, target_lons)
+        self.assertTrue(np.ma.isMaskedArray(result))
+
+        # The masked neighbour is left out, the other weights renormalized
+        lat_fraction = 3. / (self.lats[8] - self.lats[7])
+        lon_fraction = 5. / 15.
+        neighbours = [(7, 3, (1 - lat_fraction) * lon_fraction),
+                      (8, 2, lat_fraction * (1 - lon_fraction)),
+                      (8, 3, lat_fraction * lon_fraction)]
+        expected = sum([w * self.data[0, i, j] for i, j, w in neighbours]) \
+            / sum([w for i, j, w in neighbours])
+        self.assertTrue(np.allclose(result[0, 0, 0], expected, rtol=1e-12))
+
+        # All neighbours masked: the nearest source point (masked)
+        self.assertTrue(result.mask[1, 0, 0])
+
+        # Unmasked time steps are plain bilinear
+        self.assertTrue(np.allclose(result[2], reference_bilinear(self.data[2],
+                                    self.lats, self.lons, target_lats, target_lons),
+                                    rtol=1e-12))
+
+
+if __name__ == "__main__":
+    unittest.main()
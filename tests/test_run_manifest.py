@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+import unittest
+
+
+class TestRunManifest(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.attributes = [(u'ESMValTool_verbosity', '1'),
+                           ('ESMValTool_plot_dir', u'./plots/\xe9')]
+        self.arrays = [('models_name', [u'MPI-ESM-LR', 'ERA-Interim', '']),
+                       ('max_data_filesize', [100]),
+                       ('write_netcdf', [True, False]),
+                       ('infiles_prefix', []),
+                       ('currdiag', [None])]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, content):
+        from interface_scripts.run_manifest import run_manifest_name
+        fmanifest = open(os.path.join(self.tmpdir, run_manifest_name), 'wb')
+        fmanifest.write(content)
+        fmanifest.close()
+
+    def test_round_trip(self):
+        from interface_scripts.run_manifest import encode_run_manifest, read_run_manifest
+        self.assertEqual(read_run_manifest(self.tmpdir), None)
+        self.write(encode_run_manifest(self.attributes, self.arrays))
+        manifest = read_run_manifest(self.tmpdir)
+        self.assertEqual(manifest['version'], 1)
+        self.assertEqual(manifest['environment'],
+                         {'ESMValTool_verbosity': '1',
+                          'ESMValTool_plot_dir': './plots/\xc3\xa9'})
+        # Empty arrays are left out
+        self.assertEqual(manifest['interface'],
+                         {'models_name': ['MPI-ESM-LR', 'ERA-Interim', ''],
+                          'max_data_filesize': [100],
+                          'write_netcdf': [True, False],
+                          'currdiag': ['None']})
+
+    def test_netcdf_layout(self):
+        from interface_scripts.run_manifest import encode_run_manifest, ManifestReader
+        attributes, variables = ManifestReader(
+            encode_run_manifest(self.attributes, self.arrays)).read()
+        self.assertEqual(attributes['run_manifest_version'], 1)
+        # Strings/logicals as (n, strlen) characters
+        var_attributes, shape, values = variables['models_name']
+        self.assertEqual(var_attributes, {'type': 'string'})
+        self.assertEqual(shape, [3, 11])
+        self.assertEqual(values, 'MPI-ESM-LR\0ERA-Interim\0\0\0\0\0\0\0\0\0\0\0')
+        self.assertEqual(variables['write_netcdf'][:2], ({'type': 'logical'}, [2, 5]))
+        self.assertEqual(variables['max_data_filesize'], ({'type': 'integer'}, [1], [100]))
+
+        try:
+            from scipy.io import netcdf
+        except ImportError:
+            return
+        self.write(encode_run_manifest(self.attributes, self.arrays))
+        ncfile = netcdf.netcdf_file(os.path.join(self.tmpdir, 'run_manifest.nc'),
+                                    'r', mmap=False)
+        self.assertEqual(ncfile.ESMValTool_verbosity, '1')
+        self.assertEqual(ncfile.variables['max_data_filesize'][:].tolist(), [100])
+        self.assertEqual(ncfile.variables['models_name'].dimensions,
+                         ('n_models_name', 'strlen_models_name'))
+        ncfile.close()
+
+    def test_version(self):
+        import interface_scripts.run_manifest as run_manifest
+        content = run_manifest.encode_run_manifest([], [])
+        version = run_manifest.run_manifest_version
+        try:
+            run_manifest.run_manifest_version = version + 1
+            self.write(content)
+            self.assertEqual(run_manifest.read_run_manifest(self.tmpdir), None)
+        finally:
+            run_manifest.run_manifest_version = version
+
+    def test_write_run_manifest(self):
+        from interface_scripts.data_interface import Data_interface, ESMValTool_interface
+        from interface_scripts.run_manifest import read_run_manifest
+        currInterface = Data_interface.__new__(Data_interface)
+        currInterface.interface = ESMValTool_interface()
+        currInterface.interface.models_name = ['M1', 'M2']
+        currInterface.interface.variables = ['ta']
+        currInterface.write_run_manifest({'ESMValTool_verbosity': '2'}, self.tmpdir)
+        manifest = read_run_manifest(self.tmpdir)
+        self.assertEqual(manifest['environment'], {'ESMValTool_verbosity': '2'})
+        # The bookkeeping lists of the interface are left out
+        self.assertEqual(manifest['interface'],
+                         {'models_name': ['M1', 'M2'], 'variables': ['ta']})
+
+    def test_loaders(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        # The loaders are static, nothing is left to render
+        for loader in ['ncl_interface_templates/ncl.interface',
+                       'r_interface_templates/r.interface']:
+            content = open(os.path.join(esmval_path, 'interface_data', loader)).read()
+            self.assertFalse('<<' in content.replace('"<<<<<<<<', ''))
+            self.assertTrue('run_manifest.nc' in content)
+
+
+if __name__ == "__main__":
+    unittest.main()
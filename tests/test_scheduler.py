@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+import StringIO
+
+import unittest
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.infile = os.path.join(self.tmpdir, 'ta_Amon_M_historical_r1i1p1_200001-200412.nc')
+        open(self.infile, 'w').close()
+
+        from interface_scripts.scheduler import Task, Task_graph
+        self.task_graph = Task_graph()
+        self.task_graph.add(Task('reformat', None, [], 'reformat M', False,
+                                 inputs=[self.infile]))
+        self.task_graph.add(Task('diag', None, ['reformat'], 'diag_script D', True,
+                                 inputs=[os.path.join(self.tmpdir, 'D.ncl')]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_describe_task_graph(self):
+        from interface_scripts.scheduler import describe_task_graph
+        self.assertEqual(describe_task_graph(self.task_graph),
+                         ['   1  reformat M', '   2  diag_script D  (after 1)'])
+
+    def test_check_task_graph(self):
+        from interface_scripts.scheduler import check_task_graph
+        errors = check_task_graph(self.task_graph)
+        self.assertEqual(errors, ['diag_script D: missing input '
+                                  + os.path.join(self.tmpdir, 'D.ncl')])
+
+    def stub_graph(self, actions):
+        """ Task graph of stub actions: (key, deps, in_main_thread) """
+        from interface_scripts.scheduler import Task, Task_graph
+        task_graph = Task_graph()
+        for key, deps, in_main_thread in actions:
+            task_graph.add(Task(key, self.stub_action(key), deps, key,
+                                in_main_thread))
+        return task_graph
+
+    def stub_action(self, key):
+        def action():
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(0.05)
+            with self.lock:
+                self.running -= 1
+                self.executed.append(key)
+            if key in self.failing:
+                raise RuntimeError(key + ' failed')
+        return action
+
+    def run_stub_graph(self, task_graph, max_jobs):
+        from interface_scripts.scheduler import run_task_graph
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.executed = []
+        run_task_graph(task_graph, {'GLOBAL': {'verbosity': 0}}, max_jobs)
+
+    def test_run_task_graph_concurrency(self):
+        self.failing = []
+        task_graph = self.stub_graph([('reformat A', [], False),
+                                      ('reformat B', [], False),
+                                      ('reformat C', [], False),
+                                      ('diag 1', ['reformat A', 'reformat B'], True),
+                                      ('diag 2', ['diag 1', 'reformat C'], True)])
+        self.run_stub_graph(task_graph, 2)
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(sorted(self.executed[:2]), ['reformat A', 'reformat B'])
+        self.assertEqual(self.executed[-1], 'diag 2')
+        self.assertEqual(len(self.executed), 5)
+
+        self.run_stub_graph(task_graph, 1)
+        self.assertEqual(self.max_running, 1)
+        self.assertEqual(self.executed, ['reformat A', 'reformat B', 'reformat C',
+                                         'diag 1', 'diag 2'])
+
+    def test_run_task_graph_failure(self):
+        self.failing = ['reformat A']
+        task_graph = self.stub_graph([('reformat A', [], False),
+                                      ('reformat B', [], False),
+                                      ('diag 1', ['reformat A'], True),
+                                      ('reformat C', [], False)])
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            self.assertRaises(RuntimeError, self.run_stub_graph, task_graph, 1)
+        finally:
+            sys.stderr = stderr
+        # No new tasks are started after the first failure
+        self.assertEqual(self.executed, ['reformat A'])
+
+    def test_run_task_graph_duplicate_keys(self):
+        self.failing = []
+        task_graph = self.stub_graph([('reformat A', [], False),
+                                      ('reformat A', [], False),
+                                      ('diag 1', ['reformat A'], True)])
+        self.assertEqual(len(task_graph), 2)
+        self.run_stub_graph(task_graph, 2)
+        self.assertEqual(self.executed, ['reformat A', 'diag 1'])
+
+    def test_run_task_graph_max_jobs(self):
+        self.failing = []
+        task_graph = self.stub_graph([('reformat A', [], False)])
+        self.assertRaises(ValueError, self.run_stub_graph, task_graph, 0)
+        self.assertEqual(self.executed, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
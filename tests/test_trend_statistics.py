@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+
+import numpy as np
+from scipy import stats
+
+
+class TestTrendStatistics(unittest.TestCase):
+
+    def setUp(self):
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, 'diag_scripts', 'lib', 'python'))
+
+        rs = np.random.RandomState(1)
+        self.x = np.ma.array(rs.rand(40, 6))
+        self.y = np.ma.array(rs.rand(40, 6))
+        # ties, a short series (exact p-value), masked values and a
+        # pixel without values
+        self.x[:, 1] = np.round(self.x[:, 1] * 5)
+        self.y[:, 2] = np.round(self.y[:, 2] * 3)
+        self.x[10:, 3] = np.ma.masked
+        self.y[::7, 4] = np.ma.masked
+        self.x[:, 5] = np.ma.masked
+
+    def test_kendall_tau(self):
+        import trend_statistics
+        tau, pval = trend_statistics.kendall_tau(self.x, self.y, processes=1,
+                                                 block_size=4)
+        for pixel in range(5):
+            valid = ~(self.x.mask[:, pixel] | self.y.mask[:, pixel])
+            expected = stats.kendalltau(self.x.data[valid, pixel],
+                                        self.y.data[valid, pixel])
+            self.assertAlmostEqual(tau[pixel], expected[0], places=12)
+            self.assertAlmostEqual(pval[pixel], expected[1], places=12)
+        self.assertTrue(np.isnan(tau[5]) and np.isnan(pval[5]))
+
+    def test_linear_trend(self):
+        import trend_statistics
+        days = np.arange(40) * 30.4
+        results = trend_statistics.linear_trend(days, self.y, processes=1)
+        for pixel in range(5):
+            valid = ~self.y.mask[:, pixel]
+            expected = stats.linregress(days[valid], self.y.data[valid, pixel])
+            for result, value in zip(results, expected[:4]):
+                self.assertAlmostEqual(result[pixel], value, places=10)
+
+    def test_serial_default(self):
+        import multiprocessing
+        import trend_statistics
+
+        def no_pool(*args):
+            raise AssertionError("worker pool started")
+        pool = multiprocessing.Pool
+        multiprocessing.Pool = no_pool
+        try:
+            tau, pval = trend_statistics.kendall_tau(self.x, self.y, block_size=2)
+            results = trend_statistics.linear_trend(np.arange(40.), self.y,
+                                                    block_size=2)
+        finally:
+            multiprocessing.Pool = pool
+        self.assertEqual(tau.shape, (6,))
+        self.assertEqual(results[0].shape, (6,))
+
+
+if __name__ == "__main__":
+    unittest.main()
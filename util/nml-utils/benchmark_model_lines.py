@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+# Micro-benchmark of the model line lookups (project class instance and
+# model sections per model and variable) on a namelist with many models.
+# Compares re-parsing the line/re-instantiating the project class per
+# lookup with the parsed record cached in the Model instances.
+#
+# This scripts requires the "projects"-module so make sure
+# it is executed from the correct path (ESMValTool root)
+
+import os
+import re
+import timeit
+
+from argparse import ArgumentParser
+
+import sys
+sys.path.append("./interface_scripts")
+import projects
+from model import Model
+
+
+def get_model_sections_uncached(model):
+    """ @brief Model sections as computed before they were cached
+    """
+    currProject = getattr(projects, model.model_line.split()[0])()
+    model_sections = [model.model_line.split()[currProject.model_specifiers.index(modelpart)]
+                      for modelpart in currProject.model_specifiers]
+    model_sect_dict = dict(zip(currProject.model_specifiers, model_sections))
+    if re.search("\$\{VARIABLE\}", model_sect_dict['dir']) is not None:
+        model_sect_dict['dir'] = re.sub("\$\{VARIABLE\}",
+                                        os.environ['__ESMValTool_base_var'],
+                                        model_sect_dict['dir'])
+    return model_sect_dict
+
+
+def get_model_sections_cached(model):
+    return model.get_project().get_model_sections(model)
+
+
+def run(get_model_sections, models, no_variables, no_lookups):
+    for variable in range(no_variables):
+        for model in models:
+            for lookup in range(no_lookups):
+                get_model_sections(model)
+
+
+def main():
+    parser = ArgumentParser(description="Time the model line lookups")
+    parser.add_argument('-m', '--models', type=int, default=100,
+                        help="Number of <model> lines")
+    parser.add_argument('-v', '--variables', type=int, default=10,
+                        help="Number of variables per model")
+    parser.add_argument('-l', '--lookups', type=int, default=6,
+                        help="Lookups per model and variable "
+                             "(cmor_reformat does up to six)")
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ['__ESMValTool_base_var'] = 'ta'
+    models = [Model("CMIP5_ETHZ MODEL%03d Amon historical r1i1p1 1980 2004 "
+                    "/data/${VARIABLE}/MODEL%03d" % (i, i), [], False)
+              for i in range(args.models)]
+
+    for name, get_model_sections in [('uncached', get_model_sections_uncached),
+                                      ('cached', get_model_sections_cached)]:
+        seconds = min(timeit.repeat(lambda: run(get_model_sections, models,
+                                                args.variables, args.lookups),
+                                    repeat=args.repeat, number=1))
+        print "%-10s %8.4f s" % (name, seconds)
+
+
+if __name__ == "__main__":
+    main()
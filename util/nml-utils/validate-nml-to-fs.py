@@ -16,6 +16,7 @@ from argparse import ArgumentParser
 
 import sys
 sys.path.append("./interface_scripts")
+import data_catalogue
 import projects
 import reformat
 import xml_parsers
@@ -32,7 +33,7 @@ def get_last_year(infile):
 
 
 def get_year(infile, regex):
-    files = glob.glob(infile)
+    files = data_catalogue.glob(infile)
     years = [regex.search(fil).group(1) for fil in files]
     return years
 
@@ -68,6 +69,7 @@ parser.parse(args.namelist)
 # Project_info is a dictionary with all info from the namelist.
 project_info = Project.project_info
 project_info['RUNTIME'] = {}
+data_catalogue.use_catalogue(project_info)
 verbosity = project_info['GLOBAL']['verbosity'] = 0
 
 if args.validate:
@@ -92,7 +94,7 @@ for currDiag in project_info['DIAGNOSTICS']:
 
     # Prepare/reformat model data for each model
     for model in project_info['MODELS']:
-        currProject = getattr(vars()['projects'], model.split_entries()[0])()
+        currProject = model.get_project()
         model_name = currProject.get_model_name(model)
         project_name = currProject.get_project_name(model)
         project_basename = currProject.get_project_basename()
@@ -122,7 +124,7 @@ for currDiag in project_info['DIAGNOSTICS']:
 
             if args.validate:
                 year_string = ""
-                if len(glob.glob(infile)) != 0:
+                if len(data_catalogue.glob(infile)) != 0:
                     fs_syear = get_first_year(infile)
                     fs_eyear = get_last_year(infile)
 